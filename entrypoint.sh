@@ -1,4 +1,6 @@
 #!/bin/sh
-poetry run python3 manage.py makemigrations --no-input
-poetry run python3 manage.py migrate --no-input
+start=$(date +%s)
+# migrations are generated at development time and committed, only apply the missing ones here
+poetry run python3 manage.py ensure_migrated
+echo "Started in $(($(date +%s) - start)) s"
 exec "$@"
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_extensions.management.jobs import HourlyJob
+
+from friendlyfl.utils import history_util
+
+
+class Job(HourlyJob):
+    help = "Move finished batches of runs to the run archive"
+
+    def execute(self):
+        updated_before = timezone.now() - timedelta(days=settings.RUN_ARCHIVE_AFTER_DAYS)
+        history_util.archive_finished_batches(
+            updated_before, settings.RUN_ARCHIVE_CHUNK_SIZE, settings.RUN_ARCHIVE_MAX_BATCHES)
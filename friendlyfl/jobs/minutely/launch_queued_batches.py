@@ -0,0 +1,10 @@
+from django_extensions.management.jobs import MinutelyJob
+
+from friendlyfl.utils import launch_util
+
+
+class Job(MinutelyJob):
+    help = "Launch the queued batches of projects with free batch slots"
+
+    def execute(self):
+        launch_util.admit_all_queued_launches()
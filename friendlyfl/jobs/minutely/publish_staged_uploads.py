@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django_extensions.management.jobs import MinutelyJob
+
+from friendlyfl.router import upload_pipeline
+from friendlyfl.router.models import UploadJob
+
+
+class Job(MinutelyJob):
+    help = "Publish uploads left staged, e.g. by a restarted server, stalled or failed"
+
+    def execute(self):
+        upload_pipeline.reclaim_jobs()
+        staged_before = timezone.now() - timedelta(minutes=1)
+        job_ids = UploadJob.objects.filter(
+            status=UploadJob.JobStatus.STAGED, created_at__lt=staged_before).values_list('id', flat=True)
+        for job_id in job_ids:
+            upload_pipeline.process_job(job_id)
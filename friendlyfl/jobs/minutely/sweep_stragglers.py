@@ -0,0 +1,10 @@
+from django_extensions.management.jobs import MinutelyJob
+
+from friendlyfl.utils import straggler_util
+
+
+class Job(MinutelyJob):
+    help = "Stop runs past the deadline of their round or of disconnected sites"
+
+    def execute(self):
+        straggler_util.sweep_stragglers()
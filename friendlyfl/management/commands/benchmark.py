@@ -0,0 +1,204 @@
+import copy
+import json
+import os
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from friendlyfl.router.models import Run
+from friendlyfl.router.renderers import MessagePackRenderer
+from friendlyfl.router.serializers import RunSerializer, serialize_runs
+from friendlyfl.utils import bench_util, display_util, file_util
+
+api = '/friendlyfl/api/v1/'
+
+
+class Command(BaseCommand):
+    help = "Benchmark the router's hot endpoints against a freshly seeded test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sites', type=int, default=20)
+        parser.add_argument('--projects', type=int, default=5)
+        parser.add_argument('--batches', type=int, default=400,
+                            help='Batches per project, every site takes part in every batch')
+        parser.add_argument('--iterations', type=int, default=100,
+                            help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--micro-iterations', type=int, default=50)
+        parser.add_argument('--serialize-iterations', type=int, default=5,
+                            help='Iterations serializing every run of a project, sites * batches rows')
+        parser.add_argument('--file-size', type=int, default=1024 * 1024,
+                            help='Size in bytes of the uploaded and downloaded files')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        with bench_util.isolated_environment(options['verbosity'], options['keepdb']):
+            results = self.run_benchmarks(options)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        for group in ['endpoints', 'micro']:
+            for name, summary in results[group].items():
+                self.stdout.write('{:<28} {:>8.1f} req/s  p50 {:>8.2f} ms  p99 {:>8.2f} ms  errors {}'.format(
+                    name, summary['throughput'] or 0, summary['p50_ms'], summary['p99_ms'], summary.get('errors', 0)))
+        self.stdout.write(self.style.SUCCESS(
+            'Results written to {}'.format(options['output'])))
+
+    def run_benchmarks(self, options):
+        start = time.perf_counter()
+        owner, sites, projects = bench_util.seed_federation(
+            options['sites'], options['projects'], options['batches'])
+        seed_time = time.perf_counter() - start
+        client = APIClient()
+        client.force_authenticate(owner)
+
+        project = projects[0]
+        active_runs = list(Run.objects.filter(
+            project=project, batch=project.batch))
+        coordinator_run = [run for run in active_runs if run.role == 'CO'][0]
+        payload = os.urandom(options['file_size'])
+        # background publishing needs concurrent writers, which SQLite does not support
+        inline_uploads = connection.vendor == 'sqlite' or not settings.UPLOAD_PIPELINE_ASYNC
+
+        def measure(name, request, prepare=None):
+            recorder = bench_util.LatencyRecorder()
+            for i in range(options['warmup']):
+                if prepare:
+                    prepare()
+                self.consume(request(-i - 1))
+            elapsed = 0
+            for i in range(options['iterations']):
+                if prepare:
+                    prepare()
+                begin = time.perf_counter()
+                response = request(i)
+                self.consume(response)
+                latency = time.perf_counter() - begin
+                elapsed += latency
+                recorder.record(name, latency, response.status_code < 400)
+            return recorder.summary(elapsed)[name]
+
+        def finish_active_batch():
+            Run.objects.filter(project=projects[-1]).exclude(
+                status__in=[Run.RunStatus.SUCCESS, Run.RunStatus.FAILED]).update(status=Run.RunStatus.SUCCESS)
+
+        def upload(i):
+            return client.post(api + 'runs-action/upload/', {
+                'run': coordinator_run.id, 'task_seq': 1, 'round_seq': i + 100,
+                'artifacts': SimpleUploadedFile('model.bin', payload)}, format='multipart')
+
+        def download(i):
+            return client.get(api + 'runs-action/download/', {
+                'run': coordinator_run.id, 'type': 'artifacts', 'task_seq': 1, 'round_seq': 100})
+
+        endpoints = {
+            'heartbeat': measure('heartbeat', lambda i: client.post(
+                api + 'sites/heartbeat/', {'uid': str(sites[i % len(sites)].uid), 'status': 1}, format='json')),
+            'lookup_runs_by_project_id': measure('lookup_runs_by_project_id', lambda i: client.get(
+                api + 'runs/lookup/', {'project': project.id})),
+            'get_active_runs': measure('get_active_runs', lambda i: client.get(api + 'runs/active/')),
+            'get_runs_details': measure('get_runs_details', lambda i: client.get(
+                api + 'runs/detail/', {'project': project.id, 'batch': project.batch, 'site': sites[0].id})),
+            'bulk_create_runs': measure('bulk_create_runs', lambda i: client.post(
+                api + 'runs', {'project': projects[-1].id}, format='json'), prepare=finish_active_batch),
+        }
+        with override_settings(UPLOAD_PIPELINE_ASYNC=not inline_uploads):
+            endpoints['upload'] = measure('upload', upload)
+        endpoints['download'] = measure('download', download)
+        with override_settings(ARCHIVE_CACHE_MAX_BYTES=0):
+            endpoints['download_uncached'] = measure(
+                'download_uncached', download)
+
+        micro = self.run_micro_benchmarks(project, options['micro_iterations'])
+        micro.update(self.run_serialize_benchmarks(
+            project, options['serialize_iterations']))
+        return {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+                'seed_seconds': seed_time,
+                'inline_uploads': inline_uploads,
+                'options': {key: options[key] for key in ['sites', 'projects', 'batches', 'iterations',
+                                                          'warmup', 'micro_iterations', 'serialize_iterations',
+                                                          'file_size']},
+            },
+            'endpoints': endpoints,
+            'micro': micro,
+        }
+
+    def run_micro_benchmarks(self, project, iterations):
+        runs_data = RunSerializer(
+            Run.objects.filter(project=project), many=True).data
+        runs = list(Run.objects.filter(project=project, batch=project.batch))
+        for run in runs:
+            run.artifacts = [file_util.generate_url(run.id, 1, round_seq) + 'model.bin'
+                             for round_seq in range(1, 51)]
+
+        sort_latencies = []
+        for _ in range(iterations):
+            # sort_runs merges runs in place, give every iteration fresh rows
+            data = copy.deepcopy(runs_data)
+            begin = time.perf_counter()
+            display_util.sort_runs(data)
+            sort_latencies.append(time.perf_counter() - begin)
+
+        url_latencies = []
+        for _ in range(iterations):
+            begin = time.perf_counter()
+            file_util.get_file_urls(runs, 1, 25, 'artifacts')
+            url_latencies.append(time.perf_counter() - begin)
+
+        return {
+            'display_util.sort_runs': bench_util.summarize(sort_latencies),
+            'file_util.get_file_urls': bench_util.summarize(url_latencies),
+        }
+
+    @staticmethod
+    def run_serialize_benchmarks(project, iterations):
+        queryset = Run.objects.filter(project=project)
+        renderer = JSONRenderer()
+        serializers = {
+            'serializers.RunSerializer': lambda: RunSerializer(queryset, many=True).data,
+            'serializers.serialize_runs': lambda: serialize_runs(queryset),
+        }
+        results = {}
+        for name, serialize in serializers.items():
+            latencies = []
+            for _ in range(iterations):
+                begin = time.perf_counter()
+                renderer.render(serialize())
+                latencies.append(time.perf_counter() - begin)
+            results[name] = bench_util.summarize(latencies)
+            results[name]['rows'] = queryset.count()
+
+        data = serialize_runs(queryset)
+        for renderer in [JSONRenderer(), MessagePackRenderer()]:
+            name = 'renderers.{}'.format(type(renderer).__name__)
+            latencies = []
+            for _ in range(iterations):
+                begin = time.perf_counter()
+                content = renderer.render(data)
+                latencies.append(time.perf_counter() - begin)
+            results[name] = bench_util.summarize(latencies)
+            results[name]['bytes'] = len(content)
+        return results
+
+    @staticmethod
+    def consume(response):
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        response.close()
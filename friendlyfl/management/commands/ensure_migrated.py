@@ -0,0 +1,60 @@
+import pkgutil
+import time
+from hashlib import sha256
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+
+def get_migration_names():
+    """
+    List the migrations on disk as (app label, name) without importing them.
+    """
+    names = []
+    for app_config in apps.get_app_configs():
+        module_name, _ = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            module = import_module(module_name)
+        except ModuleNotFoundError:
+            continue
+        if not hasattr(module, '__path__'):
+            continue
+        names += [(app_config.label, name) for _, name, is_pkg in pkgutil.iter_modules(module.__path__)
+                  if not is_pkg and name[0] not in '_~']
+    return sorted(names)
+
+
+def get_state_hash(names):
+    return sha256(repr(names).encode()).hexdigest()[:12]
+
+
+class Command(BaseCommand):
+    help = "Apply migrations only when some on disk are not applied to the database yet"
+
+    # the system checks load every URL conf and model, migrate runs them anyway when it is needed
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        names = get_migration_names()
+        recorder = MigrationRecorder(connections[options['database']])
+        applied = set(recorder.applied_migrations()) if recorder.has_table() else set()
+        pending = [name for name in names if name not in applied]
+        if pending:
+            self.stdout.write('{} migrations to apply, disk state {}'.format(
+                len(pending), get_state_hash(names)))
+            call_command('migrate', database=options['database'], interactive=False,
+                         verbosity=options['verbosity'])
+        else:
+            self.stdout.write('Migrations up to date, state {}'.format(get_state_hash(names)))
+        self.stdout.write('Checked migrations in {:.2f} s'.format(time.perf_counter() - start))
@@ -0,0 +1,119 @@
+import io
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+warm_up_paths = ['/friendlyfl/api/v1/']
+
+
+def warm_up(application):
+    """
+    Load the URL conf, views and serializers, build the middleware chain and check the database
+    before the workers are forked, so that they share it all and their first requests are not slow.
+    """
+    for path in warm_up_paths:
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '8000',
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+        }
+        response = application(environ, lambda status, headers, exc_info=None: None)
+        response.close()
+    for connection in connections.all():
+        connection.ensure_connection()
+    # workers must open their own connections rather than share the socket of the master
+    connections.close_all()
+
+
+def get_worker_connections(threads):
+    """
+    Database connections a worker may hold at once: one per thread serving requests and one per upload pipeline thread.
+    """
+    worker_connections = threads
+    if settings.UPLOAD_PIPELINE_ASYNC:
+        worker_connections += settings.UPLOAD_PIPELINE_WORKERS
+    return worker_connections
+
+
+def get_max_workers(threads):
+    """
+    Most workers whose connections fit in DATABASE_MAX_CONNECTIONS, None if it is not capped.
+    """
+    if settings.DATABASE_MAX_CONNECTIONS <= 0:
+        return None
+    return max(1, settings.DATABASE_MAX_CONNECTIONS // get_worker_connections(threads))
+
+
+class RouterApplication(BaseApplication):
+
+    def __init__(self, options):
+        self.options = options
+        self.started = time.perf_counter()
+        self.load_seconds = None
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('when_ready', self.when_ready)
+
+    def load(self):
+        start = time.perf_counter()
+        application = get_wsgi_application()
+        warm_up(application)
+        self.load_seconds = time.perf_counter() - start
+        return application
+
+    def when_ready(self, server):
+        server.log.info('Ready in %.2f s, app loaded and warmed up in %.2f s',
+                        time.perf_counter() - self.started, self.load_seconds or 0)
+
+
+class Command(BaseCommand):
+    help = "Serve the router with a multi-worker WSGI server for production"
+
+    # the warm up loads the URL conf and models anyway, run `manage.py check --deploy` before releasing instead
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=settings.SERVE_BIND)
+        parser.add_argument('--workers', type=int, default=settings.SERVE_WORKERS)
+        parser.add_argument('--threads', type=int, default=settings.SERVE_THREADS)
+        parser.add_argument('--timeout', type=int, default=settings.SERVE_TIMEOUT)
+        parser.add_argument('--max-requests', type=int, default=settings.SERVE_MAX_REQUESTS)
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        if settings.SERVE_DATA_PLANE_CONCURRENCY > 0:
+            # uploads and downloads, running or queued, never take more threads than these
+            threads += settings.SERVE_DATA_PLANE_CONCURRENCY + settings.SERVE_DATA_PLANE_QUEUE
+        workers = options['workers']
+        max_workers = get_max_workers(threads)
+        if max_workers and workers > max_workers:
+            self.stderr.write('{} workers of {} threads could open {} database connections, over '
+                              'DATABASE_MAX_CONNECTIONS={}: running {} workers'.format(
+                                  workers, threads, workers * get_worker_connections(threads),
+                                  settings.DATABASE_MAX_CONNECTIONS, max_workers))
+            workers = max_workers
+        RouterApplication({
+            'bind': options['bind'],
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            'timeout': options['timeout'],
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests'] // 10,
+            # the app is loaded and warmed up once in the master and shared by the forked workers
+            'preload_app': True,
+            'accesslog': '-',
+        }).run()
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from friendlyfl.router.models import Run
+from friendlyfl.utils import bench_util
+
+api = '/friendlyfl/api/v1/'
+
+
+class VirtualController:
+    """
+    A controller of one site talking to the router through the API.
+    """
+
+    def __init__(self, index, user, recorder, payload, lock):
+        self.name = f'sim-site-{index}'
+        self.uid = str(uuid.uuid4())
+        self.recorder = recorder
+        self.payload = payload
+        self.lock = lock
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # tells the site to the throttles before the body is read
+        self.client.credentials(HTTP_X_SITE_UID=self.uid)
+        self.site_id = None
+        self.run_id = None
+
+    def call(self, name, method, path, data=None, **kwargs):
+        with self.lock:
+            return self.recorder.time(name, getattr(self.client, method), api + path, data, **kwargs)
+
+    def register(self):
+        response = self.call('site_create', 'post', 'sites/', {
+            'name': self.name, 'description': 'simulated site', 'uid': self.uid}, format='json')
+        self.site_id = response.json()['id']
+
+    def join(self, project_name, total_round):
+        tasks = bench_util.gen_tasks(total_round)
+        self.call('project_create_with_participant', 'post', 'projects/', {
+            'name': project_name, 'description': 'simulated project', 'site': self.site_id,
+            'tasks': tasks}, format='json')
+
+    def heartbeat(self):
+        self.call('heartbeat', 'post', 'sites/heartbeat/',
+                  {'uid': self.uid, 'status': 1}, format='json')
+
+    def set_status(self, run_status, **kwargs):
+        return self.call('update_status', 'put', f'runs/{self.run_id}/status/',
+                         {'status': run_status, **kwargs}, format='json')
+
+    def upload(self, round_seq, file_type='artifacts'):
+        response = self.call('upload', 'post', f'runs-action/upload/?run={self.run_id}', {
+            'run': self.run_id, 'task_seq': 1, 'round_seq': round_seq,
+            file_type: SimpleUploadedFile('model.bin', self.payload)}, format='multipart')
+        return [job['id'] for job in response.json()] if response.status_code < 400 else []
+
+    def train(self, round_seq):
+        """
+        Step the run of the site through a round of local training.
+        """
+        self.set_status(Run.RunStatus.PREPARING)
+        self.set_status(Run.RunStatus.RUNNING)
+        job_ids = self.upload(round_seq)
+        self.set_status(Run.RunStatus.PENDING_SUCCESS)
+        return job_ids
+
+    def download(self, round_seq):
+        response = self.call('download', 'get', 'runs-action/download/', {
+            'run': self.run_id, 'type': 'artifacts', 'all_runs': '1', 'task_seq': 1, 'round_seq': round_seq})
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        response.close()
+
+
+class Command(BaseCommand):
+    help = "Simulate a federation of virtual controllers against an in-process router"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--controllers', type=int, default=10)
+        parser.add_argument('--batches', type=int, default=3)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Rounds of the task in every batch')
+        parser.add_argument('--file-size', type=int, default=64 * 1024,
+                            help='Size in bytes of the artifacts uploaded every round')
+        parser.add_argument('--heartbeat-interval', type=float, default=1.0,
+                            help='Seconds between heartbeats of every controller')
+        parser.add_argument('--publish-timeout', type=float, default=60.0,
+                            help='Seconds to wait for uploads to be published')
+        parser.add_argument('--output', default='simulation-results.json')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        if options['controllers'] < 2:
+            raise CommandError('A federation needs at least 2 controllers')
+        with bench_util.isolated_environment(options['verbosity'], options['keepdb']):
+            # background publishing needs concurrent writers, which SQLite does not support
+            with override_settings(UPLOAD_PIPELINE_ASYNC=connection.vendor != 'sqlite'):
+                results = self.simulate(options)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write('{} rounds in {:.1f} s, {:.1f} rounds per minute'.format(
+            results['rounds'], results['elapsed_seconds'], results['rounds_per_minute']))
+        for name, summary in sorted(results['endpoints'].items()):
+            self.stdout.write('{:<32} {:>6} calls  p50 {:>8.2f} ms  p99 {:>8.2f} ms  errors {}'.format(
+                name, summary['count'], summary['p50_ms'], summary['p99_ms'], summary['errors']))
+        self.stdout.write(self.style.SUCCESS(
+            'Results written to {}'.format(options['output'])))
+
+    def simulate(self, options):
+        user, _ = User.objects.get_or_create(username='sim-owner')
+        recorder = bench_util.LatencyRecorder()
+        payload = os.urandom(options['file_size'])
+        # the shared in-memory SQLite test database takes one request at a time
+        lock = threading.Lock() if connection.vendor == 'sqlite' else nullcontext()
+        controllers = [VirtualController(i, user, recorder, payload, lock)
+                       for i in range(options['controllers'])]
+        coordinator = controllers[0]
+        pool = ThreadPoolExecutor(max_workers=len(controllers))
+
+        def run_all(func, items=controllers):
+            # run one step of every controller concurrently, each thread releases its connection
+            def step(item):
+                try:
+                    return func(item)
+                finally:
+                    connection.close()
+
+            return list(pool.map(step, items))
+
+        run_all(VirtualController.register)
+        coordinator.join('sim-project', options['rounds'])
+        run_all(lambda c: c.join('sim-project', options['rounds']), controllers[1:])
+
+        stop = threading.Event()
+
+        def heartbeats(controller):
+            while not stop.wait(options['heartbeat_interval']):
+                controller.heartbeat()
+            connection.close()
+
+        heartbeat_threads = [threading.Thread(target=heartbeats, args=(c,), daemon=True)
+                             for c in controllers]
+        for thread in heartbeat_threads:
+            thread.start()
+
+        project_id = coordinator.call('project_lookup', 'get', 'projects/lookup/',
+                                      {'name': 'sim-project'}).json()['id']
+        rounds = 0
+        start = time.perf_counter()
+        try:
+            for _ in range(options['batches']):
+                response = coordinator.call(
+                    'bulk_create_runs', 'post', 'runs', {'project': project_id}, format='json')
+                if response.status_code >= 400:
+                    raise CommandError('Failed to launch a batch: {}'.format(response.data))
+                runs = coordinator.call('lookup_runs_by_project_id', 'get', 'runs/lookup/',
+                                        {'project': project_id}).json()
+                batch = runs[-1]['batch']
+                details = coordinator.call('get_runs_details', 'get', 'runs/detail/', {
+                    'project': project_id, 'batch': batch, 'site': coordinator.site_id}).json()
+                run_ids = {run['site_uid']: run['id'] for run in details['runs']}
+                for controller in controllers:
+                    controller.run_id = run_ids[controller.uid]
+
+                for round_seq in range(1, options['rounds'] + 1):
+                    job_ids = sum(run_all(lambda c: c.train(round_seq)), [])
+                    self.wait_published(coordinator, job_ids, options['publish_timeout'])
+                    coordinator.call('get_runs_details', 'get', 'runs/detail/', {
+                        'project': project_id, 'batch': batch, 'site': coordinator.site_id})
+                    coordinator.download(round_seq)
+                    coordinator.set_status(Run.RunStatus.PENDING_AGGREGATING)
+                    coordinator.set_status(Run.RunStatus.AGGREGATING)
+                    if round_seq < options['rounds']:
+                        coordinator.set_status(
+                            Run.RunStatus.STANDBY, update_all=True, increase_round=True)
+                    else:
+                        coordinator.set_status(
+                            Run.RunStatus.SUCCESS, update_all=True)
+                    rounds += 1
+        finally:
+            elapsed = time.perf_counter() - start
+            stop.set()
+            for thread in heartbeat_threads:
+                thread.join()
+            pool.shutdown()
+
+        return {
+            'options': {key: options[key] for key in ['controllers', 'batches', 'rounds', 'file_size',
+                                                      'heartbeat_interval']},
+            'database': connection.vendor,
+            'rounds': rounds,
+            'elapsed_seconds': elapsed,
+            'rounds_per_minute': rounds / elapsed * 60 if elapsed else None,
+            'endpoints': recorder.summary(),
+        }
+
+    @staticmethod
+    def wait_published(coordinator, job_ids, timeout):
+        deadline = time.monotonic() + timeout
+        pending = ','.join(str(job_id) for job_id in job_ids)
+        while pending:
+            jobs = coordinator.call('upload_status', 'get', 'runs-action/upload-status/',
+                                    {'job': pending}).json()
+            pending = ','.join(str(job['id'])
+                               for job in jobs if job['status'] in ['Staged', 'Processing'])
+            if pending and time.monotonic() > deadline:
+                raise CommandError('Uploads not published in time: {}'.format(pending))
+            if pending:
+                time.sleep(0.05)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0006_run_cur_seq_alter_run_site_uid_alter_run_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='storage_quota',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_uid', models.UUIDField()),
+                ('batch', models.IntegerField()),
+                ('file_type', models.CharField(choices=[('artifacts', 'artifacts'), ('logs', 'logs'), ('mid_artifacts', 'mid_artifacts')], max_length=16)),
+                ('task_seq', models.IntegerField()),
+                ('round_seq', models.IntegerField()),
+                ('files', models.IntegerField(default=0)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.project')),
+                ('run', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='friendlyfl.run')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['project', 'site_uid'], name='friendlyfl__project_edb7c9_idx')],
+                'unique_together': {('run', 'file_type', 'task_seq', 'round_seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0007_project_storage_quota_storageusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(choices=[('artifacts', 'artifacts'), ('logs', 'logs'), ('mid_artifacts', 'mid_artifacts')], max_length=16)),
+                ('task_seq', models.IntegerField()),
+                ('round_seq', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=512)),
+                ('size', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.IntegerField(choices=[(0, 'Failed'), (1, 'Staged'), (2, 'Processing'), (3, 'Published')], default=1)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(editable=False)),
+                ('updated_at', models.DateTimeField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.run')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='friendlyfl__status_1525d6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0009_run_defaults'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.IntegerField()),
+                ('fields', models.JSONField(default=list)),
+                ('runs', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(editable=False)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.project')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('project', 'batch')},
+            },
+        ),
+    ]
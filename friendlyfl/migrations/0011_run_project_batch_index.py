@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0010_runarchive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['project', 'batch'], name='friendlyfl__project_b5b23b_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0011_run_project_batch_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='round_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RoundDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_uid', models.UUIDField()),
+                ('batch', models.IntegerField()),
+                ('task_seq', models.IntegerField()),
+                ('round_seq', models.IntegerField(null=True)),
+                ('outcome', models.IntegerField(choices=[(0, 'Failed'), (1, 'Success'), (2, 'Timed Out'), (3, 'Disconnected')])),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('seconds', models.FloatField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.project')),
+                ('run', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='friendlyfl.run')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['project', 'site_uid'], name='friendlyfl__project_da2522_idx')],
+            },
+        ),
+    ]
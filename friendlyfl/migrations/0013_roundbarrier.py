@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0012_round_durations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundBarrier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.IntegerField()),
+                ('task_seq', models.IntegerField()),
+                ('round_seq', models.IntegerField()),
+                ('expected', models.IntegerField(default=0)),
+                ('arrived', models.IntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(editable=False)),
+                ('updated_at', models.DateTimeField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.project')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('project', 'batch', 'task_seq', 'round_seq')},
+            },
+        ),
+    ]
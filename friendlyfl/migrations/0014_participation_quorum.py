@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0013_roundbarrier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='min_participant_fraction',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='min_participants',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectparticipant',
+            name='required',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0014_participation_quorum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='max_concurrent_batches',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='BatchLaunch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(0, 'Cancelled'), (1, 'Queued'), (2, 'Launched')], default=1)),
+                ('batch', models.IntegerField(blank=True, null=True)),
+                ('reason', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(editable=False)),
+                ('updated_at', models.DateTimeField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.project')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['project', 'status'], name='friendlyfl__project_42f8ec_idx')],
+            },
+        ),
+    ]
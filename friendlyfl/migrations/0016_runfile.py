@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0015_batch_launches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(choices=[('artifacts', 'artifacts'), ('logs', 'logs'), ('mid_artifacts', 'mid_artifacts')], max_length=16)),
+                ('task_seq', models.IntegerField()),
+                ('round_seq', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=512, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(editable=False)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='friendlyfl.run')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['run', 'task_seq', 'round_seq'], name='friendlyfl__run_id_daf278_idx')],
+            },
+        ),
+    ]
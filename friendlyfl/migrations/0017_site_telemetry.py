@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0016_runfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='telemetry',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
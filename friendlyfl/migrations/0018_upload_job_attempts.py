@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendlyfl', '0017_site_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
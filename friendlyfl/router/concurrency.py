@@ -0,0 +1,108 @@
+import threading
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.http import HttpResponse
+
+# slot of the streamed response the thread is sending, the server closes it before the thread serves another request
+_streaming = threading.local()
+
+
+def data_plane(func):
+    """
+    Mark a view action as a data plane call, limited by DataPlaneLimitMiddleware.
+    """
+    func.data_plane = True
+    return func
+
+
+def is_data_plane(view_func, method):
+    """
+    Whether the view action serving the request is marked as a data plane call.
+    """
+    actions = getattr(view_func, 'actions', None)
+    view_class = getattr(view_func, 'cls', None)
+    if not actions or not view_class:
+        return False
+    handler = getattr(view_class, actions.get(method.lower(), ''), None)
+    return getattr(handler, 'data_plane', False)
+
+
+def release_streamed_slot(**kwargs):
+    release = getattr(_streaming, 'release', None)
+    if release is not None:
+        _streaming.release = None
+        release()
+
+
+class DataPlanePool:
+    """
+    Slots of the data plane calls served at the same time by the process, with a bounded queue of calls waiting
+    for a slot. The threads left are kept for the control plane.
+    """
+
+    def __init__(self, concurrency, queue_size):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.waiting = 0
+
+    def acquire(self, timeout):
+        """
+        Take a slot, waiting at most timeout seconds in the queue. Returns False if the queue is full or the wait
+        timed out.
+        """
+        if self.slots.acquire(blocking=False):
+            return True
+        with self.lock:
+            if self.waiting >= self.queue_size:
+                return False
+            self.waiting += 1
+        try:
+            return self.slots.acquire(timeout=timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def release(self):
+        self.slots.release()
+
+
+class DataPlaneLimitMiddleware:
+    """
+    Serve at most SERVE_DATA_PLANE_CONCURRENCY uploads and downloads, the view actions marked data_plane, at the same
+    time in every server process. SERVE_DATA_PLANE_QUEUE more wait up to SERVE_DATA_PLANE_QUEUE_TIMEOUT seconds for a
+    slot and the others are answered 503, so that large transfers cannot take the threads of heartbeats and status
+    updates. A download holds its slot until the server closes its response, after its file is sent.
+    Not loaded at all if SERVE_DATA_PLANE_CONCURRENCY is 0.
+    """
+
+    def __init__(self, get_response):
+        if settings.SERVE_DATA_PLANE_CONCURRENCY <= 0:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.pool = DataPlanePool(settings.SERVE_DATA_PLANE_CONCURRENCY, settings.SERVE_DATA_PLANE_QUEUE)
+        request_finished.connect(release_streamed_slot, dispatch_uid='release_streamed_slot')
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, 'data_plane_slot', False):
+            if response.streaming:
+                # released once the server closes the response, after the last byte is sent
+                release_streamed_slot()
+                _streaming.release = self.pool.release
+            else:
+                self.pool.release()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not is_data_plane(view_func, request.method):
+            return None
+        if not self.pool.acquire(settings.SERVE_DATA_PLANE_QUEUE_TIMEOUT):
+            response = HttpResponse("Too many uploads and downloads in progress, retry later",
+                                    status=503, content_type='text/plain')
+            response['Retry-After'] = str(max(int(settings.SERVE_DATA_PLANE_QUEUE_TIMEOUT), 1))
+            return response
+        request.data_plane_slot = True
+        return None
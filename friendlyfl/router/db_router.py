@@ -0,0 +1,103 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, DatabaseError
+from rest_framework.permissions import SAFE_METHODS
+
+from friendlyfl.utils.lookup_util import get_site_uid
+
+# replica the reads of the current request go to, None reads from the primary
+replica_alias = ContextVar('replica_alias', default=None)
+
+# replicas failing to connect are skipped until then
+_down_until = {}
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def pick_replica():
+    """
+    Return a replica that accepts connections, None if there is no replica up.
+    """
+    now = time.monotonic()
+    replicas = [alias for alias in get_replicas()
+                if _down_until.get(alias, 0) <= now]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+            return alias
+        except DatabaseError:
+            _down_until[alias] = now + settings.DATABASE_REPLICA_RETRY_SECONDS
+    return None
+
+
+def get_sticky_keys(request, view):
+    """
+    Keys of the stickiness windows of the request: the one of its site if it tells it, and the one of its user.
+    Controllers of all sites may share one account, so a read only falls back to the window of the user when it does
+    not tell its site. Writes are only stuck once answered, their body is read by then.
+    """
+    site_uid = get_site_uid(request, view, body=True)
+    user_key = 'db-sticky:user-{}'.format(request.user.pk)
+    return ['db-sticky:site-{}'.format(site_uid), user_key] if site_uid else [user_key]
+
+
+def is_sticky(request, view):
+    return cache.get(get_sticky_keys(request, view)[0]) is not None
+
+
+def stick(request, view):
+    """
+    Keep the reads of the site on the primary until its writes reached the replicas.
+    """
+    cache.set_many(dict.fromkeys(get_sticky_keys(request, view), 1),
+                   timeout=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica picked for the current request, everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMixin:
+    """
+    Read the actions in replica_actions from a replica, unless the site wrote within the stickiness window.
+    Successful writes other than sticky_exempt_actions start the window.
+    """
+    replica_actions = []
+    sticky_exempt_actions = []
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.replica_token = None
+        if request.method in SAFE_METHODS and getattr(self, 'action', None) in self.replica_actions \
+                and get_replicas() and not is_sticky(request, self):
+            self.replica_token = replica_alias.set(pick_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, 'replica_token', None):
+            replica_alias.reset(self.replica_token)
+            self.replica_token = None
+        if request.method not in SAFE_METHODS and response.status_code < 400 and get_replicas() \
+                and getattr(self, 'action', None) not in self.sticky_exempt_actions:
+            stick(request, self)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -22,6 +22,8 @@ class Site(models.Model):
         'auth.User', default='admin', related_name='owner', on_delete=models.CASCADE)
     status = models.IntegerField(
         choices=SiteStatus.choices, default=SiteStatus.DISCONNECTED)
+    # rolling window of the last telemetry samples sent with heartbeats, see telemetry_util
+    telemetry = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(editable=False)
     updated_at = models.DateTimeField()
 
@@ -48,8 +50,15 @@ class Project(models.Model):
     name = models.CharField(max_length=100, blank=True, default='')
     description = models.TextField()
     site = models.ForeignKey(Site, on_delete=models.CASCADE)
-    tasks = models.JSONField(encoder=None, decoder=None, default=[])
+    tasks = models.JSONField(encoder=None, decoder=None, default=list)
     batch = models.IntegerField()
+    # optional storage quota of the project in bytes, unlimited if not set
+    storage_quota = models.BigIntegerField(null=True, blank=True)
+    # a batch starts when this many participants, or this fraction of them, are connected, all of them if neither is set
+    min_participants = models.IntegerField(null=True, blank=True)
+    min_participant_fraction = models.FloatField(null=True, blank=True)
+    # batches with unfinished runs at the same time, further launches wait in the launch queue
+    max_concurrent_batches = models.IntegerField(default=1)
     created_at = models.DateTimeField(editable=False)
     updated_at = models.DateTimeField()
 
@@ -85,6 +94,8 @@ class ProjectParticipant(models.Model):
         choices=Role.choices,
         default=Role.PARTICIPANT,
     )
+    # a batch never starts without a required participant
+    required = models.BooleanField(default=False)
     notes = models.TextField()
     created_at = models.DateTimeField(editable=False)
     updated_at = models.DateTimeField()
@@ -124,12 +135,12 @@ class Run(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     participant = models.ForeignKey(
         ProjectParticipant, on_delete=models.CASCADE)
-    site_uid = models.UUIDField(default=uuid.uuid4())
+    site_uid = models.UUIDField(default=uuid.uuid4)
     batch = models.IntegerField()
     cur_seq = models.IntegerField(default=1)
-    tasks = models.JSONField(encoder=None, decoder=None, default=[])
+    tasks = models.JSONField(encoder=None, decoder=None, default=list)
     middle_artifacts = models.JSONField(
-        encoder=None, decoder=None, default=[])
+        encoder=None, decoder=None, default=list)
     role = models.CharField(
         max_length=2,
         choices=ProjectParticipant.Role.choices,
@@ -137,8 +148,10 @@ class Run(models.Model):
     )
     status = FSMIntegerField(
         choices=RunStatus.choices, default=RunStatus.STANDBY, protected=True)
-    logs = models.JSONField(encoder=None, decoder=None, default=[])
-    artifacts = models.JSONField(encoder=None, decoder=None, default=[])
+    logs = models.JSONField(encoder=None, decoder=None, default=list)
+    artifacts = models.JSONField(encoder=None, decoder=None, default=list)
+    # start of the current round of the run, cleared when the run goes back to standby
+    round_started_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(editable=False)
     updated_at = models.DateTimeField()
 
@@ -158,7 +171,26 @@ class Run(models.Model):
             self.tasks = self.project.tasks
             self.status = Run.RunStatus.STANDBY
         self.updated_at = curr_time
-        return super(Run, self).save(*args, **kwargs)
+        result = super(Run, self).save(*args, **kwargs)
+        outcome = getattr(self, 'round_outcome', None)
+        if outcome is not None:
+            RoundDuration.record([self], outcome, curr_time)
+            self.round_outcome = None
+        return result
+
+    def get_round_seq(self):
+        """
+        Current round of the current task, None if the tasks do not define it.
+        """
+        try:
+            return self.tasks[self.cur_seq - 1]['config']['current_round']
+        except (IndexError, KeyError, TypeError):
+            return None
+
+    def finish_round(self, outcome):
+        # recorded once the run is saved
+        if self.round_started_at:
+            self.round_outcome = outcome
 
     def __str__(self):
         return self.project.name + '-' + self.batch + '-' + self.id
@@ -189,6 +221,7 @@ class Run(models.Model):
     @transition(field=status, source="*", target=RunStatus.STANDBY)
     def to_restart(self):
         print(self.status)
+        self.round_started_at = None
 
     @transition(field=status,
                 source=[RunStatus.STANDBY,
@@ -200,14 +233,18 @@ class Run(models.Model):
     @transition(field=status, source=RunStatus.STANDBY, target=RunStatus.PREPARING)
     def preparing(self):
         print(self.status)
+        self.round_started_at = timezone.now()
 
     @transition(field=status, source=RunStatus.PREPARING, target=RunStatus.RUNNING)
     def running(self):
         print(self.status)
+        if not self.round_started_at:
+            self.round_started_at = timezone.now()
 
     @transition(field=status, source=RunStatus.RUNNING, target=RunStatus.PENDING_SUCCESS)
     def pending_success(self):
         print(self.status)
+        self.finish_round(RoundDuration.Outcome.SUCCESS)
 
     @transition(field=status, source=RunStatus.PENDING_SUCCESS, target=RunStatus.PENDING_AGGREGATING)
     def pending_aggregating(self):
@@ -220,6 +257,7 @@ class Run(models.Model):
     @transition(field=status, source=[RunStatus.RUNNING, RunStatus.PREPARING], target=RunStatus.PENDING_FAILED)
     def pending_failed(self):
         print(self.status)
+        self.finish_round(RoundDuration.Outcome.FAILED)
 
     @transition(field=status, source=[RunStatus.PENDING_SUCCESS, RunStatus.AGGREGATING], target=RunStatus.SUCCESS)
     def success(self):
@@ -232,3 +270,234 @@ class Run(models.Model):
     class Meta:
         ordering = ['id']
         unique_together = ('project', 'participant', 'batch',)
+        # runs of a batch are looked up by project and batch when a batch is launched
+        indexes = [models.Index(fields=['project', 'batch'])]
+
+
+class RoundDuration(models.Model):
+    """
+    How long a run took for one round of a task, from preparing to its result.
+    """
+
+    class Outcome(models.IntegerChoices):
+        FAILED = 0
+        SUCCESS = 1
+        TIMED_OUT = 2
+        DISCONNECTED = 3
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    # durations outlive archived runs
+    run = models.ForeignKey(Run, null=True, on_delete=models.SET_NULL)
+    site_uid = models.UUIDField()
+    batch = models.IntegerField()
+    task_seq = models.IntegerField()
+    round_seq = models.IntegerField(null=True)
+    outcome = models.IntegerField(choices=Outcome.choices)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    seconds = models.FloatField()
+
+    @staticmethod
+    def record(runs, outcome, finished_at):
+        """
+        Record the current round of the runs as finished with outcome.
+        """
+        RoundDuration.objects.bulk_create([RoundDuration(
+            project_id=run.project_id,
+            run=run,
+            site_uid=run.site_uid,
+            batch=run.batch,
+            task_seq=run.cur_seq,
+            round_seq=run.get_round_seq(),
+            outcome=outcome,
+            started_at=run.round_started_at,
+            finished_at=finished_at,
+            seconds=(finished_at - run.round_started_at).total_seconds()
+        ) for run in runs if run.round_started_at])
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['project', 'site_uid'])]
+
+
+class RoundBarrier(models.Model):
+    """
+    Runs of a batch that finished a round of a task, the round is complete once all of them did.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    batch = models.IntegerField()
+    task_seq = models.IntegerField()
+    round_seq = models.IntegerField()
+    expected = models.IntegerField(default=0)
+    arrived = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(editable=False)
+    updated_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        curr_time = timezone.now()
+        if not self.id:
+            self.created_at = curr_time
+        self.updated_at = curr_time
+        return super(RoundBarrier, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('project', 'batch', 'task_seq', 'round_seq',)
+
+
+class BatchLaunch(models.Model):
+    """
+    A launch of a batch waiting for one of the batches of the project to finish.
+    """
+
+    class LaunchStatus(models.IntegerChoices):
+        CANCELLED = 0
+        QUEUED = 1
+        LAUNCHED = 2
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    status = models.IntegerField(
+        choices=LaunchStatus.choices, default=LaunchStatus.QUEUED)
+    # batch started by the launch
+    batch = models.IntegerField(null=True, blank=True)
+    # why the launch is still waiting
+    reason = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(editable=False)
+    updated_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        curr_time = timezone.now()
+        if not self.id:
+            self.created_at = curr_time
+        self.updated_at = curr_time
+        return super(BatchLaunch, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['project', 'status'])]
+
+
+class RunArchive(models.Model):
+    """
+    A finished batch of runs moved out of the Run table, the values of its runs are kept as rows of `fields`.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    batch = models.IntegerField()
+    fields = models.JSONField(default=list)
+    runs = models.JSONField(default=list)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(editable=False)
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        if not self.id:
+            self.archived_at = timezone.now()
+        return super(RunArchive, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('project', 'batch',)
+
+
+class StorageUsage(models.Model):
+    """
+    Incrementally maintained storage usage of the files uploaded for a run,
+    one record per file type, task and round.
+    """
+
+    class FileType(models.TextChoices):
+        ARTIFACTS = "artifacts", _("artifacts")
+        LOGS = "logs", _("logs")
+        MID_ARTIFACTS = "mid_artifacts", _("mid_artifacts")
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    # files stay on disk when a run record goes away, so keep its usage
+    run = models.ForeignKey(Run, null=True, on_delete=models.SET_NULL)
+    site_uid = models.UUIDField()
+    batch = models.IntegerField()
+    file_type = models.CharField(max_length=16, choices=FileType.choices)
+    task_seq = models.IntegerField()
+    round_seq = models.IntegerField()
+    files = models.IntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        self.updated_at = timezone.now()
+        return super(StorageUsage, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('run', 'file_type', 'task_seq', 'round_seq',)
+        indexes = [models.Index(fields=['project', 'site_uid'])]
+
+
+class UploadJob(models.Model):
+    """
+    A file staged by an upload, published to the runs of its batch in the background.
+    """
+
+    class JobStatus(models.IntegerChoices):
+        FAILED = 0
+        STAGED = 1
+        PROCESSING = 2
+        PUBLISHED = 3
+
+    run = models.ForeignKey(Run, on_delete=models.CASCADE)
+    file_type = models.CharField(
+        max_length=16, choices=StorageUsage.FileType.choices)
+    task_seq = models.IntegerField()
+    round_seq = models.IntegerField()
+    name = models.CharField(max_length=255)
+    path = models.CharField(max_length=512)
+    size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    status = models.IntegerField(
+        choices=JobStatus.choices, default=JobStatus.STAGED)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(editable=False)
+    updated_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        curr_time = timezone.now()
+        if not self.id:
+            self.created_at = curr_time
+        self.updated_at = curr_time
+        return super(UploadJob, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+
+class RunFile(models.Model):
+    """
+    A file published to a run, with the checksum of its content so that controllers fetch only the files they miss.
+    """
+    run = models.ForeignKey(Run, on_delete=models.CASCADE)
+    file_type = models.CharField(
+        max_length=16, choices=StorageUsage.FileType.choices)
+    task_seq = models.IntegerField()
+    round_seq = models.IntegerField()
+    name = models.CharField(max_length=255)
+    path = models.CharField(max_length=512, unique=True)
+    size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64)
+    created_at = models.DateTimeField(editable=False)
+
+    def save(self, *args, **kwargs):
+        """ On save, update timestamps """
+        if not self.id:
+            self.created_at = timezone.now()
+        return super(RunFile, self).save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['run', 'task_seq', 'round_seq'])]
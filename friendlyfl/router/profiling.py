@@ -0,0 +1,178 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+# profile of the current request, None when it is not profiled
+current_profile = ContextVar('current_profile', default=None)
+
+profile_id_pattern = re.compile(r'^[0-9]{20}-[0-9a-f]{32}$')
+
+profiler_lock = threading.Lock()
+
+
+@contextmanager
+def timed_io(operation, name, size=None):
+    """
+    Time a storage operation of the current request when it is profiled, does nothing otherwise.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile['io'].append({
+            'operation': operation,
+            'name': str(name),
+            'size': size,
+            'seconds': time.perf_counter() - start,
+        })
+
+
+def should_profile(request):
+    token = settings.PROFILING_TOKEN
+    if token and request.headers.get('X-Profile-Token') == token:
+        return True
+    return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def record_queries(profile):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile['queries'].append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+                'seconds': time.perf_counter() - start,
+            })
+    return wrapper
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests carrying the PROFILING_TOKEN in `X-Profile-Token`, and a PROFILING_SAMPLE_RATE share of the
+    others: the calls made, the SQL queries and the storage operations are saved to the profile ring buffer and the
+    id of the profile is returned in `X-Profile-Id`. Not loaded at all unless PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # one profile at a time in the worker, Python 3.12 refuses to enable a second profiler while one is: the
+        # requests to profile meanwhile are served unprofiled
+        if not should_profile(request) or not profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            profiler_lock.release()
+
+    def profile(self, request):
+        started_at = timezone.now()
+        profile = {
+            'id': '{}-{}'.format(started_at.strftime('%Y%m%d%H%M%S%f'), uuid.uuid4().hex),
+            'method': request.method,
+            'path': request.path,
+            'started_at': started_at.isoformat(),
+            'queries': [],
+            'io': [],
+        }
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                wrapper = record_queries(profile)
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(wrapper))
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            current_profile.reset(token)
+        profile['seconds'] = time.perf_counter() - start
+        profile['status'] = response.status_code
+        save_profile(profile, profiler)
+        response['X-Profile-Id'] = profile['id']
+        return response
+
+
+def save_profile(profile, profiler):
+    """
+    Write the profile and its raw pstats next to it, then drop the oldest profiles beyond PROFILING_MAX_PROFILES.
+    """
+    folder = settings.PROFILING_DIR
+    os.makedirs(folder, exist_ok=True)
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_text)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP_FUNCTIONS)
+    profile['query_count'] = len(profile['queries'])
+    profile['query_seconds'] = sum(query['seconds'] for query in profile['queries'])
+    profile['io_seconds'] = sum(operation['seconds'] for operation in profile['io'])
+    profile['stats'] = stats_text.getvalue()
+    stats.dump_stats(os.path.join(folder, profile['id'] + '.prof'))
+    with open(os.path.join(folder, profile['id'] + '.json'), 'w') as f:
+        json.dump(profile, f)
+    for profile_id in list_profile_ids()[settings.PROFILING_MAX_PROFILES:]:
+        delete_profile(profile_id)
+
+
+def list_profile_ids():
+    """
+    Ids of the saved profiles, newest first.
+    """
+    folder = settings.PROFILING_DIR
+    if not os.path.isdir(folder):
+        return []
+    return sorted((name[:-len('.json')] for name in os.listdir(folder) if name.endswith('.json')), reverse=True)
+
+
+def get_profile_path(profile_id, suffix):
+    if not profile_id_pattern.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+
+def load_profile(profile_id):
+    path = get_profile_path(profile_id, '.json')
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        # dropped from the ring buffer or still being written
+        return None
+
+
+def delete_profile(profile_id):
+    for suffix in ['.json', '.prof']:
+        try:
+            os.remove(os.path.join(settings.PROFILING_DIR, profile_id + suffix))
+        except FileNotFoundError:
+            pass
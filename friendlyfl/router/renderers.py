@@ -0,0 +1,62 @@
+import datetime
+import uuid
+
+import msgpack
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+# MessagePack extension type of UUIDs, their 16 bytes
+uuid_ext_type = 1
+
+
+def encode(obj):
+    """
+    Encode the values msgpack has no type for, aware datetimes are packed as timestamps by msgpack itself.
+    """
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(uuid_ext_type, obj.bytes)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def decode_ext(code, data):
+    if code == uuid_ext_type:
+        # the views and serializers take uuids as strings, as in JSON
+        return str(uuid.UUID(bytes=data))
+    return msgpack.ExtType(code, data)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Render responses as MessagePack, UUIDs and datetimes are sent as native types rather than strings.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode, datetime=True, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parse MessagePack request bodies, timestamps are decoded as aware datetimes in UTC.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), ext_hook=decode_ext, timestamp=3, raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % (str(exc) or type(exc).__name__))
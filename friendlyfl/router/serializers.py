@@ -1,12 +1,14 @@
 from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.utils import timezone
 from rest_framework import serializers
 from friendlyfl.router.models import Run
 
 from rest_framework.validators import UniqueValidator
 
-from friendlyfl.router.models import Site, Project, ProjectParticipant
+from friendlyfl.router.models import Site, Project, ProjectParticipant, StorageUsage, UploadJob, BatchLaunch, RunFile
 from django.db import transaction, DatabaseError
 
 
@@ -59,6 +61,15 @@ class SiteSerializer(serializers.ModelSerializer):
         create_only_fields = ('uid',)
 
 
+class SiteBulkSerializer(SiteSerializer):
+    """
+    Validates a site of a bulk registration, uniqueness is checked for all the sites at once.
+    """
+    name = serializers.CharField(
+        required=True, allow_blank=False, max_length=100)
+    uid = serializers.UUIDField(format='hex_verbose')
+
+
 class TaskSerializer(serializers.Serializer):
     seq = serializers.IntegerField(required=True)
     model = serializers.CharField(required=True, allow_blank=False)
@@ -76,6 +87,14 @@ class ProjectSerializer(serializers.ModelSerializer):
         many=False, queryset=Site.objects.all())
     batch = serializers.IntegerField(read_only=True)
     tasks = TaskSerializer(many=True)
+    storage_quota = serializers.IntegerField(
+        required=False, allow_null=True, min_value=0)
+    min_participants = serializers.IntegerField(
+        required=False, allow_null=True, min_value=1)
+    min_participant_fraction = serializers.FloatField(
+        required=False, allow_null=True, min_value=0, max_value=1)
+    max_concurrent_batches = serializers.IntegerField(
+        required=False, min_value=1)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
@@ -92,6 +111,14 @@ class ProjectSerializer(serializers.ModelSerializer):
         instance.name = validated_data.get('name', instance.name)
         instance.description = validated_data.get(
             'description', instance.description)
+        instance.storage_quota = validated_data.get(
+            'storage_quota', instance.storage_quota)
+        instance.min_participants = validated_data.get(
+            'min_participants', instance.min_participants)
+        instance.min_participant_fraction = validated_data.get(
+            'min_participant_fraction', instance.min_participant_fraction)
+        instance.max_concurrent_batches = validated_data.get(
+            'max_concurrent_batches', instance.max_concurrent_batches)
         instance.save()
         return instance
 
@@ -104,6 +131,10 @@ class ProjectSerializer(serializers.ModelSerializer):
         site_id = validated_data.get("site")
         description = validated_data.get("description")
         tasks = validated_data.get("tasks")
+        storage_quota = validated_data.get("storage_quota")
+        min_participants = validated_data.get("min_participants")
+        min_participant_fraction = validated_data.get("min_participant_fraction")
+        max_concurrent_batches = validated_data.get("max_concurrent_batches") or 1
 
         project = Project.objects.filter(name=project_name).first()
         role = ProjectParticipant.Role.PARTICIPANT
@@ -117,7 +148,11 @@ class ProjectSerializer(serializers.ModelSerializer):
                         site=site,
                         name=project_name,
                         description=description,
-                        tasks=tasks
+                        tasks=tasks,
+                        storage_quota=storage_quota,
+                        min_participants=min_participants,
+                        min_participant_fraction=min_participant_fraction,
+                        max_concurrent_batches=max_concurrent_batches
                     )
                     role = ProjectParticipant.Role.COORDINATOR
                 ProjectParticipant.objects.get_or_create(
@@ -129,7 +164,8 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = ['id', 'name', 'description', 'site', 'batch',
-                  'tasks', 'created_at', 'updated_at']
+                  'tasks', 'storage_quota', 'min_participants', 'min_participant_fraction',
+                  'max_concurrent_batches', 'created_at', 'updated_at']
         create_only_fields = ('site', 'tasks')
 
 
@@ -138,6 +174,7 @@ class ProjectParticipantSerializer(serializers.ModelSerializer):
     site = SiteSerializer(many=False)
     project = ProjectSerializer(many=False)
     role = serializers.CharField(source='get_role_display')
+    required = serializers.BooleanField(required=False)
     notes = serializers.CharField(style={'base_template': 'textarea.html'})
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
@@ -153,12 +190,13 @@ class ProjectParticipantSerializer(serializers.ModelSerializer):
         Update and return an existing `ProjectParticipant` instance, given the validated data.
         """
         instance.notes = validated_data.get('notes', instance.notes)
+        instance.required = validated_data.get('required', instance.required)
         instance.save()
         return instance
 
     class Meta:
         model = ProjectParticipant
-        fields = ['id', 'site', 'project', 'role',
+        fields = ['id', 'site', 'project', 'role', 'required',
                   'notes', 'created_at', 'updated_at']
         create_only_fields = ('site', 'project', 'role')
 
@@ -218,6 +256,103 @@ class RunSerializer(serializers.ModelSerializer):
         create_only_fields = ('project', 'participant', 'role')
 
 
+def serialize_task(task):
+    # same as TaskSerializer, a missing config falls back to the field default
+    seq = task['seq']
+    model = task['model']
+    return {
+        'seq': None if seq is None else int(seq),
+        'model': None if model is None else str(model),
+        'config': task.get('config', '{}'),
+    }
+
+
+# values of a run read by serialize_run_rows, in order
+run_value_fields = ['id', 'project_id', 'batch', 'participant_id', 'role', 'site_uid', 'cur_seq', 'status', 'logs',
+                    'artifacts', 'tasks', 'middle_artifacts', 'created_at', 'updated_at']
+
+
+def serialize_runs(queryset):
+    """
+    Same output as RunSerializer(queryset, many=True).data, built from values() rows
+    without model instances and serializer fields for every run.
+    UUIDs and datetimes are left as native values, rendered as the same strings by the JSON renderer.
+    """
+    return serialize_run_rows(queryset.values_list(*run_value_fields))
+
+
+def serialize_run_rows(rows):
+    """
+    Serialize runs given as rows of the values of run_value_fields.
+    """
+    role_labels = {value: str(label) for value, label in ProjectParticipant.Role.choices}
+    status_labels = {value: str(label) for value, label in Run.RunStatus.choices}
+    # resolve the current timezone once rather than for every value
+    datetime_field = serializers.DateTimeField(
+        default_timezone=timezone.get_current_timezone() if settings.USE_TZ else None)
+
+    def to_datetime(value):
+        return datetime_field.enforce_timezone(value) if value else None
+
+    data = []
+    for (run_id, project_id, batch, participant_id, role, site_uid, cur_seq, run_status, logs, artifacts, tasks,
+         middle_artifacts, created_at, updated_at) in rows:
+        data.append({
+            'id': run_id,
+            'project': project_id,
+            'batch': batch,
+            'participant': participant_id,
+            'role': role_labels.get(role, role),
+            'site_uid': site_uid,
+            'cur_seq': cur_seq,
+            'status': status_labels.get(run_status, str(run_status)),
+            'logs': logs,
+            'artifacts': artifacts,
+            'tasks': None if tasks is None else [serialize_task(task) for task in tasks],
+            'middle_artifacts': middle_artifacts,
+            'created_at': to_datetime(created_at),
+            'updated_at': to_datetime(updated_at),
+        })
+    return data
+
+
 class RunRetrieveSerializer(RunSerializer):
     project = ProjectSerializer()
     participant = ProjectParticipantSerializer()
+
+
+class StorageUsageSerializer(serializers.ModelSerializer):
+    site_uid = serializers.UUIDField(format='hex_verbose', read_only=True)
+
+    class Meta:
+        model = StorageUsage
+        fields = ['id', 'project', 'site_uid', 'run', 'batch', 'file_type',
+                  'task_seq', 'round_seq', 'files', 'bytes', 'updated_at']
+        read_only_fields = fields
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ['id', 'run', 'file_type', 'task_seq', 'round_seq', 'name', 'size',
+                  'checksum', 'status', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class RunFileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RunFile
+        fields = ['id', 'run', 'file_type', 'task_seq', 'round_seq', 'name', 'size', 'checksum', 'created_at']
+        read_only_fields = fields
+
+
+class BatchLaunchSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = BatchLaunch
+        fields = ['id', 'project', 'status', 'batch',
+                  'reason', 'created_at', 'updated_at']
+        read_only_fields = fields
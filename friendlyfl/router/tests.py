@@ -1,3 +1,1088 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+import msgpack
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connections, OperationalError
+from django.db.models import QuerySet
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, \
+    skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from friendlyfl.router import concurrency, db_router, profiling, renderers, throttles, tracing
+from friendlyfl.router.models import BatchLaunch, Project, Run, RoundBarrier, RoundDuration, RunFile, Site, \
+    UploadJob
+from friendlyfl.router.serializers import RunSerializer, serialize_runs
+from friendlyfl.router.upload_handlers import ChecksumUploadHandler
+from friendlyfl.router.views import RunsActionViewSet
+from friendlyfl.utils import archive_util, file_util, history_util, straggler_util, telemetry_util, usage_util
+
+API = '/friendlyfl/api/v1/'
+
+# throttles lifted, uploads published inline and a cache of the process, for every test to start from empty windows
+# and buckets
+test_settings = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'THROTTLE_RATES': {'control': (0, 0), 'data': (0, 0)},
+    'UPLOAD_PIPELINE_ASYNC': False,
+}
+
+# statuses a run goes through in a round before the status
+round_steps = {
+    Run.RunStatus.RUNNING: [Run.RunStatus.PREPARING],
+    Run.RunStatus.PENDING_SUCCESS: [Run.RunStatus.PREPARING, Run.RunStatus.RUNNING],
+    Run.RunStatus.PENDING_FAILED: [Run.RunStatus.PREPARING, Run.RunStatus.RUNNING],
+}
+
+
+class ApiTestMixin:
+    """
+    Make sites, projects and runs through the API as an admin.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def make_site(self, name):
+        response = self.client.post(API + 'sites/', {'name': name, 'description': name, 'uid': str(uuid.uuid4())},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def make_project(self, name, participants=2, rounds=2, **fields):
+        """
+        Project of a coordinator site with the given number of participant sites, its sites first.
+        """
+        sites = [self.make_site(name + '-co')]
+        tasks = [{'seq': 1, 'model': 'm', 'config': {'current_round': 1, 'total_round': rounds}}]
+        response = self.client.post(API + 'projects/', {'name': name, 'description': name, 'site': sites[0]['id'],
+                                                        'tasks': tasks}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        project = Project.objects.get(name=name)
+        for i in range(participants):
+            sites.append(self.make_site('{}-pa{}'.format(name, i)))
+            response = self.client.post(API + 'project-participants/', {'site': sites[-1]['id'], 'project': project.id,
+                                                                        'role': 'PA', 'notes': 'joined'},
+                                        format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        Project.objects.filter(id=project.id).update(**fields)
+        return project, sites
+
+    def launch(self, project, **data):
+        return self.client.post(API + 'runs', dict(data, project=project.id), format='json')
+
+    def get_runs(self, project):
+        return list(Run.objects.filter(project=project).order_by('id'))
+
+    def get_run_of(self, site, project):
+        return Run.objects.get(site_uid=site['uid'], project=project, batch=Project.objects.get(id=project.id).batch)
+
+    def upload(self, run, name, content, task_seq=1, round_seq=1):
+        response = self.client.post(API + 'runs-action/upload/', {
+            'run': run.id, 'task_seq': task_seq, 'round_seq': round_seq,
+            'artifacts': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def put_status(self, run, status, **data):
+        """
+        Move the run to status through the statuses of the round before it, as controllers do.
+        """
+        for prior in round_steps.get(status, []):
+            if Run.RunStatus.STANDBY <= Run.objects.get(id=run.id).status < prior:
+                self.client.put(API + 'runs/{}/status/'.format(run.id), {'status': prior}, format='json')
+        return self.client.put(API + 'runs/{}/status/'.format(run.id), dict(data, status=status), format='json')
+
+
+@override_settings(**test_settings)
+class ReplicaRoutingTests(ApiTestMixin, TransactionTestCase):
+    """
+    Reads of the API against a second alias of the test database standing for a replica.
+    """
+    replica = 'replica1'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # the test database is set up by then, the replica mirrors it
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        connections.settings[cls.replica] = dict(primary, TEST=dict(primary['TEST'], MIRROR=DEFAULT_DB_ALIAS))
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        db_router._down_until.clear()
+        self.project, self.sites = self.make_project('replicas', participants=1)
+        self.launch(self.project)
+        self.runs = self.get_runs(self.project)
+        # sites start outside of the stickiness window of their creation
+        cache.clear()
+
+    def get_run(self, run):
+        with CaptureQueriesContext(connections[self.replica]) as queries:
+            response = self.client.get(API + 'runs/{}/'.format(run.id))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(queries)
+
+    def test_reads_from_replica(self):
+        data, replica_queries = self.get_run(self.runs[0])
+        self.assertEqual(data['id'], self.runs[0].id)
+        self.assertGreater(replica_queries, 0)
+
+    def test_read_after_write_from_primary(self):
+        response = self.put_status(self.runs[0], Run.RunStatus.PREPARING)
+        self.assertEqual(response.status_code, 202, response.content)
+        data, replica_queries = self.get_run(self.runs[0])
+        self.assertEqual(data['status'], Run.RunStatus.PREPARING.label)
+        self.assertEqual(replica_queries, 0)
+
+    def test_write_sticks_only_its_site(self):
+        # both sites use the same account
+        self.put_status(self.runs[0], Run.RunStatus.PREPARING)
+        self.assertNotEqual(self.runs[0].site_uid, self.runs[1].site_uid)
+        data, replica_queries = self.get_run(self.runs[1])
+        self.assertGreater(replica_queries, 0)
+
+    def test_replica_refusing_connections(self):
+        with mock.patch.object(connections[self.replica], 'ensure_connection',
+                               side_effect=OperationalError('connection refused')) as ensure_connection:
+            response = self.client.get(API + 'runs/{}/'.format(self.runs[0].id))
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()['id'], self.runs[0].id)
+            self.assertIn(self.replica, db_router._down_until)
+            # skipped without trying again until the retry delay passed
+            response = self.client.get(API + 'runs/{}/'.format(self.runs[0].id))
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(ensure_connection.call_count, 1)
+
+
+class ArtifactsTestMixin:
+    """
+    Keep the files uploaded by the tests in a temporary folder.
+    """
+
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        patcher = mock.patch('friendlyfl.utils.file_util.base_folder', folder.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@override_settings(**test_settings)
+class LaunchTests(ApiTestMixin, TestCase):
+
+    def test_second_launch_waits_for_batch(self):
+        project, sites = self.make_project('launch')
+        self.assertEqual(self.launch(project).status_code, 201)
+        response = self.launch(project)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Project.objects.get(id=project.id).batch, 1)
+        self.assertEqual(len(self.get_runs(project)), 3)
+
+    def test_launch_queries_do_not_grow_with_participants(self):
+        for participants in [2, 8]:
+            project, sites = self.make_project('queries-{}'.format(participants), participants=participants)
+            with self.assertNumQueries(8):
+                response = self.launch(project)
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(len(self.get_runs(project)), participants + 1)
+
+    def test_launch_refused_while_launches_queued(self):
+        project, sites = self.make_project('queued')
+        self.launch(project)
+        self.assertEqual(self.launch(project, queue=True).status_code, 202)
+        # finished without admitting the queued launch yet
+        Run.objects.filter(project=project).update(status=Run.RunStatus.SUCCESS)
+        response = self.launch(project)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("queued", response.json())
+
+    def stop_batch(self, project):
+        coordinator = self.get_runs(project)[0]
+        return self.client.put(API + 'runs-action/update/', {
+            'run': coordinator.id, 'role': 'coordinator', 'action': 'stop', 'project': project.id,
+            'batch': coordinator.batch}, format='json')
+
+    def test_stopped_batch_frees_slot(self):
+        project, sites = self.make_project('stopped')
+        self.launch(project)
+        self.launch(project, queue=True)
+        self.assertEqual(self.stop_batch(project).status_code, 202)
+        self.assertEqual(BatchLaunch.objects.get().status, BatchLaunch.LaunchStatus.LAUNCHED)
+        self.assertEqual(Project.objects.get(id=project.id).batch, 2)
+        # the first batch lost its slot to the second
+        response = self.client.put(API + 'runs-action/update/', {
+            'run': self.get_runs(project)[0].id, 'role': 'coordinator', 'action': 'restart', 'project': project.id,
+            'batch': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_status_sent_as_string_frees_slot(self):
+        project, sites = self.make_project('string-status')
+        self.launch(project)
+        self.launch(project, queue=True)
+        for run in self.get_runs(project):
+            self.put_status(run, Run.RunStatus.RUNNING)
+            response = self.client.put(API + 'runs/{}/status/'.format(run.id),
+                                       {'status': str(Run.RunStatus.PENDING_FAILED.value)}, format='json')
+            self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(BatchLaunch.objects.get().status, BatchLaunch.LaunchStatus.LAUNCHED)
+        self.assertEqual(Project.objects.get(id=project.id).batch, 2)
+
+    def test_swept_batch_frees_slot(self):
+        project, sites = self.make_project('swept')
+        self.launch(project)
+        self.launch(project, queue=True)
+        straggler_util.stop_runs(self.get_runs(project), RoundDuration.Outcome.TIMED_OUT, timezone.now())
+        self.assertEqual(BatchLaunch.objects.get().status, BatchLaunch.LaunchStatus.LAUNCHED)
+        self.assertEqual(Project.objects.get(id=project.id).batch, 2)
+
+
+@override_settings(**test_settings)
+class LaunchRaceTests(ApiTestMixin, TransactionTestCase):
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_launches_start_one_batch(self):
+        project, sites = self.make_project('race')
+        barrier = threading.Barrier(2)
+        codes = []
+
+        def launch():
+            client = APIClient()
+            client.force_authenticate(self.admin)
+            barrier.wait()
+            try:
+                codes.append(client.post(API + 'runs', {'project': project.id}, format='json').status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=launch) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(codes), [201, 400])
+        self.assertEqual(Project.objects.get(id=project.id).batch, 1)
+        self.assertEqual(len(self.get_runs(project)), 3)
+
+
+@override_settings(**test_settings)
+class RoundBarrierTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def start(self, name, **fields):
+        project, sites = self.make_project(name, **fields)
+        self.assertEqual(self.launch(project).status_code, 201)
+        return self.get_runs(project)
+
+    def get_barrier(self, runs):
+        barrier = RoundBarrier.objects.get(project_id=runs[0].project_id)
+        return barrier.expected, barrier.arrived, barrier.completed_at is not None
+
+    def finish_round(self, runs, failed=()):
+        for run in runs:
+            status = Run.RunStatus.PENDING_FAILED if run in failed else Run.RunStatus.PENDING_SUCCESS
+            response = self.put_status(run, status)
+            self.assertEqual(response.status_code, 202, response.content)
+
+    def test_completes_once_all_arrived(self):
+        runs = self.start('all')
+        self.finish_round(runs[:2])
+        self.assertEqual(self.get_barrier(runs), (3, 2, False))
+        self.finish_round(runs[2:])
+        self.assertEqual(self.get_barrier(runs), (3, 3, True))
+        self.assertEqual(Run.objects.get(id=runs[0].id).status, Run.RunStatus.PENDING_AGGREGATING)
+
+    def test_failed_run_blocks_without_quorum(self):
+        runs = self.start('no-quorum')
+        self.finish_round(runs, failed=runs[2:])
+        self.assertEqual(self.get_barrier(runs), (3, 2, False))
+
+    def test_failed_run_left_out_with_quorum(self):
+        runs = self.start('quorum', min_participants=2)
+        self.finish_round(runs, failed=runs[2:])
+        self.assertEqual(self.get_barrier(runs), (2, 2, True))
+
+    def test_failed_runs_below_quorum_block(self):
+        runs = self.start('quorum-not-met', min_participants=3)
+        self.finish_round(runs, failed=runs[2:])
+        self.assertEqual(self.get_barrier(runs), (3, 2, False))
+
+    def test_waits_for_pending_uploads(self):
+        runs = self.start('uploads')
+        self.finish_round(runs[:2])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.upload(runs[2], 'model.bin', b'weights')
+        self.finish_round(runs[2:])
+        self.assertEqual(self.get_barrier(runs), (3, 2, False))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.JobStatus.PUBLISHED)
+        self.assertEqual(self.get_barrier(runs), (3, 3, True))
+
+    def test_stopped_straggler_left_out_with_quorum(self):
+        runs = self.start('straggler', min_participants=2)
+        self.finish_round(runs[:2])
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                               side_effect=QuerySet.select_for_update) as select_for_update:
+            straggler_util.stop_runs(runs[2:], RoundDuration.Outcome.TIMED_OUT, timezone.now())
+        # locked in the order of the views: the project, then the runs
+        self.assertEqual([call.args[0].model for call in select_for_update.call_args_list][:2], [Project, Run])
+        self.assertEqual(self.get_barrier(runs), (2, 2, True))
+
+
+@override_settings(**test_settings)
+class ParticipationTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def set_connected(self, site, connected):
+        Site.objects.filter(id=site['id']).update(
+            status=Site.SiteStatus.CONNECTED if connected else Site.SiteStatus.DISCONNECTED)
+
+    def test_disconnected_site_blocks_without_quorum(self):
+        project, sites = self.make_project('all-sites')
+        self.set_connected(sites[2], False)
+        response = self.launch(project)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), "Not all sites are connected")
+
+    def test_quorum_starts_without_disconnected_site(self):
+        project, sites = self.make_project('quorum', participants=3, min_participants=3)
+        self.set_connected(sites[3], False)
+        self.assertEqual(self.launch(project).status_code, 201)
+        self.assertEqual({run.site_uid for run in self.get_runs(project)},
+                         {uuid.UUID(site['uid']) for site in sites[:3]})
+
+    def test_quorum_not_met(self):
+        project, sites = self.make_project('quorum-not-met', participants=3, min_participants=4)
+        self.set_connected(sites[3], False)
+        response = self.launch(project)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), "3 of the 4 sites needed are connected")
+
+    def test_required_site_not_connected(self):
+        project, sites = self.make_project('required', participants=3, min_participants=2)
+        project.projectparticipant_set.filter(site_id=sites[3]['id']).update(required=True)
+        self.set_connected(sites[3], False)
+        response = self.launch(project)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(sites[3]['name'], response.json())
+
+    def test_late_joiner_gets_global_artifacts(self):
+        project, sites = self.make_project('late', participants=3, min_participants=2)
+        self.set_connected(sites[3], False)
+        self.assertEqual(self.launch(project).status_code, 201)
+        coordinator = self.get_run_of(sites[0], project)
+        for site in sites[:3]:
+            self.put_status(self.get_run_of(site, project), Run.RunStatus.RUNNING)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(coordinator, 'global.bin', b'round 1 model')
+        for site in sites[:3]:
+            self.put_status(self.get_run_of(site, project), Run.RunStatus.PENDING_SUCCESS)
+        self.set_connected(sites[3], True)
+        self.put_status(coordinator, Run.RunStatus.AGGREGATING)
+        response = self.put_status(coordinator, Run.RunStatus.STANDBY, update_all=True, increase_round=True)
+        self.assertEqual(response.status_code, 202, response.content)
+
+        late = self.get_run_of(sites[3], project)
+        self.assertEqual(late.status, Run.RunStatus.STANDBY)
+        self.assertEqual(late.tasks, Run.objects.get(id=coordinator.id).tasks)
+        run_file = RunFile.objects.get(run=late)
+        self.assertEqual((run_file.name, run_file.task_seq, run_file.round_seq), ('global.bin', 1, 1))
+        with open(late.artifacts[0], 'rb') as f:
+            self.assertEqual(f.read(), b'round 1 model')
+
+
+@override_settings(**test_settings)
+class BulkEnrollmentTests(ApiTestMixin, TestCase):
+
+    def test_register_sites(self):
+        taken = self.make_site('taken')
+        uid = str(uuid.uuid4())
+        sites = [{'name': 'new-1', 'description': 'new', 'uid': str(uuid.uuid4())},
+                 {'name': 'taken', 'description': 'taken', 'uid': taken['uid']},
+                 {'name': 'taken', 'description': 'other uid', 'uid': str(uuid.uuid4())},
+                 {'name': 'new-2', 'description': 'new', 'uid': uid},
+                 {'name': 'new-3', 'description': 'uid of new-2', 'uid': uid},
+                 {'name': 'no-uid', 'description': 'invalid'}]
+        response = self.client.post(API + 'sites/bulk/', {'sites': sites}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        results = response.json()
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'exists', 'conflict', 'created', 'conflict', 'invalid'])
+        self.assertEqual(results[1]['id'], taken['id'])
+        self.assertEqual(Site.objects.get(id=results[0]['id']).name, 'new-1')
+        # registered again, nothing is created
+        response = self.client.post(API + 'sites/bulk/', {'sites': sites[:1]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()[0]['status'], 'exists')
+
+    def test_enroll_sites(self):
+        project, sites = self.make_project('enroll', participants=1)
+        new = self.make_site('enroll-new')
+        site_ids = [sites[1]['id'], new['id'], 0, new['id']]
+        response = self.client.post(API + 'project-participants/bulk/', {'project': project.id, 'sites': site_ids},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        results = response.json()
+        self.assertEqual([result['status'] for result in results], ['exists', 'enrolled', 'not_found', 'exists'])
+        self.assertEqual(results[1]['id'], results[3]['id'])
+        self.assertEqual(project.projectparticipant_set.filter(site_id=new['id']).count(), 1)
+        response = self.client.post(API + 'project-participants/bulk/', {'project': project.id, 'sites': [new['id']]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()[0]['status'], 'exists')
+
+
+@override_settings(**test_settings)
+class TelemetryTests(ApiTestMixin, TestCase):
+
+    def heartbeat(self, site, **telemetry):
+        return self.client.post(API + 'sites/heartbeat/', {
+            'uid': site['uid'], 'status': Site.SiteStatus.CONNECTED, 'telemetry': telemetry}, format='json')
+
+    def test_invalid_telemetry_refused(self):
+        site = self.make_site('telemetry')
+        for telemetry in [{'cpu': 1.5}, {'memory': -0.1}, {'queue': 'busy'}, {'throughput': True}]:
+            self.assertEqual(self.heartbeat(site, **telemetry).status_code, 400, telemetry)
+        response = self.client.post(API + 'sites/heartbeat/', {
+            'uid': site['uid'], 'status': Site.SiteStatus.CONNECTED, 'telemetry': [0.5]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Site.objects.get(id=site['id']).telemetry)
+
+    @override_settings(SITE_TELEMETRY_WINDOW=2)
+    def test_window_of_samples(self):
+        site = self.make_site('telemetry')
+        for cpu in [0.1, 0.2, 0.6]:
+            self.assertEqual(self.heartbeat(site, cpu=cpu, queue=1).status_code, 202)
+        telemetry = Site.objects.get(id=site['id']).telemetry
+        self.assertEqual([sample[1:] for sample in telemetry], [[0.2, None, 1, None], [0.6, None, 1, None]])
+        summary = telemetry_util.summarize(telemetry)
+        self.assertAlmostEqual(summary['cpu'], 0.4)
+        self.assertEqual((summary['samples'], summary['memory'], summary['overloaded']), (2, None, False))
+        # samples older than SITE_TELEMETRY_MAX_AGE are left out
+        now = telemetry[-1][0] + settings.SITE_TELEMETRY_MAX_AGE + 1
+        self.assertEqual(telemetry_util.summarize(telemetry, now)['samples'], 0)
+
+    @override_settings(SITE_OVERLOAD_CPU=0.9, SITE_OVERLOAD_MEMORY=0.9, SITE_OVERLOAD_QUEUE=5)
+    def test_overloaded(self):
+        summary = {'cpu': 0.5, 'memory': 0.5, 'queue': 0}
+        self.assertFalse(telemetry_util.is_overloaded(summary))
+        self.assertTrue(telemetry_util.is_overloaded(dict(summary, memory=0.95)))
+        self.assertTrue(telemetry_util.is_overloaded(dict(summary, queue=5)))
+        self.assertFalse(telemetry_util.is_overloaded({'cpu': None, 'memory': None, 'queue': None}))
+        with override_settings(SITE_OVERLOAD_QUEUE=0):
+            self.assertFalse(telemetry_util.is_overloaded(dict(summary, queue=50)))
+
+    def test_overloaded_sites_left_out_of_quorum(self):
+        project, sites = self.make_project('overloaded', participants=3, min_participants=3)
+        self.heartbeat(sites[2], cpu=0.95)
+        self.heartbeat(sites[3], cpu=0.99)
+        self.assertEqual(self.launch(project).status_code, 201)
+        # the least loaded of the overloaded sites completes the quorum
+        self.assertEqual({run.site_uid for run in self.get_runs(project)},
+                         {uuid.UUID(site['uid']) for site in sites[:3]})
+
+        project, sites = self.make_project('available', participants=3, min_participants=3)
+        self.heartbeat(sites[2], cpu=0.95)
+        self.assertEqual(self.launch(project).status_code, 201)
+        self.assertEqual({run.site_uid for run in self.get_runs(project)},
+                         {uuid.UUID(site['uid']) for site in [sites[0], sites[1], sites[3]]})
+
+
+@override_settings(**test_settings)
+class RunHistoryTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def finish_batch(self, project):
+        Run.objects.filter(project=project, batch=Project.objects.get(id=project.id).batch).update(
+            status=Run.RunStatus.SUCCESS)
+
+    def test_archived_runs_read_back_identical(self):
+        project, sites = self.make_project('history')
+        for _ in range(3):
+            self.assertEqual(self.launch(project).status_code, 201)
+            self.finish_batch(project)
+        self.launch(project)
+        params = {'project': project.id, 'history': '1'}
+        before = self.client.get(API + 'runs/lookup/', params).content
+
+        archived = history_util.archive_finished_batches(timezone.now() + timedelta(days=1), 2, 100)
+        self.assertEqual(archived, 3)
+        self.assertEqual(len(self.get_runs(project)), 3)
+        self.assertEqual(self.client.get(API + 'runs/lookup/', params).content, before)
+        # without history only the live batch is read
+        response = self.client.get(API + 'runs/lookup/', {'project': project.id})
+        self.assertEqual([run['batch'] for run in response.json()], [4])
+
+    def test_download_of_archived_run(self):
+        project, sites = self.make_project('archived')
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        self.finish_batch(project)
+        history_util.archive_finished_batches(timezone.now() + timedelta(days=1), 1, 1)
+        for path in ['runs-action/download/', 'runs-action/manifest/']:
+            response = self.client.get(API + path, {'run': run.id, 'type': 'artifacts'})
+            self.assertEqual(response.status_code, 404)
+
+    def archive_uploaded_batch(self, name):
+        project, sites = self.make_project(name)
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(run, 'model.bin', b'weights')
+        self.assertEqual(usage_util.get_project_usage(project.id), 3 * len(b'weights'))
+        self.finish_batch(project)
+        with self.captureOnCommitCallbacks(execute=True):
+            history_util.archive_finished_batches(timezone.now() + timedelta(days=1), 1, 1)
+        return project, os.path.join(file_util.base_folder, str(run.id))
+
+    @override_settings(RUN_ARCHIVE_KEEP_FILES=False)
+    def test_archived_files_removed(self):
+        project, folder = self.archive_uploaded_batch('removed')
+        self.assertFalse(os.path.exists(folder))
+        self.assertEqual(usage_util.get_project_usage(project.id), 0)
+
+    def test_archived_files_kept(self):
+        project, folder = self.archive_uploaded_batch('kept')
+        self.assertTrue(os.path.exists(folder))
+        self.assertEqual(usage_util.get_project_usage(project.id), 3 * len(b'weights'))
+
+
+@override_settings(**test_settings)
+class UploadPipelineTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def test_upload_status_of_jobs(self):
+        project, sites = self.make_project('pipeline')
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs = self.upload(run, 'model.bin', b'weights')
+        self.assertEqual([job['status'] for job in jobs], ['Staged'])
+        response = self.client.get(API + 'runs-action/upload-status/', {'job': jobs[0]['id']})
+        self.assertEqual([job['status'] for job in response.json()], ['Published'])
+        response = self.client.get(API + 'runs-action/upload-status/', {'run': run.id, 'task_seq': 1, 'round_seq': 1})
+        self.assertEqual([job['id'] for job in response.json()], [jobs[0]['id']])
+
+
+@override_settings(**test_settings)
+class StorageQuotaTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def test_refused_before_files_read(self):
+        project, sites = self.make_project('quota', storage_quota=64)
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        with mock.patch('friendlyfl.router.upload_handlers.ChecksumUploadHandler.new_file') as new_file:
+            response = self.client.post(API + 'runs-action/upload/?run={}'.format(run.id), {
+                'run': run.id, 'task_seq': 1, 'round_seq': 1,
+                'artifacts': SimpleUploadedFile('model.bin', b'w' * 128)}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        new_file.assert_not_called()
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_refused_after_files_read(self):
+        project, sites = self.make_project('quota', storage_quota=64)
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        # an artifact is shared with every run of the batch
+        response = self.client.post(API + 'runs-action/upload/', {
+            'run': run.id, 'task_seq': 1, 'round_seq': 1,
+            'artifacts': SimpleUploadedFile('model.bin', b'w' * 32)}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(usage_util.get_project_usage(project.id), 0)
+
+
+@override_settings(**test_settings)
+class ChecksumTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        project, sites = self.make_project('checksums', participants=1)
+        self.launch(project)
+        self.run = self.get_runs(project)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jobs = self.upload(self.run, 'model.bin', b'weights')
+
+    def get(self, path, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(API + 'runs-action/' + path, dict(
+            {'run': self.run.id, 'type': 'artifacts', 'task_seq': 1, 'round_seq': 1}, **params), **headers)
+        response.close()
+        return response
+
+    def test_checksummed_while_uploaded(self):
+        checksum = hashlib.sha256(b'weights').hexdigest()
+        self.assertEqual(self.jobs[0]['checksum'], checksum)
+        files = self.get('manifest/').json()
+        self.assertEqual([(f['name'], f['size'], f['checksum']) for f in files], [('model.bin', 7, checksum)])
+
+    def test_not_modified_until_new_upload(self):
+        for path, params in [('download/', {}), ('manifest/', {}),
+                             ('download/', {'file': RunFile.objects.get(run=self.run).id})]:
+            response = self.get(path, **params)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            response = self.get(path, etag, **params)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get('download/', file=RunFile.objects.get(run=self.run).id)['ETag'],
+                         '"{}"'.format(hashlib.sha256(b'weights').hexdigest()))
+
+        etag = self.get('download/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(self.run, 'optimizer.bin', b'state')
+        response = self.get('download/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(**test_settings)
+class SerializeRunsTests(ApiTestMixin, TestCase):
+
+    def test_same_as_run_serializer(self):
+        project, sites = self.make_project('serialize')
+        self.launch(project)
+        runs = self.get_runs(project)
+        self.put_status(runs[1], Run.RunStatus.RUNNING)
+        self.put_status(runs[2], Run.RunStatus.PENDING_FAILED)
+        queryset = Run.objects.filter(project=project)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(serialize_runs(queryset)),
+                         renderer.render(RunSerializer(queryset, many=True).data))
+
+
+@override_settings(**test_settings)
+class LookupManyTests(ApiTestMixin, TestCase):
+
+    def test_sites_by_uids(self):
+        site = self.make_site('found')
+        missing = str(uuid.uuid4())
+        results = self.client.get(API + 'sites/lookup-many/', {'uids': ','.join([site['uid'], missing, 'bad'])}).json()
+        self.assertEqual([(result['index'], result['uid'], result['status']) for result in results],
+                         [(0, site['uid'], 'found'), (1, missing, 'not_found'), (2, 'bad', 'invalid')])
+        self.assertEqual(results[0]['site']['id'], site['id'])
+        self.assertNotIn('site', results[1])
+
+    def test_runs_by_ids(self):
+        project, sites = self.make_project('lookup-runs')
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        ids = '{}, 0,x,{}'.format(run.id, run.id)
+        # the runs with their project and participant in one query
+        with self.assertNumQueries(1):
+            results = self.client.get(API + 'runs/lookup-many/', {'ids': ids}).json()
+        self.assertEqual([result['status'] for result in results], ['found', 'not_found', 'invalid', 'found'])
+        self.assertEqual(results[0]['run'], self.client.get(API + 'runs/{}/'.format(run.id)).json())
+        self.assertEqual(results[3]['run'], results[0]['run'])
+
+    def test_projects_by_ids_or_names(self):
+        project, sites = self.make_project('lookup-projects')
+        results = self.client.get(API + 'projects/lookup-many/', {'ids': '{},0'.format(project.id)}).json()
+        self.assertEqual([(result['id'], result['status']) for result in results],
+                         [(str(project.id), 'found'), ('0', 'not_found')])
+        results = self.client.get(API + 'projects/lookup-many/', {'names': 'lookup-projects,other'}).json()
+        self.assertEqual([result['status'] for result in results], ['found', 'not_found'])
+        self.assertEqual(results[0]['project']['id'], project.id)
+
+    def test_keys_required_and_capped(self):
+        self.assertEqual(self.client.get(API + 'runs/lookup-many/').status_code, 400)
+        with override_settings(BULK_MAX_ITEMS=2):
+            self.assertEqual(self.client.get(API + 'runs/lookup-many/', {'ids': '1,2,3'}).status_code, 400)
+
+
+@override_settings(**test_settings)
+class MessagePackTests(ApiTestMixin, TestCase):
+
+    def unpack(self, response):
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        return msgpack.unpackb(response.content, ext_hook=renderers.decode_ext, timestamp=3)
+
+    def test_uuid_ext_type(self):
+        uid = uuid.uuid4()
+        packed = renderers.MessagePackRenderer().render({'uid': uid})
+        self.assertEqual(msgpack.unpackb(packed)['uid'], msgpack.ExtType(renderers.uuid_ext_type, uid.bytes))
+        parsed = renderers.MessagePackParser().parse(io.BytesIO(packed))
+        self.assertEqual(parsed, {'uid': str(uid)})
+
+    def test_negotiated_round_trip(self):
+        uid = uuid.uuid4()
+        body = msgpack.packb({'name': 'packed', 'description': 'packed', 'uid': uid}, default=renderers.encode)
+        response = self.client.post(API + 'sites/', body, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201, response.content)
+        site = self.unpack(response)
+        self.assertEqual((site['name'], site['uid']), ('packed', str(uid)))
+
+        response = self.client.get(API + 'sites/{}/'.format(site['id']), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(self.unpack(response), site)
+        # JSON stays the default
+        response = self.client.get(API + 'sites/{}/'.format(site['id']))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['uid'], str(uid))
+
+    def test_invalid_body(self):
+        response = self.client.post(API + 'sites/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(**test_settings)
+class TracingTests(ApiTestMixin, TestCase):
+    trace_id = '0af7651916cd43dd8448eb211c80319c'
+    parent_id = 'b7ad6b7169203331'
+
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.trace_file = os.path.join(folder.name, 'traces.jsonl')
+        patcher = override_settings(TRACING_EXPORTER='file', TRACING_FILE=self.trace_file, TRACING_SAMPLE_RATE=0)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        # the middleware is only loaded with tracing on
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_spans(self):
+        with open(self.trace_file) as f:
+            traces = [json.loads(line) for line in f]
+        return [span for trace in traces for span in trace['resourceSpans'][0]['scopeSpans'][0]['spans']]
+
+    def test_parse_traceparent(self):
+        header = '00-{}-{}-01'.format(self.trace_id, self.parent_id)
+        self.assertEqual(tracing.parse_traceparent(header), (self.trace_id, self.parent_id, True))
+        self.assertEqual(tracing.parse_traceparent(' ' + header.upper()), (self.trace_id, self.parent_id, True))
+        self.assertEqual(tracing.parse_traceparent(header[:-1] + '0'), (self.trace_id, self.parent_id, False))
+        for invalid in [None, '', header[1:], '01' + header[2:], '00-{}-{}-01'.format('0' * 32, self.parent_id),
+                        '00-{}-{}-01'.format(self.trace_id, '0' * 16)]:
+            self.assertIsNone(tracing.parse_traceparent(invalid))
+
+    def test_spans_continue_trace_of_caller(self):
+        project, sites = self.make_project('traced')
+        response = self.client.get(API + 'runs/lookup/', {'project': project.id},
+                                   HTTP_TRACEPARENT='00-{}-{}-01'.format(self.trace_id, self.parent_id))
+        self.assertEqual(response.status_code, 200, response.content)
+        spans = {span['spanId']: span for span in self.get_spans()}
+        self.assertEqual({span['traceId'] for span in spans.values()}, {self.trace_id})
+        root = next(span for span in spans.values() if span['parentSpanId'] == self.parent_id)
+        self.assertEqual(response['traceresponse'], '00-{}-{}-01'.format(self.trace_id, root['spanId']))
+        self.assertEqual(root['name'], 'GET /friendlyfl/api/v1/runs/lookup/')
+        view = next(span for span in spans.values() if span['name'] == 'RunViewSet.lookup_runs_by_project_id')
+        self.assertEqual(view['parentSpanId'], root['spanId'])
+        queries = [span for span in spans.values() if span['name'] == 'db.query']
+        self.assertTrue(queries)
+        # every span descends from the root of the request
+        for span in queries + [view]:
+            while span['parentSpanId'] != self.parent_id:
+                span = spans[span['parentSpanId']]
+            self.assertIs(span, root)
+
+    def test_not_sampled(self):
+        response = self.client.get(API + 'sites/', HTTP_TRACEPARENT='00-{}-{}-00'.format(self.trace_id, self.parent_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('traceresponse', response)
+        self.assertFalse(os.path.exists(self.trace_file))
+
+
+@override_settings(**test_settings)
+class ThrottleTests(ApiTestMixin, ArtifactsTestMixin, TestCase):
+
+    def heartbeat(self, site):
+        return self.client.post(API + 'sites/heartbeat/', {'uid': site['uid'], 'status': Site.SiteStatus.CONNECTED},
+                                format='json', HTTP_X_SITE_UID=site['uid'])
+
+    def test_rejected_with_retry_after(self):
+        sites = [self.make_site('site-1'), self.make_site('site-2')]
+        with override_settings(THROTTLE_RATES={'control': (0.5, 2), 'data': (0, 0)}):
+            self.assertEqual([self.heartbeat(sites[0]).status_code for _ in range(2)], [202, 202])
+            response = self.heartbeat(sites[0])
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '2')
+            # sites of the same account have buckets of their own
+            self.assertEqual(self.heartbeat(sites[1]).status_code, 202)
+
+    def test_upload_not_read_before_admitted(self):
+        project, sites = self.make_project('throttled')
+        self.launch(project)
+        run = self.get_runs(project)[0]
+        with override_settings(THROTTLE_RATES={'control': (0, 0), 'data': (0.5, 1)}), \
+                mock.patch.object(ChecksumUploadHandler, 'new_file', autospec=True,
+                                  side_effect=ChecksumUploadHandler.new_file) as new_file:
+            for code in [200, 429]:
+                response = self.client.post(API + 'runs-action/upload/?run={}'.format(run.id), {
+                    'run': run.id, 'task_seq': 1, 'round_seq': 1,
+                    'artifacts': SimpleUploadedFile('model.bin', b'weights')}, format='multipart')
+                self.assertEqual(response.status_code, code, response.content)
+        # read once, by the upload admitted
+        self.assertEqual(new_file.call_count, 1)
+        # the bucket of the site was used, not the one of the account
+        self.assertIsNotNone(cache.get('throttle:data:site-{}'.format(run.site_uid)))
+        self.assertIsNone(cache.get('throttle:data:user-{}'.format(self.admin.pk)))
+
+    def test_buckets_locked_apart(self):
+        locked, release = threading.Event(), threading.Event()
+
+        def hold():
+            with throttles.bucket_lock('throttle:control:site-1'):
+                locked.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            locked.wait(5)
+            started = time.monotonic()
+            with throttles.bucket_lock('throttle:control:site-2'):
+                pass
+            self.assertLess(time.monotonic() - started, throttles.lock_timeout / 2)
+        finally:
+            release.set()
+            thread.join()
+
+
+class ZipArchiveTests(SimpleTestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.files = {'model.txt': b'weights ' * 1000, 'model.bin': os.urandom(5000)}
+        self.paths = []
+        for name, content in self.files.items():
+            self.paths.append(os.path.join(folder.name, name))
+            with open(self.paths[-1], 'wb') as f:
+                f.write(content)
+
+    def build(self, level):
+        dest = io.BytesIO()
+        archive_util.build_archive(self.paths, dest, 'zip', level)
+        dest.seek(0)
+        return zipfile.ZipFile(dest)
+
+    def assert_round_trip(self, zip_file, compress_types):
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual({info.filename: info.compress_type for info in zip_file.infolist()}, compress_types)
+        for name, content in self.files.items():
+            self.assertEqual(zip_file.read(name), content)
+
+    def test_compressible_entries_deflated(self):
+        self.assert_round_trip(self.build(6), {'model.txt': zipfile.ZIP_DEFLATED, 'model.bin': zipfile.ZIP_STORED})
+
+    def test_level_0_stores_entries(self):
+        self.assert_round_trip(self.build(0), {'model.txt': zipfile.ZIP_STORED, 'model.bin': zipfile.ZIP_STORED})
+
+    def test_zip64_entries(self):
+        # entries past the limit get zip64 extra fields, in their local headers and in the central directory
+        with mock.patch('zipfile.ZIP64_LIMIT', 1000):
+            zip_file = self.build(6)
+            self.assert_round_trip(zip_file, {'model.txt': zipfile.ZIP_DEFLATED, 'model.bin': zipfile.ZIP_STORED})
+            for info in zip_file.infolist():
+                self.assertEqual(struct.unpack('<H', info.extra[:2])[0], 1)
+
+    def test_without_zipfile_internals(self):
+        with mock.patch.object(archive_util.PrecompressedZipFile, 'internals', ['_missing']):
+            self.assert_round_trip(self.build(6), {'model.txt': zipfile.ZIP_DEFLATED,
+                                                   'model.bin': zipfile.ZIP_STORED})
+
+
+
+@override_settings(ARCHIVE_CACHE_MAX_BYTES=10 * 1024 ** 2)
+class ArchiveCacheTests(ArtifactsTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.paths = []
+        for name in ['a.bin', 'b.bin', 'c.bin']:
+            self.paths.append(os.path.join(file_util.base_folder, name))
+            with open(self.paths[-1], 'wb') as f:
+                f.write(os.urandom(4000))
+
+    def get(self, paths, scope=None):
+        with archive_util.get_cached_archive(paths, 'zip', 0, scope) as archive:
+            return archive.name
+
+    def test_hit_until_file_changes(self):
+        with mock.patch.object(archive_util, 'build_archive', wraps=archive_util.build_archive) as build:
+            path = self.get(self.paths[:1])
+            self.assertEqual(self.get(self.paths[:1]), path)
+            self.assertEqual(build.call_count, 1)
+            stat = os.stat(self.paths[0])
+            os.utime(self.paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            modified = self.get(self.paths[:1])
+            self.assertNotEqual(modified, path)
+            with open(self.paths[0], 'ab') as f:
+                f.write(b'more')
+            self.assertNotIn(self.get(self.paths[:1]), [path, modified])
+            self.assertEqual(build.call_count, 3)
+
+    def test_least_recently_used_evicted(self):
+        archives = [self.get(self.paths[i:i + 1]) for i in range(2)]
+        for mtime, archive in enumerate(archives):
+            os.utime(archive, (mtime, mtime))
+        # read again, the second archive is now the least recently used
+        self.assertEqual(self.get(self.paths[:1]), archives[0])
+        size = os.path.getsize(archives[0])
+        with override_settings(ARCHIVE_CACHE_MAX_BYTES=2 * size + size // 2):
+            newest = self.get(self.paths[2:])
+        self.assertTrue(os.path.exists(archives[0]))
+        self.assertFalse(os.path.exists(archives[1]))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_invalidated_by_uploads_in_scope(self):
+        scoped = self.get(self.paths[:1], {'runs': [1, 2], 'task_seq': 1, 'round_seq': 1})
+        unscoped = self.get(self.paths[1:2])
+        archive_util.invalidate_archives([3], 1, 1)
+        archive_util.invalidate_archives([2], 1, 2)
+        self.assertTrue(os.path.exists(scoped))
+        self.assertFalse(os.path.exists(unscoped))
+        archive_util.invalidate_archives([2], 1, 1)
+        self.assertFalse(os.path.exists(scoped))
+        self.assertEqual(os.listdir(archive_util.get_cache_folder()), [])
+
+class ProfilingTests(SimpleTestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        patcher = override_settings(PROFILING_ENABLED=True, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0,
+                                    PROFILING_DIR=folder.name, PROFILING_MAX_PROFILES=2)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.middleware = profiling.ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def get(self, **headers):
+        return self.middleware(RequestFactory().get('/friendlyfl/api/v1/runs/', **headers))
+
+    def test_profiled_with_token_or_sampled(self):
+        self.assertNotIn('X-Profile-Id', self.get())
+        self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE_TOKEN='wrong'))
+        response = self.get(HTTP_X_PROFILE_TOKEN='secret')
+        self.assertRegex(response['X-Profile-Id'], profiling.profile_id_pattern)
+        profile = profiling.load_profile(response['X-Profile-Id'])
+        self.assertEqual((profile['method'], profile['path'], profile['status']),
+                         ('GET', '/friendlyfl/api/v1/runs/', 200))
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            self.assertIn('X-Profile-Id', self.get())
+
+    def test_oldest_profiles_dropped(self):
+        ids = [self.get(HTTP_X_PROFILE_TOKEN='secret')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(profiling.list_profile_ids(), ids[:0:-1])
+        self.assertIsNone(profiling.load_profile(ids[0]))
+
+    def test_only_profile_ids_read(self):
+        profile_id = self.get(HTTP_X_PROFILE_TOKEN='secret')['X-Profile-Id']
+        self.assertIsNotNone(profiling.get_profile_path(profile_id, '.prof'))
+        for bad_id in ['../' + profile_id, profile_id.upper(), profile_id[1:]]:
+            self.assertIsNone(profiling.get_profile_path(bad_id, '.json'))
+
+    def test_requests_profiled_meanwhile_served_unprofiled(self):
+        inner = []
+
+        def get_response(request):
+            # a request of another thread of the worker while this one is profiled
+            thread = threading.Thread(target=lambda: inner.append(self.get(HTTP_X_PROFILE_TOKEN='secret')))
+            thread.start()
+            thread.join()
+            return HttpResponse('ok')
+
+        outer = profiling.ProfilingMiddleware(get_response)(
+            RequestFactory().get('/friendlyfl/api/v1/runs/', HTTP_X_PROFILE_TOKEN='secret'))
+        self.assertIn('X-Profile-Id', outer)
+        self.assertEqual(inner[0].status_code, 200)
+        self.assertNotIn('X-Profile-Id', inner[0])
+        self.assertIn('X-Profile-Id', self.get(HTTP_X_PROFILE_TOKEN='secret'))
+
+
+@override_settings(SERVE_DATA_PLANE_CONCURRENCY=1, SERVE_DATA_PLANE_QUEUE=0, SERVE_DATA_PLANE_QUEUE_TIMEOUT=1)
+class DataPlaneLimitTests(SimpleTestCase):
+
+    def setUp(self):
+        self.middleware = concurrency.DataPlaneLimitMiddleware(
+            lambda request: FileResponse(io.BytesIO(b'weights' * 1000)))
+        self.download = RunsActionViewSet.as_view({'get': 'download'})
+
+    def get(self):
+        request = RequestFactory().get('/friendlyfl/api/v1/runs-action/download/')
+        return self.middleware.process_view(request, self.download, (), {}) or self.middleware(request)
+
+    def test_only_data_plane_marked(self):
+        self.assertTrue(concurrency.is_data_plane(self.download, 'GET'))
+        self.assertTrue(concurrency.is_data_plane(RunsActionViewSet.as_view({'post': 'upload'}), 'POST'))
+        self.assertFalse(concurrency.is_data_plane(RunsActionViewSet.as_view({'get': 'upload_status'}), 'GET'))
+
+    def test_refused_once_slots_taken(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        refused = self.get()
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused['Retry-After'], '1')
+        response.close()
+
+    def test_slot_released_once_streamed(self):
+        response = self.get()
+        self.assertEqual(b''.join(response.streaming_content), b'weights' * 1000)
+        self.assertEqual(self.get().status_code, 503)
+        response.close()
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    """
+    Run the load commands with tiny counts against SQLite in a process of their own, they set up their test database.
+    """
+
+    def run_command(self, name, *args):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        output = os.path.join(folder.name, name + '.json')
+        env = dict(os.environ, DATABASE_ENGINE='django.db.backends.sqlite3',
+                   DATABASE_NAME=os.path.join(folder.name, 'db.sqlite3'))
+        result = subprocess.run([sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), name, *args,
+                                 '--output', output], env=env, capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(output) as f:
+            return json.load(f)
+
+    def test_benchmark(self):
+        results = self.run_command('benchmark', '--sites', '2', '--projects', '1', '--batches', '2',
+                                   '--iterations', '2', '--warmup', '0', '--micro-iterations', '2',
+                                   '--serialize-iterations', '1', '--file-size', '1024')
+        self.assertEqual(results['meta']['database'], 'sqlite')
+        for name, summary in results['endpoints'].items():
+            self.assertEqual((summary['count'], summary.get('errors', 0)), (2, 0), name)
+        self.assertTrue(results['micro'])
+
+    def test_simulate_federation(self):
+        results = self.run_command('simulate_federation', '--controllers', '2', '--batches', '1', '--rounds', '2',
+                                   '--file-size', '1024', '--heartbeat-interval', '0.2')
+        self.assertEqual(results['rounds'], 2)
+        for name, summary in results['endpoints'].items():
+            self.assertEqual(summary['errors'], 0, name)
 
-# Create your tests here.
@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from friendlyfl.utils.lookup_util import get_site_uid
+
+# seconds a bucket stays locked at most, should its holder die
+lock_timeout = 1
+# locks of the buckets used by the threads of the worker
+_locks = {}
+_locks_guard = threading.Lock()
+max_locks = 10000
+
+
+def get_thread_lock(key):
+    with _locks_guard:
+        if key not in _locks and len(_locks) >= max_locks:
+            _locks.clear()
+        return _locks.setdefault(key, threading.Lock())
+
+
+@contextmanager
+def bucket_lock(key):
+    """
+    Hold the bucket while it is read and written back: a lock of the bucket covers the threads of the worker with any
+    backend, cache.add is atomic across workers in memcached and redis. Only requests of the same bucket wait for each
+    other, and go on unlocked rather than wait for a stuck lock.
+    """
+    lock_key = key + ':lock'
+    deadline = time.monotonic() + lock_timeout
+    thread_lock = get_thread_lock(key)
+    locked = thread_lock.acquire(timeout=lock_timeout)
+    try:
+        acquired = cache.add(lock_key, 1, timeout=lock_timeout)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.001)
+            acquired = cache.add(lock_key, 1, timeout=lock_timeout)
+        try:
+            yield
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+    finally:
+        if locked:
+            thread_lock.release()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Admit requests while the bucket of the requester has tokens, buckets refill at the rate of the scope
+    up to its burst. Buckets are kept in the cache so that all the workers share them.
+    """
+    scope = None
+
+    def get_rate(self):
+        """
+        Tokens added per second and size of the bucket.
+        """
+        return settings.THROTTLE_RATES[self.scope]
+
+    def get_cache_key(self, request, view):
+        # controllers of all sites may share one account, so the site comes first. Told by the header, query or path
+        # only: the body of an upload is not read before it is admitted
+        site_uid = get_site_uid(request, view)
+        if site_uid:
+            ident = 'site-{}'.format(site_uid)
+        elif request.user and request.user.is_authenticated:
+            ident = 'user-{}'.format(request.user.pk)
+        else:
+            ident = 'ip-{}'.format(self.get_ident(request))
+        return 'throttle:{}:{}'.format(self.scope, ident)
+
+    def allow_request(self, request, view):
+        rate, burst = self.get_rate()
+        if rate <= 0:
+            return True
+        key = self.get_cache_key(request, view)
+        with bucket_lock(key):
+            now = time.time()
+            tokens, updated_at = cache.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # an idle bucket is full again once it expires
+            cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+        self.wait_seconds = 0 if allowed else (1 - tokens) / rate
+        if not allowed:
+            count_rejection(self.scope)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ControlPlaneThrottle(TokenBucketThrottle):
+    """
+    Heartbeats, status updates and polling of runs.
+    """
+    scope = 'control'
+
+
+class DataPlaneThrottle(TokenBucketThrottle):
+    """
+    Uploads and downloads of files.
+    """
+    scope = 'data'
+
+
+def count_rejection(scope):
+    key = 'throttle-rejections:{}'.format(scope)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted in between
+        cache.set(key, 1, timeout=None)
+
+
+def get_rejections():
+    return {scope: cache.get('throttle-rejections:{}'.format(scope), 0) for scope in settings.THROTTLE_RATES}
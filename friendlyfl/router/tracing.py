@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# span the spans started now are children of, None outside of traced requests
+current_span = ContextVar('current_span', default=None)
+
+traceparent_pattern = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """
+    A timed operation of a trace, the spans of a trace are exported together when its local root ends.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, kind=SPAN_KIND_INTERNAL, attributes=None, finished=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        # spans of the trace ended in this process, shared with the children
+        self.finished = [] if finished is None else finished
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        self.finished.append(self)
+
+    def get_traceparent(self):
+        return '00-{}-{}-01'.format(self.trace_id, self.span_id)
+
+
+def parse_traceparent(header):
+    """
+    Return the trace id, parent span id and whether the caller sampled the trace, None for a missing or invalid header.
+    """
+    match = traceparent_pattern.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+@contextmanager
+def start_span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """
+    Trace the block as a child of the current span, does nothing outside of traced requests.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = Span(name, parent.trace_id, parent.span_id, kind, attributes, parent.finished)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = STATUS_ERROR
+        span.set_attribute('exception.type', type(e).__name__)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+
+
+@contextmanager
+def start_trace(name, traceparent=None, kind=SPAN_KIND_INTERNAL, **attributes):
+    """
+    Start the local root span of a trace, continuing the trace of traceparent if there is one,
+    and export the spans of the trace when it ends. Does nothing when tracing is off or the trace is not sampled.
+    """
+    exporter = get_exporter()
+    context = parse_traceparent(traceparent) if isinstance(traceparent, str) else traceparent
+    if context:
+        trace_id, parent_id, sampled = context
+    else:
+        trace_id, parent_id = '{:032x}'.format(random.getrandbits(128)), None
+        sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    if exporter is None or not sampled:
+        yield None
+        return
+    span = Span(name, trace_id, parent_id, kind, attributes)
+    token = current_span.set(span)
+    try:
+        with trace_queries():
+            yield span
+    except BaseException as e:
+        span.status = STATUS_ERROR
+        span.set_attribute('exception.type', type(e).__name__)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+        exporter.export(span.finished)
+
+
+def get_context():
+    """
+    Context to continue the current trace in another thread with start_trace, None outside of traced requests.
+    """
+    span = current_span.get()
+    return (span.trace_id, span.span_id, True) if span else None
+
+
+@contextmanager
+def trace_queries():
+    """
+    Add a span for every query made on the database connections of this thread.
+    """
+
+    def wrapper(execute, sql, params, many, context):
+        with start_span('db.query', SPAN_KIND_CLIENT, **{
+            'db.system': context['connection'].vendor,
+            'db.name': context['connection'].alias,
+            'db.statement': sql,
+        }):
+            return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+def encode_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def encode_spans(spans):
+    """
+    Encode spans as an OTLP/JSON export request.
+    """
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': encode_value(settings.TRACING_SERVICE_NAME)}]},
+        'scopeSpans': [{
+            'scope': {'name': 'friendlyfl'},
+            'spans': [{
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': span.kind,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': key, 'value': encode_value(value)}
+                               for key, value in span.attributes.items() if value is not None],
+                'status': {'code': span.status},
+            } for span in spans],
+        }],
+    }]}
+
+
+class FileExporter:
+    """
+    Append every trace to a file as one OTLP/JSON line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        line = json.dumps(encode_spans(spans))
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class OtlpHttpExporter:
+    """
+    Send traces to an OTLP/HTTP collector from a background thread, traces are dropped if the collector falls behind.
+    """
+
+    def __init__(self, endpoint):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.queue = queue.Queue(maxsize=settings.TRACING_QUEUE_SIZE)
+        threading.Thread(target=self.send_all, name='trace-exporter', daemon=True).start()
+
+    def export(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            logger.debug('Trace queue full, dropped %s spans', len(spans))
+
+    def send_all(self):
+        while True:
+            spans = self.queue.get()
+            # send the traces queued meanwhile along
+            while len(spans) < settings.TRACING_BATCH_SIZE:
+                try:
+                    spans = spans + self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            request = urllib.request.Request(self.url, data=json.dumps(encode_spans(spans)).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(request, timeout=settings.TRACING_EXPORT_TIMEOUT).close()
+            except OSError as e:
+                logger.debug('Failed to export %s spans: %s', len(spans), e)
+
+
+_exporter = None
+_exporter_config = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """
+    Exporter configured by TRACING_EXPORTER, None when tracing is off. Made again in every process: workers forked
+    from a preloaded server master inherit its exporter but not the thread sending the traces.
+    """
+    global _exporter, _exporter_config
+    config = (os.getpid(), settings.TRACING_EXPORTER, settings.TRACING_FILE, settings.TRACING_OTLP_ENDPOINT)
+    if _exporter_config != config:
+        with _exporter_lock:
+            if _exporter_config != config:
+                if settings.TRACING_EXPORTER == 'file':
+                    os.makedirs(os.path.dirname(settings.TRACING_FILE) or '.', exist_ok=True)
+                    _exporter = FileExporter(settings.TRACING_FILE)
+                elif settings.TRACING_EXPORTER == 'otlp':
+                    _exporter = OtlpHttpExporter(settings.TRACING_OTLP_ENDPOINT)
+                else:
+                    _exporter = None
+                _exporter_config = config
+    return _exporter
+
+
+class TracingMiddleware:
+    """
+    Trace requests, continuing the trace of the `traceparent` header sent by controllers.
+    Not loaded at all unless TRACING_EXPORTER is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRACING_EXPORTER:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with start_trace(request.method, request.headers.get('traceparent'), SPAN_KIND_SERVER, **{
+            'http.method': request.method,
+            'http.target': request.path,
+        }) as span:
+            response = self.get_response(request)
+            if span:
+                match = request.resolver_match
+                if match:
+                    # routes of the DRF router are regular expressions
+                    route = '/' + match.route.lstrip('^').rstrip('$')
+                    span.name = '{} {}'.format(request.method, route)
+                    span.set_attribute('http.route', route)
+                span.set_attribute('http.status_code', response.status_code)
+                if response.status_code >= 500:
+                    span.status = STATUS_ERROR
+                response['traceresponse'] = span.get_traceparent()
+        return response
+
+
+class TracingMixin:
+    """
+    Trace the handling of every request by the view, named after the view and its action.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if current_span.get() is None:
+            return super().dispatch(request, *args, **kwargs)
+        action = getattr(self, 'action_map', {}).get(request.method.lower(), request.method.lower())
+        with start_span('{}.{}'.format(type(self).__name__, action), **{
+            'code.namespace': type(self).__module__,
+            'code.function': action,
+        }):
+            return super().dispatch(request, *args, **kwargs)
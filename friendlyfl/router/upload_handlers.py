@@ -0,0 +1,33 @@
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class ChecksumUploadHandler(FileUploadHandler):
+    """
+    Compute the sha256 of the uploaded files while they stream to the handlers saving them, so that they are not read
+    again to checksum them. The digests are left in `request.upload_checksums` by field name.
+    Must come before the handlers saving the files in FILE_UPLOAD_HANDLERS.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.checksums = {}
+        self.digest = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.checksums[self.field_name] = self.digest.hexdigest()
+        # the next handlers return the file
+        return None
+
+    def upload_complete(self):
+        if self.request is not None:
+            self.request.upload_checksums = self.checksums
@@ -0,0 +1,197 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction, connection
+from django.db.models import F
+from django.utils import timezone
+
+from friendlyfl.router import tracing
+from friendlyfl.router.models import Project, ProjectParticipant, Run, StorageUsage, UploadJob, RunFile
+from friendlyfl.utils import usage_util, archive_util, barrier_util
+from friendlyfl.utils.file_util import generate_url, gen_unique_file_name, get_file_checksum
+
+logger = logging.getLogger(__name__)
+
+run_file_fields = {
+    StorageUsage.FileType.ARTIFACTS: 'artifacts',
+    StorageUsage.FileType.LOGS: 'logs',
+    StorageUsage.FileType.MID_ARTIFACTS: 'middle_artifacts',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.UPLOAD_PIPELINE_WORKERS, thread_name_prefix='upload-pipeline')
+    return _executor
+
+
+def submit(job_ids):
+    """
+    Publish the staged jobs once the current transaction commits,
+    in the worker pool unless the pipeline is configured to run inline.
+    """
+
+    # the jobs are published as part of the trace of the upload
+    trace_context = tracing.get_context()
+
+    def dispatch():
+        for job_id in job_ids:
+            if settings.UPLOAD_PIPELINE_ASYNC:
+                get_executor().submit(run_in_worker, job_id, trace_context)
+            else:
+                with tracing.start_span('upload_pipeline.process_job', job_id=job_id):
+                    process_job(job_id)
+
+    transaction.on_commit(dispatch)
+
+
+def run_in_worker(job_id, trace_context=None):
+    try:
+        if trace_context:
+            with tracing.start_trace('upload_pipeline.process_job', trace_context, job_id=job_id):
+                process_job(job_id)
+        else:
+            process_job(job_id)
+    finally:
+        # connections are per thread, close it rather than keep one open per worker
+        connection.close()
+
+
+def process_job(job_id):
+    """
+    Checksum the staged file unless it was checksummed while uploaded, copy artifacts to the other runs
+    of the batch and append the file to the runs' file lists. Runs having the file already are skipped,
+    so that jobs reclaimed or failed halfway can be processed again.
+    """
+    # claim the job first so that it is published only once
+    claimed = UploadJob.objects.filter(id=job_id, status=UploadJob.JobStatus.STAGED).update(
+        status=UploadJob.JobStatus.PROCESSING, attempts=F('attempts') + 1, updated_at=timezone.now())
+    if not claimed:
+        return
+    job = UploadJob.objects.select_related('run').get(id=job_id)
+    try:
+        if not job.checksum:
+            job.checksum = get_file_checksum(job.path)
+        run_ids = [job.run_id]
+        if job.file_type == StorageUsage.FileType.ARTIFACTS:
+            run_ids += fan_out(job)
+        if not has_file(job.run_id, job):
+            append_file(job.run_id, job, job.path)
+        archive_util.invalidate_archives(
+            run_ids, job.task_seq, job.round_seq)
+        job.status = UploadJob.JobStatus.PUBLISHED
+    except Exception as e:
+        logger.exception('Failed to publish upload job %s', job_id)
+        job.status = UploadJob.JobStatus.FAILED
+        job.error = str(e)
+    job.save()
+    if job.status == UploadJob.JobStatus.PUBLISHED:
+        update_barrier(job)
+
+
+def update_barrier(job):
+    """
+    The run of the job arrives at the round barrier once its uploads of the round are published.
+    """
+    with transaction.atomic():
+        Project.objects.select_for_update().filter(id=job.run.project_id).first()
+        run = Run.objects.get(id=job.run_id)
+        if run.status == Run.RunStatus.PENDING_SUCCESS and run.cur_seq == job.task_seq \
+                and run.get_round_seq() == job.round_seq:
+            barrier_util.update_barrier(run)
+
+
+def fan_out(job):
+    """
+    Copy the staged artifacts to every other run of the same batch, returns the ids of the runs.
+    """
+    run = job.run
+    runs = Run.objects.filter(
+        project_id=run.project_id, batch=run.batch).exclude(id=run.id)
+    for r in runs:
+        if not has_file(r.id, job):
+            copy_file(job, r)
+            # still making progress, the job is not reclaimed
+            UploadJob.objects.filter(id=job.id).update(updated_at=timezone.now())
+    return [r.id for r in runs]
+
+
+def has_file(run_id, job):
+    """
+    Whether the file of the job was published to the run already.
+    """
+    return RunFile.objects.filter(
+        run_id=run_id, file_type=job.file_type, task_seq=job.task_seq, round_seq=job.round_seq,
+        name=job.name, checksum=job.checksum).exists()
+
+
+def reclaim_jobs():
+    """
+    Stage again the jobs processing without progress for over UPLOAD_PIPELINE_LEASE_SECONDS and the failed jobs tried
+    fewer than UPLOAD_PIPELINE_MAX_ATTEMPTS times. Returns the number of jobs staged again.
+    """
+    now = timezone.now()
+    stalled = UploadJob.objects.filter(
+        status=UploadJob.JobStatus.PROCESSING,
+        updated_at__lt=now - timedelta(seconds=settings.UPLOAD_PIPELINE_LEASE_SECONDS))
+    failed = UploadJob.objects.filter(
+        status=UploadJob.JobStatus.FAILED, attempts__lt=settings.UPLOAD_PIPELINE_MAX_ATTEMPTS)
+    return stalled.update(status=UploadJob.JobStatus.STAGED, updated_at=now) + \
+        failed.update(status=UploadJob.JobStatus.STAGED, error='', updated_at=now)
+
+
+def share_global_artifacts(run, runs):
+    """
+    Copy the artifacts of the last round the coordinator of the batch of run got any, the model the batch goes on
+    from, to runs added to the batch after they were published.
+    """
+    last = RunFile.objects.filter(
+        run__project_id=run.project_id, run__batch=run.batch, run__role=ProjectParticipant.Role.COORDINATOR,
+        file_type=StorageUsage.FileType.ARTIFACTS).order_by('-task_seq', '-round_seq').first()
+    if last is None:
+        return
+    run_files = list(RunFile.objects.filter(
+        run_id=last.run_id, file_type=last.file_type, task_seq=last.task_seq, round_seq=last.round_seq))
+    for r in runs:
+        for run_file in run_files:
+            copy_file(run_file, r)
+
+
+def copy_file(source, run):
+    """
+    Copy the file of source, an upload job or a published run file, to the run.
+    """
+    with tracing.start_span('upload_pipeline.copy_file', run_id=run.id):
+        url = generate_url(run.id, source.task_seq, source.round_seq)
+        with open(source.path, 'rb') as f, tracing.start_span('storage.save', file_name=source.name, size=source.size):
+            file_name = FileSystemStorage(url).save(
+                gen_unique_file_name(source.name, run.id, source.task_seq, source.round_seq), File(f))
+        append_file(run.id, source, url + file_name)
+        usage_util.record_usage(
+            run, source.file_type, source.task_seq, source.round_seq, source.size)
+
+
+def append_file(run_id, job, path):
+    """
+    Append the copy of the job's file at path to the file list of the run, and record it with its checksum.
+    The job may also be the run file it was copied from.
+    """
+    with transaction.atomic():
+        run = Run.objects.select_for_update().get(id=run_id)
+        getattr(run, run_file_fields[job.file_type]).append(path)
+        with tracing.start_span('run.save', run_id=run_id):
+            run.save()
+        RunFile.objects.create(
+            run_id=run_id, file_type=job.file_type, task_seq=job.task_seq, round_seq=job.round_seq,
+            name=job.name, path=path, size=job.size, checksum=job.checksum)
@@ -1,10 +1,10 @@
 from uuid import UUID
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.core.files.storage import FileSystemStorage
 from django.db import transaction, DatabaseError
-from django.http import HttpResponse
-from django.utils import timezone
+from django.http import FileResponse
 from rest_framework import permissions
 from rest_framework import status
 from rest_framework import viewsets, mixins, generics
@@ -13,14 +13,24 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 
-from friendlyfl.router.models import Site, Project, ProjectParticipant, Run
+from friendlyfl.router import upload_pipeline
+from friendlyfl.router.concurrency import data_plane
+from friendlyfl.router.db_router import ReplicaRoutingMixin
+from friendlyfl.router.models import Site, Project, ProjectParticipant, Run, StorageUsage, UploadJob, \
+    RoundDuration, BatchLaunch
 from friendlyfl.router.serializers import SiteSerializer, \
     ProjectSerializer, ProjectParticipantSerializer, \
     ProjectParticipantCreateSerializer, RunSerializer, \
-    RunRetrieveSerializer
+    RunRetrieveSerializer, StorageUsageSerializer, UploadJobSerializer, \
+    BatchLaunchSerializer, RunFileSerializer, serialize_runs
 from friendlyfl.router.serializers import UserSerializer, GroupSerializer
-from friendlyfl.utils import display_util
-from ..utils.file_util import generate_url, get_file_urls, zip_all_files, gen_unique_file_name
+from friendlyfl.router import profiling
+from friendlyfl.router.profiling import timed_io
+from friendlyfl.router.throttles import ControlPlaneThrottle, DataPlaneThrottle, get_rejections
+from friendlyfl.router.tracing import TracingMixin, start_span
+from friendlyfl.utils import display_util, usage_util, archive_util, history_util, enrollment_util, \
+    straggler_util, barrier_util, participation_util, launch_util, manifest_util, telemetry_util, lookup_util
+from ..utils.file_util import generate_url, get_file_urls, archive_all_files, gen_unique_file_name
 
 
 def validate_uuid4(uuid_string):
@@ -44,7 +54,7 @@ def validate_uuid4(uuid_string):
     return True
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(TracingMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
@@ -53,7 +63,7 @@ class UserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(TracingMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
@@ -62,7 +72,7 @@ class GroupViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class SiteViewSet(viewsets.ModelViewSet):
+class SiteViewSet(TracingMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -70,10 +80,29 @@ class SiteViewSet(viewsets.ModelViewSet):
     queryset = Site.objects.all()
     serializer_class = SiteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ['list', 'retrieve', 'lookup_sites_by_uid', 'lookup_sites_by_uids', 'get_capacity']
+    # a stale site status is harmless, heartbeats must not keep sites on the primary
+    sticky_exempt_actions = ['heartbeat']
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['POST'], url_path='bulk')
+    def bulk_register(self, request):
+        """
+        Register many sites at once, `sites` is a list of sites with name, description and uid.
+        Returns the status of every site: created, exists (same name and uid), conflict or invalid.
+        """
+        items = request.data.get('sites', None)
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return Response("sites must be a list of sites", status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_MAX_ITEMS:
+            return Response("At most {} sites per request".format(settings.BULK_MAX_ITEMS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        results = enrollment_util.register_sites(items, request.user)
+        created = any(result['status'] == 'created' for result in results)
+        return Response(results, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET'], url_path='lookup')
     def lookup_sites_by_uid(self, request):
         """
@@ -89,14 +118,39 @@ class SiteViewSet(viewsets.ModelViewSet):
         serializer = SiteSerializer(queryset)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['POST'], url_path='heartbeat')
+    @action(detail=False, methods=['GET'], url_path='lookup-many')
+    def lookup_sites_by_uids(self, request):
+        """
+        Look up many sites by their comma separated `uids` with one query.
+        Returns one result per uid, in order: its status (found, not_found or invalid) and the site.
+        """
+        keys = lookup_util.split_param(request.GET.get('uids', None))
+        if not keys:
+            return Response("Site uids not provided", status=status.HTTP_400_BAD_REQUEST)
+        if len(keys) > settings.BULK_MAX_ITEMS:
+            return Response("At most {} sites per request".format(settings.BULK_MAX_ITEMS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(lookup_util.lookup_many(
+            keys, Site.objects.all(), 'uid', SiteSerializer, 'uid', 'site', lookup_util.parse_uid))
+
+    @action(detail=False, methods=['GET'], url_path='capacity')
+    def get_capacity(self, request):
+        """
+        Capacity of the fleet from the telemetry of the sites: averages of every site, whether it is overloaded,
+        and the number and throughput of the connected and available sites.
+        """
+        return Response(telemetry_util.get_fleet_capacity())
+
+    @action(detail=False, methods=['POST'], url_path='heartbeat', throttle_classes=[ControlPlaneThrottle])
     def heartbeat(self, request):
         """
-        Sync heartbeat
+        Sync heartbeat, optionally with the `telemetry` of the site: cpu and memory use as fractions,
+        queue of tasks waiting to run and throughput in samples per second
         """
 
         uid_param = request.data.get('uid', None)
         status_param = request.data.get('status', None)
+        telemetry_param = request.data.get('telemetry', None)
 
         if not validate_uuid4(uid_param):
             return Response("Invalid uid", status=status.HTTP_400_BAD_REQUEST)
@@ -104,17 +158,25 @@ class SiteViewSet(viewsets.ModelViewSet):
         if not status_param in Site.SiteStatus:
             return Response("Status not supported", status=status.HTTP_400_BAD_REQUEST)
 
+        sample = None
+        if telemetry_param is not None:
+            sample, error = telemetry_util.parse_telemetry(telemetry_param)
+            if error:
+                return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             with transaction.atomic():
                 site = Site.objects.select_for_update().get(uid=uid_param)
                 site.status = status_param
+                if sample:
+                    telemetry_util.append_sample(site, sample)
                 site.save()
             return Response(status=status.HTTP_202_ACCEPTED)
         except DatabaseError:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(TracingMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -122,6 +184,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ['list', 'retrieve', 'lookup_projects_by_site_id', 'lookup_projects_by_ids']
 
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, partial=True)
@@ -155,8 +218,28 @@ class ProjectViewSet(viewsets.ModelViewSet):
             serializer = ProjectSerializer(queryset, many=False)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['GET'], url_path='lookup-many')
+    def lookup_projects_by_ids(self, request):
+        """
+        Look up many projects by their comma separated `ids`, or `names`, with one query.
+        Returns one result per id or name, in order: its status (found, not_found or invalid) and the project.
+        """
+        if request.GET.get('ids', None):
+            keys = lookup_util.split_param(request.GET['ids'])
+            field, key_name, parse = 'id', 'id', lookup_util.parse_id
+        else:
+            keys = lookup_util.split_param(request.GET.get('names', None))
+            field, key_name, parse = 'name', 'name', None
+        if not keys:
+            return Response("Project ids or names not provided", status=status.HTTP_400_BAD_REQUEST)
+        if len(keys) > settings.BULK_MAX_ITEMS:
+            return Response("At most {} projects per request".format(settings.BULK_MAX_ITEMS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(lookup_util.lookup_many(
+            keys, Project.objects.all(), field, ProjectSerializer, key_name, 'project', parse))
 
-class ProjectParticipantViewSet(viewsets.ModelViewSet):
+
+class ProjectParticipantViewSet(TracingMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -165,6 +248,7 @@ class ProjectParticipantViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectParticipantSerializer
     create_serializer_class = ProjectParticipantCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ['list', 'retrieve', 'get_participants_by_project']
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -175,6 +259,27 @@ class ProjectParticipantViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['POST'], url_path='bulk')
+    def bulk_enroll(self, request):
+        """
+        Enroll many sites as participants of a project, `sites` is a list of site ids.
+        Returns the status of every site: enrolled, exists or not_found.
+        """
+        project_id = request.data.get('project', None)
+        site_ids = request.data.get('sites', None)
+        if not isinstance(site_ids, list) or not all(isinstance(site_id, int) for site_id in site_ids):
+            return Response("sites must be a list of site ids", status=status.HTTP_400_BAD_REQUEST)
+        if len(site_ids) > settings.BULK_MAX_ITEMS:
+            return Response("At most {} sites per request".format(settings.BULK_MAX_ITEMS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        project = Project.objects.filter(id=project_id).first() if project_id else None
+        if not project:
+            return Response("Project not found", status=status.HTTP_404_NOT_FOUND)
+        results = enrollment_util.enroll_sites(
+            project, site_ids, request.data.get('notes', ''))
+        created = any(result['status'] == 'enrolled' for result in results)
+        return Response(results, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET'], url_path='lookup')
     def get_participants_by_project(self, request):
         """
@@ -187,7 +292,8 @@ class ProjectParticipantViewSet(viewsets.ModelViewSet):
         return Response(participants_data)
 
 
-class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+class RunViewSet(TracingMixin, ReplicaRoutingMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                 mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
@@ -196,6 +302,10 @@ class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.List
     serializer_class = RunSerializer
     retrieve_serializer_class = RunRetrieveSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # controllers poll the runs, status updates and polling share the control plane budget
+    throttle_classes = [ControlPlaneThrottle]
+    replica_actions = ['list', 'retrieve', 'lookup_runs_by_project_id', 'retrieve_many',
+                       'get_active_runs', 'get_runs_details', 'get_round_durations']
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -226,8 +336,10 @@ class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.List
         project_id = run.project.id
         if not run:
             return Response("Run not found", status=status.HTTP_400_BAD_REQUEST)
-        if state is None:
+        # form and msgpack bodies may send the status as a string
+        if state is None or not str(state).isdigit():
             return Response("status is invalid", status=status.HTTP_400_BAD_REQUEST)
+        state = int(state)
 
         with transaction.atomic():
             project = Project.objects.select_for_update().get(id=project_id)
@@ -248,11 +360,23 @@ class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.List
                         else:
                             if run.cur_seq < len(run.tasks):
                                 runs.update(cur_seq=run.cur_seq + 1)
-                runs.update(status=state)
+                runs.update(status=state, **straggler_util.round_start_changes(state))
+                run = Run.objects.get(id=run.id)
+                if increase_round and state == Run.RunStatus.STANDBY:
+                    upload_pipeline.share_global_artifacts(run, participation_util.attach_late_joiners(run))
+                barrier_util.update_barrier(run)
             else:
                 run = self.get_with_lock()
-                run = Run.update_status(run, state)
-                run.save()
+                # the run of the coordinator may have been moved on by the barrier already
+                if run.status != state:
+                    arrivals_changed = bool({run.status, state} & set(barrier_util.counted_statuses))
+                    run = Run.update_status(run, state)
+                    run.save()
+                    if arrivals_changed:
+                        barrier_util.update_barrier(run)
+            # an ended batch frees a slot for the queued launches
+            if state in launch_util.ended_statuses:
+                launch_util.admit_queued_launches(project_id)
             return Response(status=status.HTTP_202_ACCEPTED)
 
     def get_with_lock(self, queryset=None):
@@ -262,26 +386,80 @@ class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.List
     @action(detail=False, methods=['GET'], url_path='lookup')
     def lookup_runs_by_project_id(self, request):
         """
-        Look up runs by project id.
+        Look up runs by project id, with the archived runs of the batch or, with `history=1`, of all batches.
         """
         site_uid = request.GET.get('site_uid', None)
         project_id = request.GET.get('project', None)
         batch_id = request.GET.get('batch_id', None)
+        history = request.GET.get('history', '0') == '1'
         if batch_id:
             queryset = Run.objects.filter(
                 project_id=project_id, batch=batch_id)
         else:
             queryset = Run.objects.filter(project_id=project_id)
-        serializer = RunSerializer(queryset, many=True)
-        dic = display_util.sort_runs(serializer.data, site_uid=site_uid)
+        runs = serialize_runs(queryset)
+        # finished batches may have been moved to the run archive, read only for a batch or when asked
+        if batch_id or history:
+            runs = history_util.get_archived_runs(project_id, batch_id or None) + runs
+        dic = display_util.sort_runs(runs, site_uid=site_uid)
         return Response(dic)
 
+    @action(detail=False, methods=['GET'], url_path='lookup-many')
+    def retrieve_many(self, request):
+        """
+        Retrieve many runs by their comma separated `ids` with one query, serialized as by retrieve.
+        Returns one result per id, in order: its status (found, not_found or invalid) and the run.
+        """
+        keys = lookup_util.split_param(request.GET.get('ids', None))
+        if not keys:
+            return Response("Run ids not provided", status=status.HTTP_400_BAD_REQUEST)
+        if len(keys) > settings.BULK_MAX_ITEMS:
+            return Response("At most {} runs per request".format(settings.BULK_MAX_ITEMS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        queryset = Run.objects.select_related('project', 'participant__site', 'participant__project')
+        return Response(lookup_util.lookup_many(
+            keys, queryset, 'id', self.retrieve_serializer_class, 'id', 'run', lookup_util.parse_id))
+
     @action(detail=False, methods=['GET'], url_path='active')
     def get_active_runs(self, request):
         queryset = Run.objects.exclude(
             status__in=[Run.RunStatus.FAILED, Run.RunStatus.SUCCESS])
-        serializer = RunSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serialize_runs(queryset), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], url_path='barrier')
+    def wait_for_barrier(self, request):
+        """
+        Wait until all runs of the batch finished the round `round_seq` of the task `task_seq`, at most `timeout`
+        seconds. Returns how many of them did and whether the round is complete.
+        """
+        params = [request.GET.get(name, None) for name in ['project', 'batch', 'task_seq', 'round_seq']]
+        if not all(param and param.isdigit() for param in params):
+            return Response("project, batch, task_seq and round_seq are required", status=status.HTTP_400_BAD_REQUEST)
+        try:
+            timeout = min(float(request.GET.get('timeout', 0)), settings.BARRIER_WAIT_MAX_SECONDS)
+        except ValueError:
+            return Response("Invalid timeout", status=status.HTTP_400_BAD_REQUEST)
+        return Response(barrier_util.wait_for_barrier(*params, max(timeout, 0)))
+
+    @action(detail=False, methods=['GET'], url_path='round-durations')
+    def get_round_durations(self, request):
+        """
+        Summarize how long the sites of a project took per round, filtered by `batch`, `site_uid` and `task_seq`.
+        """
+        project_id = request.GET.get('project', None)
+        site_uid = request.GET.get('site_uid', None)
+        if not project_id:
+            return Response("Project id not provided", status=status.HTTP_400_BAD_REQUEST)
+        if site_uid and not validate_uuid4(site_uid):
+            return Response("Invalid site_uid", status=status.HTTP_400_BAD_REQUEST)
+        filters = {
+            'project_id': project_id,
+            'site_uid': site_uid,
+            'batch': request.GET.get('batch', None),
+            'task_seq': request.GET.get('task_seq', None),
+        }
+        queryset = RoundDuration.objects.filter(**{k: v for k, v in filters.items() if v})
+        return Response(straggler_util.summarize_round_durations(queryset))
 
     @action(detail=False, methods=['GET'], url_path='detail')
     def get_runs_details(self, request):
@@ -309,71 +487,108 @@ class RunViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.List
             role = participant_data['role']
             participant_id = participant_data['id']
         run_queryset = Run.objects.filter(project_id=project_id, batch=batch)
-        run_serializer = RunSerializer(run_queryset, many=True)
-        run_data = run_serializer.data
+        run_data = serialize_runs(
+            run_queryset) or history_util.get_archived_runs(project_id, batch)
         dic = display_util.pick_runs(run_data, role, participant_id)
         return Response(dic)
 
 
-class BulkCreateRunAPIView(generics.ListCreateAPIView):
+def batches_running(project):
+    if project.max_concurrent_batches > 1:
+        return "{} batches already running".format(project.max_concurrent_batches)
+    return "Last round of runs not completed"
+
+
+class BulkCreateRunAPIView(TracingMixin, ReplicaRoutingMixin, generics.ListCreateAPIView):
     # serializer_class = RunSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ControlPlaneThrottle]
 
     def post(self, request):
+        """
+        Launch the next batch of the project, one run per connected participant if the project has a quorum, one per
+        participant otherwise. At most `max_concurrent_batches` batches of a project run at the same time, with `queue`
+        set a launch waits for a free slot in the launch queue instead of failing.
+        The project row is locked until the runs are created, so concurrent launches of a project wait for each other.
+        """
         project_id = request.data.get('project', None)
-        queryset = Run.objects.filter(project_id=project_id)
-        serializer = RunSerializer(queryset, many=True)
-        should_create_new_runs = display_util.should_create_new_runs(
-            serializer.data)
-        if not should_create_new_runs:
-            return Response("Last round of runs not completed", status=status.HTTP_400_BAD_REQUEST)
-        project = Project.objects.get(id=project_id)
-        if project_id and project:
-            curr_time = timezone.now()
-            project.batch += 1
-            project.save()
-            records_to_create = []
-            pps = ProjectParticipant.objects.filter(project=project_id)
-            for pp in pps:
-                if pp.site.status == 1:
-                    data = {
-                        "project": project,
-                        "participant": pp,
-                        "site_uid": pp.site.uid,
-                        "role": pp.role,
-                        "status": Run.RunStatus.STANDBY,
-                        "tasks": project.tasks,
-                        "batch": project.batch,
-                        "cur_seq": 1,
-                        "created_at": curr_time,
-                        "updated_at": curr_time
-                    }
-                    records_to_create.append(data)
-            if len(records_to_create) == len(pps):
-                created_records = Run.objects.bulk_create(
-                    [Run(**item) for item in records_to_create], batch_size=100)
-                if created_records:
-                    return Response(status=status.HTTP_201_CREATED)
-                else:
-                    return Response("Error while creating runs", status=status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response("Not all sites are connected", status=status.HTTP_400_BAD_REQUEST)
-        return Response("project not found", status=status.HTTP_400_BAD_REQUEST)
+        queue = request.data.get('queue', False) in [True, 'true', 'True', '1', 1]
+        with transaction.atomic():
+            project = Project.objects.select_for_update().filter(id=project_id).first() if project_id else None
+            if not project:
+                return Response("project not found", status=status.HTTP_400_BAD_REQUEST)
+            queued = BatchLaunch.objects.filter(
+                project=project, status=BatchLaunch.LaunchStatus.QUEUED).exists()
+            if not queued and launch_util.has_free_slot(project):
+                batch, reason = launch_util.launch_batch(project)
+                if reason:
+                    return Response(reason, status=status.HTTP_400_BAD_REQUEST)
+                return Response(status=status.HTTP_201_CREATED)
+            if not queue:
+                if queued:
+                    return Response("Launches of the project are queued, launch with queue to wait for a free slot",
+                                    status=status.HTTP_400_BAD_REQUEST)
+                return Response(batches_running(project), status=status.HTTP_400_BAD_REQUEST)
+            launch = BatchLaunch.objects.create(project=project)
+        return Response(BatchLaunchSerializer(launch).data, status=status.HTTP_202_ACCEPTED)
 
 
-class RunsActionViewSet(ViewSet):
+class BatchLaunchViewSet(TracingMixin, ReplicaRoutingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    This viewset provides the queued launches of batches, filtered by `project` and `status`.
+    """
+    serializer_class = BatchLaunchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ['list', 'retrieve']
+
+    def get_queryset(self):
+        queryset = BatchLaunch.objects.all()
+        project_id = self.request.GET.get('project', None)
+        launch_status = self.request.GET.get('status', None)
+        if project_id:
+            queryset = queryset.filter(project_id=project_id)
+        if launch_status:
+            queryset = queryset.filter(status=launch_status)
+        return queryset
+
+    @action(detail=True, methods=['POST'], url_path='cancel')
+    def cancel(self, request, pk=None):
+        launch = self.get_object()
+        if launch.status != BatchLaunch.LaunchStatus.QUEUED:
+            return Response("Launch is not queued", status=status.HTTP_400_BAD_REQUEST)
+        launch.status = BatchLaunch.LaunchStatus.CANCELLED
+        launch.save()
+        return Response(BatchLaunchSerializer(launch).data, status=status.HTTP_202_ACCEPTED)
+
+
+def run_not_found(run_id):
+    # the runs of finished batches are removed with their files once archived, see RUN_ARCHIVE_AFTER_DAYS
+    return "Run {} not found, it may belong to an archived batch".format(run_id)
+
+
+class RunsActionViewSet(TracingMixin, ReplicaRoutingMixin, ViewSet):
     """
     This method is used by fl tasks to upload its artifacts and logs from local volume upon runs' task and round success
     """
 
-    @action(detail=False, methods=['POST'], url_path='upload')
+    @action(detail=False, methods=['POST'], url_path='upload', throttle_classes=[DataPlaneThrottle])
+    @data_plane
     def upload(self, request):
 
+        # with the run in the query string, a body larger than what is left of the quota of its project is rejected
+        # before the files are read
+        run_id = request.GET.get('run', None)
+        content_length = request.META.get('CONTENT_LENGTH', '')
+        if run_id and content_length.isdigit():
+            run = Run.objects.filter(id=run_id).select_related('project').first()
+            if run and usage_util.exceeds_quota(run.project, int(content_length)):
+                return Response("Storage quota of project exceeded", status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
         artifacts_file = request.FILES.get('artifacts')
         logs_file = request.FILES.get('logs')
         mid_artifacts_file = request.FILES.get('mid_artifacts')
 
-        run_id = request.POST.get('run', None)
+        run_id = run_id or request.POST.get('run', None)
         task_seq = request.POST.get('task_seq', None)
         round_seq = request.POST.get('round_seq', None)
 
@@ -387,84 +602,160 @@ class RunsActionViewSet(ViewSet):
         if run:
             url = generate_url(run_id, task_seq, round_seq)
             if url:
-                fs = FileSystemStorage(url)
+                # reject before anything is written if the project would run out of its quota
+                incoming_size = sum(f.size for f in [logs_file, mid_artifacts_file] if f)
                 if artifacts_file:
-                    runs = Run.objects.filter(batch=run.batch).exclude(id=run_id)
-                    if runs:
-                        for r in runs:
-                            u = generate_url(r.id, task_seq, round_seq)
-                            f = FileSystemStorage(u)
-                            af = f.save(
-                                gen_unique_file_name(artifacts_file.name, r.id, task_seq, round_seq),
-                                artifacts_file)
-                            if af:
-                                r.artifacts.append(u + af)
-                                r.save()
-                    artifacts_file_name = fs.save(
-                        gen_unique_file_name(artifacts_file.name, run_id, task_seq, round_seq), artifacts_file)
-                    if not artifacts_file_name:
-                        return Response("Error while saving artifacts", status=status.HTTP_400_BAD_REQUEST)
-                    else:
-                        run.artifacts.append(url + artifacts_file_name)
-
-                if logs_file:
-                    logs_file_name = fs.save(gen_unique_file_name(
-                        logs_file.name, run_id, task_seq, round_seq), logs_file)
-                    if not logs_file_name:
-                        return Response("Error while saving logs", status=status.HTTP_400_BAD_REQUEST)
-                    else:
-                        run.logs.append(url + logs_file_name)
-                if mid_artifacts_file:
-                    mid_artifacts_file_name = fs.save(
-                        gen_unique_file_name(mid_artifacts_file.name, run_id, task_seq, round_seq), mid_artifacts_file)
-                    if not mid_artifacts_file_name:
-                        return Response("Error while saving mid-artifacts", status=status.HTTP_400_BAD_REQUEST)
-                    else:
-                        run.middle_artifacts.append(url + mid_artifacts_file_name)
-                run.save()
-                return Response(status=status.HTTP_200_OK)
+                    batch_size = Run.objects.filter(
+                        project_id=run.project_id, batch=run.batch).count()
+                    incoming_size += artifacts_file.size * batch_size
+                if usage_util.exceeds_quota(run.project, incoming_size):
+                    return Response("Storage quota of project exceeded",
+                                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+                # stage the files under the uploading run only, publishing is done by the upload pipeline
+                fs = FileSystemStorage(url)
+                # checksummed by the upload handler while the files streamed in
+                checksums = getattr(request, 'upload_checksums', {})
+                jobs = []
+                for file_type, uploaded_file in [(StorageUsage.FileType.ARTIFACTS, artifacts_file),
+                                                 (StorageUsage.FileType.LOGS, logs_file),
+                                                 (StorageUsage.FileType.MID_ARTIFACTS, mid_artifacts_file)]:
+                    if not uploaded_file:
+                        continue
+                    with timed_io('save', uploaded_file.name, uploaded_file.size), \
+                            start_span('storage.save', file_name=uploaded_file.name, size=uploaded_file.size):
+                        file_name = fs.save(gen_unique_file_name(
+                            uploaded_file.name, run_id, task_seq, round_seq), uploaded_file)
+                    if not file_name:
+                        return Response("Error while saving {}".format(file_type), status=status.HTTP_400_BAD_REQUEST)
+                    usage_util.record_usage(
+                        run, file_type, task_seq, round_seq, uploaded_file.size)
+                    jobs.append(UploadJob.objects.create(
+                        run=run, file_type=file_type, task_seq=task_seq, round_seq=round_seq,
+                        name=uploaded_file.name, path=url + file_name, size=uploaded_file.size,
+                        checksum=checksums.get(file_type, '')))
+                upload_pipeline.submit([job.id for job in jobs])
+                # 200 as before the pipeline for the controllers checking it, the jobs tell what to poll
+                return Response(UploadJobSerializer(jobs, many=True).data)
         return Response("No run found", status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['GET'], url_path='upload-status', throttle_classes=[ControlPlaneThrottle])
+    def upload_status(self, request):
+        """
+        Get the publishing status of uploaded files by comma separated job ids,
+        or by run, task_seq and round_seq.
+        """
+        job_ids = request.GET.get('job', None)
+        run_id = request.GET.get('run', None)
+        task_seq = request.GET.get('task_seq', None)
+        round_seq = request.GET.get('round_seq', None)
+
+        if job_ids:
+            queryset = UploadJob.objects.filter(
+                id__in=[job_id for job_id in job_ids.split(',') if job_id.isdigit()])
+        elif run_id:
+            queryset = UploadJob.objects.filter(run_id=run_id)
+            if task_seq:
+                queryset = queryset.filter(task_seq=task_seq)
+            if round_seq:
+                queryset = queryset.filter(round_seq=round_seq)
+        else:
+            return Response("Job id or run id not provided", status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadJobSerializer(queryset, many=True).data)
+
     """
     This method used to download artifacts or logs of run(s) including all tasks and inner rounds
     """
 
-    @action(detail=False, methods=['GET'], url_path='download')
+    @action(detail=False, methods=['GET'], url_path='download', throttle_classes=[DataPlaneThrottle])
+    @data_plane
     def download(self, request):
         run_id = request.GET.get('run', None)
         all_runs = request.GET.get('all_runs', '0')
         file_type = request.GET.get('type', None)
         task_seq = request.GET.get('task_seq', None)
         round_seq = request.GET.get('round_seq', None)
+        archive_format = request.GET.get('archive', 'zip')
+        level = request.GET.get('level', None)
 
         if not run_id or not file_type:
             return Response("Run id or file type not provided", status=status.HTTP_400_BAD_REQUEST)
-        run = Run.objects.get(id=run_id)
+        if archive_util.get_compression_level(archive_format, level) is None:
+            return Response("Unsupported archive {} or compression level {}".format(archive_format, level),
+                            status=status.HTTP_400_BAD_REQUEST)
+        run = Run.objects.filter(id=run_id).first()
 
         if run:
-            runs = []
-            if run.role == 'CO' and all_runs == '1':
-                project_id = run.project_id
-                batch = run.batch
-                all_runs = Run.objects.filter(
-                    project_id=project_id, batch=batch)
-                runs.extend(all_runs)
-            else:
-                runs.append(run)
-
-            urls = get_file_urls(runs, task_seq, round_seq, file_type)
+            runs = manifest_util.get_download_runs(run, all_runs)
+
+            file_id = request.GET.get('file', None)
+            if file_id:
+                # a single file listed by the manifest, sent as-is
+                run_file = manifest_util.get_run_files(runs, None, None, file_type).filter(
+                    id=file_id).first() if file_id.isdigit() else None
+                if not run_file:
+                    return Response("File {} not found".format(file_id), status=status.HTTP_404_NOT_FOUND)
+                etag = manifest_util.get_file_etag(run_file)
+                response = manifest_util.not_modified(request, etag)
+                if response is None:
+                    response = FileResponse(open(run_file.path, 'rb'), as_attachment=True,
+                                            filename=run_file.name)
+                    response['ETag'] = etag
+                return response
+
+            with start_span('file_util.get_file_urls', runs=len(runs)):
+                urls = get_file_urls(runs, task_seq, round_seq, file_type)
 
             if urls and len(urls) > 0:
-                zip_file = zip_all_files(run, urls, file_type)
-                if zip_file:
-                    response = HttpResponse(
-                        zip_file, content_type='application/zip')
-                    response['Content-Disposition'] = f'attachment; filename="{file_type}.zip"'
+                # skip building the archive if the controller holds it already
+                etag = manifest_util.get_archive_etag(
+                    urls, archive_format, archive_util.get_compression_level(archive_format, level))
+                response = manifest_util.not_modified(request, etag)
+                if response is not None:
+                    return response
+                scope = {'runs': [r.id for r in runs],
+                         'task_seq': task_seq, 'round_seq': round_seq}
+                with timed_io('archive', file_type), start_span('archive.build', archive_format=archive_format):
+                    archive = archive_all_files(
+                        run, urls, file_type, archive_format, level, scope)
+                if archive:
+                    suffix, content_type = archive_util.archive_formats[archive_format]
+                    response = FileResponse(archive, content_type=content_type, as_attachment=True,
+                                            filename=f'{file_type}{suffix}')
+                    if etag:
+                        response['ETag'] = etag
                     return response
             return Response("No files of {} found".format(file_type), status=status.HTTP_404_NOT_FOUND)
-        return Response("Run not exist", status=status.HTTP_400_BAD_REQUEST)
+        return Response(run_not_found(run_id), status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['GET'], url_path='manifest', throttle_classes=[ControlPlaneThrottle])
+    def manifest(self, request):
+        """
+        List the files download sends for the same params with their size and checksum,
+        so that controllers download only the files they miss, by id with `file`.
+        """
+        run_id = request.GET.get('run', None)
+        all_runs = request.GET.get('all_runs', '0')
+        file_type = request.GET.get('type', None)
+        task_seq = request.GET.get('task_seq', None)
+        round_seq = request.GET.get('round_seq', None)
 
-    @action(detail=False, methods=['PUT'], url_path='update')
+        if not run_id or not file_type:
+            return Response("Run id or file type not provided", status=status.HTTP_400_BAD_REQUEST)
+        run = Run.objects.filter(id=run_id).first()
+        if not run:
+            return Response(run_not_found(run_id), status=status.HTTP_404_NOT_FOUND)
+        runs = manifest_util.get_download_runs(run, all_runs)
+        files = RunFileSerializer(manifest_util.get_run_files(
+            runs, task_seq, round_seq, file_type), many=True).data
+        etag = manifest_util.get_manifest_etag(files)
+        response = manifest_util.not_modified(request, etag)
+        if response is None:
+            response = Response(files)
+            response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['PUT'], url_path='update', throttle_classes=[ControlPlaneThrottle])
     def update_status_by_action(self, request, pk=None):
         run_id = request.data.get('run', None)
         action_role = request.data.get('role', None)
@@ -491,11 +782,15 @@ class RunsActionViewSet(ViewSet):
                 if not run:
                     return Response("Failed to get run could perform action {}".format(request_action),
                                     status=status.HTTP_400_BAD_REQUEST)
-                run.update(status=target_status)
-                return Response(
-                    "Update runs of project {} in batch {}  status to {}".format(
-                        project_id, batch, target_status),
-                    status=status.HTTP_202_ACCEPTED)
+                if target_status == Run.RunStatus.STANDBY and not launch_util.can_restart(project, batch):
+                    return Response(batches_running(project), status=status.HTTP_400_BAD_REQUEST)
+                run.update(status=target_status, **straggler_util.round_start_changes(target_status))
+            # a batch stopped by the action frees a slot for the queued launches
+            launch_util.admit_queued_launches(project_id)
+            return Response(
+                "Update runs of project {} in batch {}  status to {}".format(
+                    project_id, batch, target_status),
+                status=status.HTTP_202_ACCEPTED)
         else:
             with transaction.atomic():
                 project = Project.objects.select_for_update().get(id=project_id)
@@ -510,7 +805,92 @@ class RunsActionViewSet(ViewSet):
                     run.to_stop()
                     run.save()
                 else:
+                    if not launch_util.can_restart(project, run.batch):
+                        return Response(batches_running(project), status=status.HTTP_400_BAD_REQUEST)
                     run.to_restart()
                     run.save()
-                return Response("Update run {} status to {}".format(run_id, target_status),
-                                status=status.HTTP_202_ACCEPTED)
+            launch_util.admit_queued_launches(project_id)
+            return Response("Update run {} status to {}".format(run_id, target_status),
+                            status=status.HTTP_202_ACCEPTED)
+
+
+class StorageUsageViewSet(TracingMixin, ReplicaRoutingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    This viewset provides the storage usage records of uploaded files,
+    filtered by `project`, `site_uid`, `run`, `batch`, `type`, `task_seq` and `round_seq`.
+    """
+    serializer_class = StorageUsageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ['list', 'retrieve', 'summary']
+
+    def get_queryset(self):
+        queryset = StorageUsage.objects.all()
+        filters = {
+            'project_id': self.request.GET.get('project', None),
+            'site_uid': self.request.GET.get('site_uid', None),
+            'run_id': self.request.GET.get('run', None),
+            'batch': self.request.GET.get('batch', None),
+            'file_type': self.request.GET.get('type', None),
+            'task_seq': self.request.GET.get('task_seq', None),
+            'round_seq': self.request.GET.get('round_seq', None),
+        }
+        return queryset.filter(**{k: v for k, v in filters.items() if v})
+
+    @action(detail=False, methods=['GET'], url_path='summary')
+    def summary(self, request):
+        """
+        Aggregate the storage usage by the comma separated fields of `group_by`,
+        e.g. `group_by=project,site_uid` for the usage of each site in each project.
+        """
+        site_uid = request.GET.get('site_uid', None)
+        if site_uid and not validate_uuid4(site_uid):
+            return Response("Invalid site_uid", status=status.HTTP_400_BAD_REQUEST)
+        group_by = request.GET.get('group_by', '')
+        fields = [field.strip() for field in group_by.split(',') if field.strip()]
+        invalid_fields = [
+            field for field in fields if field not in usage_util.usage_group_fields]
+        if invalid_fields:
+            return Response("Unsupported group_by fields {}".format(invalid_fields),
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(usage_util.summarize_usage(self.get_queryset(), fields))
+
+
+class ThrottleViewSet(TracingMixin, ViewSet):
+    """
+    Requests rejected by the rate limits since the cache was cleared, per budget.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        return Response(get_rejections())
+
+
+class ProfileViewSet(TracingMixin, ViewSet):
+    """
+    Profiles of sampled requests, newest first. A profile has the calls made by the request, its SQL queries and its
+    storage operations with their timings, the raw cProfile stats are at `pstats`.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    summary_fields = ['id', 'method', 'path', 'status', 'started_at', 'seconds',
+                      'query_count', 'query_seconds', 'io_seconds']
+
+    def list(self, request):
+        summaries = []
+        for profile_id in profiling.list_profile_ids():
+            profile = profiling.load_profile(profile_id)
+            if profile:
+                summaries.append({field: profile.get(field) for field in self.summary_fields})
+        return Response(summaries)
+
+    def retrieve(self, request, pk=None):
+        profile = profiling.load_profile(pk)
+        if not profile:
+            return Response("Profile not found", status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
+
+    @action(detail=True, methods=['GET'], url_path='pstats')
+    def pstats(self, request, pk=None):
+        path = profiling.get_profile_path(pk, '.prof')
+        if not path:
+            return Response("Profile not found", status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=pk + '.prof')
@@ -49,11 +49,26 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # JSON stays the default, controllers opt in to MessagePack with the Accept and Content-Type headers
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'friendlyfl.router.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'friendlyfl.router.renderers.MessagePackParser',
+    ],
 }
 
 
 MIDDLEWARE = [
+    "friendlyfl.router.tracing.TracingMiddleware",
+    "friendlyfl.router.profiling.ProfilingMiddleware",
+    "friendlyfl.router.concurrency.DataPlaneLimitMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -88,15 +103,204 @@ WSGI_APPLICATION = "friendlyfl.wsgi.application"
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DATABASE_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DATABASE_NAME'),
         'USER': os.getenv('DATABASE_USER'),
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
         'PORT': os.getenv('DATABASE_PORT'),
+        # keep connections open between requests, checked before they are reused
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DATABASE_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Read replicas of the default database, one per host. Read-only lookups go to a replica unless the site wrote within
+# DATABASE_REPLICA_STICKY_SECONDS, a replica refusing connections is skipped for DATABASE_REPLICA_RETRY_SECONDS
+
+for i, host in enumerate(host for host in os.getenv('DATABASE_REPLICA_HOSTS', '').split(',') if host):
+    DATABASES['replica{}'.format(i + 1)] = {
+        **DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['friendlyfl.router.db_router.ReplicaRouter']
+
+# Most connections the server keeps to the database, below its max_connections (100 by default in Postgres) to leave
+# room for the jobs and admin sessions. `serve` runs fewer workers when their threads could open more, 0 lifts the cap
+
+DATABASE_MAX_CONNECTIONS = int(os.getenv('DATABASE_MAX_CONNECTIONS', '80'))
+
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', '5'))
+
+DATABASE_REPLICA_RETRY_SECONDS = int(os.getenv('DATABASE_REPLICA_RETRY_SECONDS', '30'))
+
+# The cache is shared by the workers of the server, the file based default works for the workers of one host,
+# use a memcached or redis backend when serving from several hosts. It keeps the replica stickiness and the throttle
+# buckets of every site, an entry culled early lets a site read stale runs or resets its bucket, so CACHE_MAX_ENTRIES
+# must hold a few entries per site. The file based cache lists its entries on every write, use memcached or redis for
+# federations of thousands of sites
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/friendlyfl-cache'),
+    }
+}
+
+# memcached and redis clients take options of their own and evict by memory
+if CACHES['default']['BACKEND'].endswith(('FileBasedCache', 'LocMemCache')):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '100000'))}
+
+# Token bucket rate limits of every site as (requests per second, burst). Control plane calls are heartbeats, polling
+# and status updates of runs, data plane calls are uploads and downloads of files. A rate of 0 disables the limit
+
+THROTTLE_RATES = {
+    'control': (float(os.getenv('THROTTLE_CONTROL_RATE', '10')), int(os.getenv('THROTTLE_CONTROL_BURST', '50'))),
+    'data': (float(os.getenv('THROTTLE_DATA_RATE', '1')), int(os.getenv('THROTTLE_DATA_BURST', '10'))),
+}
+
+# Runs preparing or running longer than the `round_timeout` seconds in the config of their task, or RUN_ROUND_TIMEOUT
+# when the task does not set it (0 for no deadline), are stopped by the sweep_stragglers job. So are the unfinished runs
+# of sites disconnected for more than RUN_DISCONNECTED_GRACE_SECONDS
+
+RUN_ROUND_TIMEOUT = int(os.getenv('RUN_ROUND_TIMEOUT', '0'))
+
+RUN_DISCONNECTED_GRACE_SECONDS = int(os.getenv('RUN_DISCONNECTED_GRACE_SECONDS', '300'))
+
+# Waiting for the round barrier holds one of the SERVE_THREADS of a worker, the threads heartbeats and status updates
+# are served on, for at most BARRIER_WAIT_MAX_SECONDS. Waiters look for the completion of the round every
+# BARRIER_POLL_INTERVAL seconds
+
+BARRIER_WAIT_MAX_SECONDS = int(os.getenv('BARRIER_WAIT_MAX_SECONDS', '5'))
+
+BARRIER_POLL_INTERVAL = float(os.getenv('BARRIER_POLL_INTERVAL', '0.2'))
+
+# Request profiling, off unless PROFILING_ENABLED. Requests sending PROFILING_TOKEN in the X-Profile-Token header
+# are profiled, as well as a PROFILING_SAMPLE_RATE share of all requests. The last PROFILING_MAX_PROFILES profiles
+# are kept in PROFILING_DIR
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/tmp/friendlyfl-profiles')
+
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', '100'))
+
+PROFILING_TOP_FUNCTIONS = int(os.getenv('PROFILING_TOP_FUNCTIONS', '50'))
+
+# Tracing, off unless TRACING_EXPORTER is `otlp`, sending traces to the OTLP/HTTP collector at TRACING_OTLP_ENDPOINT,
+# or `file`, appending them to TRACING_FILE as OTLP/JSON lines. Requests continue the trace of their traceparent header,
+# TRACING_SAMPLE_RATE of the others start a new one
+
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', '')
+
+TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', 'http://localhost:4318')
+
+TRACING_FILE = os.getenv('TRACING_FILE', '/tmp/friendlyfl-traces.jsonl')
+
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'friendlyfl-router')
+
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '1'))
+
+# traces waiting to be sent, spans sent per request to the collector and seconds to wait for it
+
+TRACING_QUEUE_SIZE = int(os.getenv('TRACING_QUEUE_SIZE', '1000'))
+
+TRACING_BATCH_SIZE = int(os.getenv('TRACING_BATCH_SIZE', '512'))
+
+TRACING_EXPORT_TIMEOUT = float(os.getenv('TRACING_EXPORT_TIMEOUT', '2'))
+
+# Heartbeats may carry the telemetry of the site, the last SITE_TELEMETRY_WINDOW samples of every site are kept and the
+# ones younger than SITE_TELEMETRY_MAX_AGE seconds averaged. Sites whose average cpu or memory use (fractions) or task
+# queue reach the SITE_OVERLOAD_* thresholds are left out of batches that reach their quorum without them, 0 disables
+# a threshold
+
+SITE_TELEMETRY_WINDOW = int(os.getenv('SITE_TELEMETRY_WINDOW', '20'))
+
+SITE_TELEMETRY_MAX_AGE = int(os.getenv('SITE_TELEMETRY_MAX_AGE', '300'))
+
+SITE_OVERLOAD_CPU = float(os.getenv('SITE_OVERLOAD_CPU', '0.9'))
+
+SITE_OVERLOAD_MEMORY = float(os.getenv('SITE_OVERLOAD_MEMORY', '0.9'))
+
+SITE_OVERLOAD_QUEUE = int(os.getenv('SITE_OVERLOAD_QUEUE', '0'))
+
+# Most sites registered or enrolled by one bulk request
+
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '5000'))
+
+# Production server started by `manage.py serve`, every worker process serves requests on this many threads
+# and holds one persistent database connection per thread. The workers are capped by DATABASE_MAX_CONNECTIONS
+
+SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:8000')
+
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', '4'))
+
+SERVE_TIMEOUT = int(os.getenv('SERVE_TIMEOUT', '300'))
+
+# Workers are recycled after about this many requests, 0 keeps them running
+
+SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', '0'))
+
+# Uploads and downloads served at the same time by every worker process, and waiting at most
+# SERVE_DATA_PLANE_QUEUE_TIMEOUT seconds for their turn, the others are answered 503. `serve` adds threads for them to
+# the SERVE_THREADS, which are left for heartbeats and status updates. 0 lifts the limit, all calls share the threads
+
+SERVE_DATA_PLANE_CONCURRENCY = int(os.getenv('SERVE_DATA_PLANE_CONCURRENCY', '2'))
+
+SERVE_DATA_PLANE_QUEUE = int(os.getenv('SERVE_DATA_PLANE_QUEUE', '2'))
+
+SERVE_DATA_PLANE_QUEUE_TIMEOUT = float(os.getenv('SERVE_DATA_PLANE_QUEUE_TIMEOUT', '30'))
+
+# Upload processing pipeline
+# Uploaded files are staged in the request, fan-out to the other runs of the batch,
+# checksums and manifest updates are done by a pool of background workers.
+
+UPLOAD_PIPELINE_ASYNC = os.getenv('UPLOAD_PIPELINE_ASYNC', 'True') == 'True'
+
+UPLOAD_PIPELINE_WORKERS = int(os.getenv('UPLOAD_PIPELINE_WORKERS', '4'))
+
+# Jobs processing for longer without progress, e.g. in a killed worker, are staged again by the
+# publish_staged_uploads job, as are failed jobs until they were tried this many times
+
+UPLOAD_PIPELINE_LEASE_SECONDS = int(os.getenv('UPLOAD_PIPELINE_LEASE_SECONDS', '600'))
+
+UPLOAD_PIPELINE_MAX_ATTEMPTS = int(os.getenv('UPLOAD_PIPELINE_MAX_ATTEMPTS', '3'))
+
+# Uploaded files are checksummed while they stream in, before Django's handlers save them
+
+FILE_UPLOAD_HANDLERS = [
+    'friendlyfl.router.upload_handlers.ChecksumUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Download archives are read and compressed by a pool of this many threads
+
+ARCHIVE_BUILDER_WORKERS = int(os.getenv('ARCHIVE_BUILDER_WORKERS', os.cpu_count() or 1))
+
+# Built download archives are cached on disk up to this many bytes, 0 disables the cache
+
+ARCHIVE_CACHE_MAX_BYTES = int(os.getenv('ARCHIVE_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+
+# Batches whose runs all finished are moved to the run archive this many days after their last update,
+# RUN_ARCHIVE_CHUNK_SIZE batches per transaction and at most RUN_ARCHIVE_MAX_BATCHES each time the job runs
+
+RUN_ARCHIVE_AFTER_DAYS = int(os.getenv('RUN_ARCHIVE_AFTER_DAYS', '7'))
+
+RUN_ARCHIVE_CHUNK_SIZE = int(os.getenv('RUN_ARCHIVE_CHUNK_SIZE', '50'))
+
+RUN_ARCHIVE_MAX_BATCHES = int(os.getenv('RUN_ARCHIVE_MAX_BATCHES', '1000'))
+
+# Archived runs cannot be downloaded, their files are kept unless RUN_ARCHIVE_KEEP_FILES=False, which deletes them and
+# releases their storage usage when they are archived
+
+RUN_ARCHIVE_KEEP_FILES = os.getenv('RUN_ARCHIVE_KEEP_FILES', 'True') == 'True'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -30,6 +30,12 @@ router_v1.register(r'runs',
                    views.RunViewSet, basename="run")
 router_v1.register(r'runs-action', views.RunsActionViewSet,
                    basename="runs-action")
+router_v1.register(r'storage-usage', views.StorageUsageViewSet,
+                   basename="storage-usage")
+router_v1.register(r'batch-launches', views.BatchLaunchViewSet,
+                   basename="batch-launch")
+router_v1.register(r'throttles', views.ThrottleViewSet, basename="throttle")
+router_v1.register(r'profiles', views.ProfileViewSet, basename="profile")
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
@@ -0,0 +1,314 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+from django.conf import settings
+
+from friendlyfl.router import tracing
+from friendlyfl.utils import file_util
+from friendlyfl.utils.file_util import chunk_size
+
+archive_formats = {
+    'zip': ('.zip', 'application/zip'),
+    'tar.zst': ('.tar.zst', 'application/zstd'),
+}
+
+# default and accepted compression levels of each format
+compression_levels = {
+    'zip': (6, range(0, 10)),
+    'tar.zst': (3, range(1, 20)),
+}
+
+# already compressed or encrypted payloads, stored without trying to compress them
+incompressible_suffixes = ('.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.npz',
+                           '.png', '.jpg', '.jpeg', '.gif', '.enc', '.gpg', '.age')
+
+# entries whose sample does not shrink below this ratio are stored as-is
+compress_sample_size = 64 * 1024
+compress_min_ratio = 0.95
+
+# compressed entries are kept in memory up to this size before spilling to disk
+spool_size = 8 * 1024 * 1024
+
+cache_folder_name = '.archive-cache'
+
+meta_suffix = '.json'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ARCHIVE_BUILDER_WORKERS, thread_name_prefix='archive-builder')
+    return _executor
+
+
+def get_compression_level(archive_format, level=None):
+    """
+    Return the compression level to use for the format, None if the format or level is not supported.
+    """
+    if archive_format not in archive_formats:
+        return None
+    default_level, levels = compression_levels[archive_format]
+    if level is None or level == '':
+        return default_level
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        return None
+    return level if level in levels else None
+
+
+def is_compressible(file_path):
+    if file_path.lower().endswith(incompressible_suffixes):
+        return False
+    with open(file_path, 'rb') as f:
+        sample = f.read(compress_sample_size)
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * compress_min_ratio
+
+
+def compress_entry(file_path, level):
+    """
+    Read and deflate a file for a zip entry, returns its zip info and the compressed data,
+    or no data if the file should be stored as-is.
+    """
+    info = zipfile.ZipInfo.from_file(file_path, os.path.basename(file_path))
+    compressor = None
+    data = None
+    if level > 0 and is_compressible(file_path):
+        info.compress_type = zipfile.ZIP_DEFLATED
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    else:
+        info.compress_type = zipfile.ZIP_STORED
+    crc = 0
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor:
+                data.write(compressor.compress(chunk))
+    info.CRC = crc
+    info.file_size = size
+    if compressor:
+        data.write(compressor.flush())
+        info.compress_size = data.tell()
+        data.seek(0)
+    else:
+        info.compress_size = size
+    return info, data
+
+
+class PrecompressedZipFile(zipfile.ZipFile):
+    """
+    Zip file appending the entries compressed beforehand by compress_entry. Doing so takes attributes private to
+    ZipFile, checked once it is opened: on Pythons without them the entries are compressed again by ZipFile.write.
+    """
+    internals = ['fp', 'filelist', 'NameToInfo', 'start_dir', '_didModify', '_lock', '_seekable', '_writing']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.precompressed = all(hasattr(self, name) for name in self.internals)
+
+    def write_entry(self, info, data, file_path, level):
+        """
+        Append an entry compressed by compress_entry at level.
+        """
+        if not self.precompressed:
+            if data:
+                data.close()
+            self.write(file_path, info.filename, info.compress_type, level or None)
+            return
+        zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+        with self._lock:
+            if self._writing:
+                raise ValueError("Can't write to the zip file while an entry is open for writing")
+            if self._seekable:
+                self.fp.seek(self.start_dir)
+            info.header_offset = self.fp.tell()
+            self.fp.write(info.FileHeader(zip64))
+            if data:
+                with data:
+                    shutil.copyfileobj(data, self.fp, chunk_size)
+            else:
+                with open(file_path, 'rb') as f:
+                    shutil.copyfileobj(f, self.fp, chunk_size)
+            self.filelist.append(info)
+            self.NameToInfo[info.filename] = info
+            self.start_dir = self.fp.tell()
+            self._didModify = True
+
+
+def build_zip(file_paths, dest, level):
+    # entries are read and compressed on the pool, and written in order as they complete
+    futures = [get_executor().submit(compress_entry, file_path, level)
+               for file_path in file_paths]
+    with PrecompressedZipFile(dest, 'w', allowZip64=True) as zip_file:
+        for file_path, future in zip(file_paths, futures):
+            with tracing.start_span('archive.zip_entry', file_name=os.path.basename(file_path)) as span:
+                info, data = future.result()
+                zip_file.write_entry(info, data, file_path, level)
+                if span:
+                    span.set_attribute('file_size', info.file_size)
+                    span.set_attribute('compress_size', info.compress_size)
+
+
+def build_tar_zst(file_paths, dest, level):
+    import zstandard
+
+    # zstd compresses the stream on its own worker threads
+    compressor = zstandard.ZstdCompressor(
+        level=level, threads=settings.ARCHIVE_BUILDER_WORKERS)
+    with compressor.stream_writer(dest, closefd=False) as writer:
+        with tarfile.open(fileobj=writer, mode='w|') as tar_file:
+            for file_path in file_paths:
+                tar_file.add(file_path, arcname=os.path.basename(file_path))
+
+
+def build_archive(file_paths, dest, archive_format='zip', level=None):
+    """
+    Write the files into an archive of the given format to the dest file object.
+    """
+    level = get_compression_level(archive_format, level)
+    if level is None:
+        raise ValueError('Unsupported archive format {} or level'.format(archive_format))
+    if archive_format == 'tar.zst':
+        build_tar_zst(file_paths, dest, level)
+    else:
+        build_zip(file_paths, dest, level)
+    return dest
+
+
+def get_cache_folder():
+    return f'{file_util.base_folder}/{cache_folder_name}'
+
+
+def get_cache_key(file_paths, archive_format, level):
+    """
+    Hash the file list with the size and modification time of each file, and the archive options.
+    """
+    files = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        files.append([file_path, stat.st_size, stat.st_mtime_ns])
+    content = json.dumps({'files': files, 'archive': archive_format, 'level': level})
+    return sha256(content.encode()).hexdigest()
+
+
+def get_cached_archive(file_paths, archive_format='zip', level=None, scope=None):
+    """
+    Return a built archive of the files opened for reading, from the cache if it was built before.
+    The scope (runs, task_seq and round_seq of the request) is kept to invalidate the archive on new uploads.
+    """
+    level = get_compression_level(archive_format, level)
+    if level is None:
+        raise ValueError('Unsupported archive format {} or level'.format(archive_format))
+    cache_folder = get_cache_folder()
+    os.makedirs(cache_folder, exist_ok=True)
+    key = get_cache_key(file_paths, archive_format, level)
+    archive_path = os.path.join(
+        cache_folder, key + archive_formats[archive_format][0])
+    try:
+        archive = open(archive_path, 'rb')
+    except FileNotFoundError:
+        archive = None
+    if archive:
+        try:
+            # the modification time orders the archives for eviction, least recently used first
+            os.utime(archive_path)
+        except FileNotFoundError:
+            pass
+        return archive
+
+    with tempfile.NamedTemporaryFile(dir=cache_folder, suffix='.tmp', delete=False) as f:
+        try:
+            build_archive(file_paths, f, archive_format, level)
+        except Exception:
+            os.unlink(f.name)
+            raise
+    with open(os.path.join(cache_folder, key + meta_suffix), 'w') as meta:
+        json.dump(scope or {}, meta)
+    os.replace(f.name, archive_path)
+    archive = open(archive_path, 'rb')
+    evict_archives(keep=archive_path)
+    return archive
+
+
+def remove_cached_archive(archive_path):
+    cache_folder = get_cache_folder()
+    key = os.path.basename(archive_path).split('.', 1)[0]
+    for path in [archive_path, os.path.join(cache_folder, key + meta_suffix)]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def list_cached_archives():
+    suffixes = tuple(suffix for suffix, _ in archive_formats.values())
+    archives = []
+    cache_folder = get_cache_folder()
+    if not os.path.isdir(cache_folder):
+        return archives
+    for name in os.listdir(cache_folder):
+        if not name.endswith(suffixes):
+            continue
+        archive_path = os.path.join(cache_folder, name)
+        try:
+            stat = os.stat(archive_path)
+        except FileNotFoundError:
+            continue
+        archives.append((stat.st_mtime, stat.st_size, archive_path))
+    return archives
+
+
+def evict_archives(keep=None):
+    """
+    Remove the least recently used archives until the cache fits into ARCHIVE_CACHE_MAX_BYTES.
+    """
+    archives = list_cached_archives()
+    total = sum(size for _, size, _ in archives)
+    for _, size, archive_path in sorted(archives):
+        if total <= settings.ARCHIVE_CACHE_MAX_BYTES:
+            break
+        if archive_path == keep:
+            continue
+        remove_cached_archive(archive_path)
+        total -= size
+
+
+def invalidate_archives(run_ids, task_seq, round_seq):
+    """
+    Remove the cached archives covering new files of the runs in task_seq and round_seq.
+    """
+    cache_folder = get_cache_folder()
+    run_ids = {str(run_id) for run_id in run_ids}
+    for _, _, archive_path in list_cached_archives():
+        key = os.path.basename(archive_path).split('.', 1)[0]
+        try:
+            with open(os.path.join(cache_folder, key + meta_suffix)) as meta:
+                scope = json.load(meta)
+        except (FileNotFoundError, ValueError):
+            scope = {}
+        if scope.get('runs') and not run_ids.intersection(str(run_id) for run_id in scope['runs']):
+            continue
+        # archives of all tasks and rounds of the runs are affected by any new file
+        if scope.get('task_seq') and str(scope['task_seq']) != str(task_seq):
+            continue
+        if scope.get('round_seq') and str(scope['round_seq']) != str(round_seq):
+            continue
+        remove_cached_archive(archive_path)
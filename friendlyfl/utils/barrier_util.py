@@ -0,0 +1,101 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from friendlyfl.router.models import Run, RoundBarrier, ProjectParticipant, UploadJob
+from friendlyfl.utils import participation_util, history_util
+
+
+# statuses changing the counts of a barrier when runs enter or leave them
+counted_statuses = [Run.RunStatus.PENDING_SUCCESS,
+                    Run.RunStatus.PENDING_FAILED, Run.RunStatus.FAILED]
+
+failed_statuses = [Run.RunStatus.PENDING_FAILED, Run.RunStatus.FAILED]
+
+
+def get_barrier_key(project_id, batch, task_seq, round_seq):
+    return 'barrier:{}:{}:{}:{}'.format(project_id, batch, task_seq, round_seq)
+
+
+def update_barrier(run):
+    """
+    Count the runs of the batch of run that finished its current round, called with the project locked whenever
+    the status of runs of the batch changed or one of their uploads was published. A run arrives once it is pending
+    success and its uploads of the round are published. Once all of them did, the run of the coordinator moves on to
+    pending aggregating and the waiters are notified. Returns the barrier.
+    """
+    round_seq = run.get_round_seq() or 0
+    pending_uploads = UploadJob.objects.filter(
+        run=OuterRef('pk'), task_seq=run.cur_seq, round_seq=round_seq,
+        status__in=history_util.pending_upload_statuses)
+    counts = Run.objects.filter(project_id=run.project_id, batch=run.batch).annotate(
+        uploading=Exists(pending_uploads)).aggregate(
+        total=Count('id'),
+        failed=Count('id', filter=Q(status__in=failed_statuses)),
+        failed_required=Count('id', filter=Q(status__in=failed_statuses) & (
+            Q(participant__required=True) | Q(role=ProjectParticipant.Role.COORDINATOR))),
+        arrived=Count('id', filter=Q(status=Run.RunStatus.PENDING_SUCCESS, uploading=False)))
+    barrier, _ = RoundBarrier.objects.get_or_create(
+        project_id=run.project_id, batch=run.batch, task_seq=run.cur_seq, round_seq=round_seq)
+    if barrier.completed_at:
+        return barrier
+    barrier.expected = get_expected(run, counts)
+    barrier.arrived = counts['arrived']
+    if barrier.expected and barrier.arrived == barrier.expected:
+        barrier.completed_at = timezone.now()
+        coordinator_run = Run.objects.select_for_update().filter(
+            project_id=run.project_id, batch=run.batch, role=ProjectParticipant.Role.COORDINATOR,
+            status=Run.RunStatus.PENDING_SUCCESS).first()
+        if coordinator_run:
+            coordinator_run.pending_aggregating()
+            coordinator_run.save()
+        cache.set(get_barrier_key(run.project_id, run.batch, run.cur_seq, round_seq), 1,
+                  timeout=settings.BARRIER_WAIT_MAX_SECONDS * 2)
+    barrier.save()
+    return barrier
+
+
+def get_expected(run, counts):
+    """
+    Runs the round waits for. Failed runs are not waited for when the project has a quorum the other runs still
+    meet and none of them is required, otherwise the round cannot complete without them.
+    """
+    if counts['failed'] and not counts['failed_required'] and participation_util.has_quorum(run.project):
+        remaining = counts['total'] - counts['failed']
+        participant_count = ProjectParticipant.objects.filter(project_id=run.project_id).count()
+        if remaining >= participation_util.get_quorum(run.project, participant_count):
+            return remaining
+    return counts['total']
+
+
+def get_barrier_state(project_id, batch, task_seq, round_seq):
+    barrier = RoundBarrier.objects.filter(
+        project_id=project_id, batch=batch, task_seq=task_seq, round_seq=round_seq).first()
+    return {
+        'project': int(project_id),
+        'batch': int(batch),
+        'task_seq': int(task_seq),
+        'round_seq': int(round_seq),
+        'expected': barrier.expected if barrier else 0,
+        'arrived': barrier.arrived if barrier else 0,
+        'completed': bool(barrier and barrier.completed_at),
+        'completed_at': barrier.completed_at if barrier else None,
+    }
+
+
+def wait_for_barrier(project_id, batch, task_seq, round_seq, timeout):
+    """
+    Block until the round is complete or timeout seconds passed, returns the state of the barrier.
+    Waiters check the cache, completions are only read from the database when they are announced there.
+    """
+    state = get_barrier_state(project_id, batch, task_seq, round_seq)
+    deadline = time.monotonic() + timeout
+    key = get_barrier_key(project_id, batch, task_seq, round_seq)
+    while not state['completed'] and time.monotonic() < deadline:
+        time.sleep(min(settings.BARRIER_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+        if cache.get(key) is not None or time.monotonic() >= deadline:
+            state = get_barrier_state(project_id, batch, task_seq, round_seq)
+    return state
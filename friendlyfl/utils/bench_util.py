@@ -0,0 +1,138 @@
+import math
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+    teardown_test_environment, override_settings
+from django.utils import timezone
+
+from friendlyfl.router.models import Site, Project, ProjectParticipant, Run
+from friendlyfl.utils import file_util
+
+
+@contextmanager
+def isolated_environment(verbosity=1, keepdb=False):
+    """
+    Run against a test database and a temporary artifacts folder, never the real ones.
+    Rate limits are lifted, they would measure the limits instead of the router.
+    """
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity, interactive=False, keepdb=keepdb)
+    artifacts_folder = file_util.base_folder
+    file_util.base_folder = tempfile.mkdtemp(prefix='friendlyfl-bench-')
+    unthrottled = override_settings(
+        THROTTLE_RATES={scope: (0, 0) for scope in settings.THROTTLE_RATES})
+    unthrottled.enable()
+    try:
+        yield
+    finally:
+        unthrottled.disable()
+        shutil.rmtree(file_util.base_folder, ignore_errors=True)
+        file_util.base_folder = artifacts_folder
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of the values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarize request latencies in seconds, throughput is computed over elapsed or the sum of latencies.
+    """
+    if not latencies:
+        return {'count': 0}
+    elapsed = elapsed or sum(latencies)
+    return {
+        'count': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else None,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+class LatencyRecorder:
+    """
+    Collect latencies of named operations, safe to share between threads.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, latency, ok=True):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(latency)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def time(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.record(name, time.perf_counter() - start,
+                    getattr(result, 'status_code', 200) < 400)
+        return result
+
+    def summary(self, elapsed=None):
+        result = {}
+        for name, latencies in self.latencies.items():
+            result[name] = summarize(latencies, elapsed)
+            result[name]['errors'] = self.errors.get(name, 0)
+        return result
+
+
+def gen_tasks(total_round=10):
+    return [{'seq': 1, 'model': 'benchmark', 'config': {'current_round': 1, 'total_round': total_round}}]
+
+
+def seed_federation(sites=20, projects=5, batches=400, prefix='bench'):
+    """
+    Bulk insert sites, projects with every site as participant and finished batches of runs,
+    the last batch of every project is left active. Returns the owner user, sites and projects.
+    """
+    now = timezone.now()
+    owner, _ = User.objects.get_or_create(username=f'{prefix}-owner')
+    site_list = Site.objects.bulk_create([
+        Site(name=f'{prefix}-site-{i}', description='', uid=uuid.uuid4(), owner=owner,
+             status=Site.SiteStatus.CONNECTED, created_at=now, updated_at=now)
+        for i in range(sites)])
+    project_list = []
+    for p in range(projects):
+        coordinator = site_list[p % len(site_list)]
+        project = Project.objects.create(site=coordinator, name=f'{prefix}-project-{p}', description='',
+                                         tasks=gen_tasks())
+        participants = ProjectParticipant.objects.bulk_create([
+            ProjectParticipant(site=site, project=project, notes='', created_at=now, updated_at=now,
+                               role=ProjectParticipant.Role.COORDINATOR if site == coordinator
+                               else ProjectParticipant.Role.PARTICIPANT)
+            for site in site_list])
+        runs = []
+        for batch in range(1, batches + 1):
+            run_status = Run.RunStatus.SUCCESS if batch < batches else Run.RunStatus.STANDBY
+            for pp in participants:
+                runs.append(Run(project=project, participant=pp, site_uid=pp.site.uid, role=pp.role,
+                                batch=batch, cur_seq=1, tasks=project.tasks, status=run_status,
+                                created_at=now, updated_at=now))
+        Run.objects.bulk_create(runs, batch_size=1000)
+        Project.objects.filter(id=project.id).update(batch=batches)
+        project.batch = batches
+        project_list.append(project)
+    return owner, site_list, project_list
@@ -4,7 +4,7 @@ def sort_runs(runs, site_uid=None):
     for run in runs:
         batch = run['batch']
         if site_uid:
-            if site_uid == run['site_uid']:
+            if site_uid == str(run['site_uid']):
                 if batch not in merged_runs:
                     merged_runs[batch] = run
                 else:
@@ -56,17 +56,6 @@ def pick_runs(run_list, role, participant_id):
     return dic
 
 
-def should_create_new_runs(data):
-    if len(data) == 0:
-        return True
-    run_map = sort_runs(data)
-    if run_map and run_map[-1]:
-        last_round = run_map[-1]
-        status = last_round['status']
-        return status == 'Success' or status == 'Failed'
-    return False
-
-
 def get_status_from_action(request_action):
     if request_action == 'stop':
         return 1
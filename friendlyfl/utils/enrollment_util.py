@@ -0,0 +1,94 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from friendlyfl.router.models import Site, ProjectParticipant
+from friendlyfl.router.serializers import SiteBulkSerializer
+
+
+def register_sites(items, owner):
+    """
+    Register the sites described by items, a list of dicts with name, description and uid.
+    Returns one result per item, in order: its status (created, exists, conflict or invalid), id and errors.
+    """
+    results = [{'index': i} for i in range(len(items))]
+    valid = {}
+    for result, item in zip(results, items):
+        serializer = SiteBulkSerializer(data=item)
+        if serializer.is_valid():
+            valid[result['index']] = serializer.validated_data
+        else:
+            result.update(status='invalid', errors=serializer.errors)
+
+    # names and uids already taken, by a registered site or an earlier item
+    names = [data['name'] for data in valid.values()]
+    uids = [data['uid'] for data in valid.values()]
+    existing = {}
+    for site_id, name, uid in Site.objects.filter(Q(name__in=names) | Q(uid__in=uids)).values_list('id', 'name', 'uid'):
+        existing[name] = existing[uid] = (site_id, name, uid)
+    taken = set()
+    to_create = {}
+    for index, data in valid.items():
+        result = results[index]
+        site = existing.get(data['name']) or existing.get(data['uid'])
+        if site and site[1:] == (data['name'], data['uid']):
+            result.update(status='exists', id=site[0])
+        elif site or data['name'] in taken or data['uid'] in taken:
+            result.update(status='conflict', errors={'non_field_errors': ['Name or uid already registered']})
+        else:
+            taken.update((data['name'], data['uid']))
+            to_create[index] = data
+
+    curr_time = timezone.now()
+    Site.objects.bulk_create([Site(
+        owner=owner,
+        status=Site.SiteStatus.CONNECTED,
+        created_at=curr_time,
+        updated_at=curr_time,
+        **data
+    ) for data in to_create.values()], ignore_conflicts=True)
+    # concurrent registrations may have taken a name or uid in between
+    created = {uid: (site_id, name) for site_id, name, uid in Site.objects.filter(
+        uid__in=[data['uid'] for data in to_create.values()]).values_list('id', 'name', 'uid')}
+    for index, data in to_create.items():
+        site = created.get(data['uid'])
+        if site and site[1] == data['name']:
+            results[index].update(status='created', id=site[0])
+        else:
+            results[index].update(status='conflict', errors={'non_field_errors': ['Name or uid already registered']})
+    return results
+
+
+def enroll_sites(project, site_ids, notes=''):
+    """
+    Enroll the sites as participants of the project.
+    Returns one result per site id, in order: its status (enrolled, exists or not_found) and participant id.
+    A site id given again is reported as existing, enrolled by its first occurrence.
+    """
+    found = set(Site.objects.filter(id__in=site_ids).values_list('id', flat=True))
+    enrolled = set(ProjectParticipant.objects.filter(
+        project=project, site_id__in=found).values_list('site_id', flat=True))
+    to_enroll = list(dict.fromkeys(
+        site_id for site_id in site_ids if site_id in found and site_id not in enrolled))
+
+    curr_time = timezone.now()
+    ProjectParticipant.objects.bulk_create([ProjectParticipant(
+        project=project,
+        site_id=site_id,
+        role=ProjectParticipant.Role.PARTICIPANT,
+        notes=notes,
+        created_at=curr_time,
+        updated_at=curr_time
+    ) for site_id in to_enroll], ignore_conflicts=True)
+    participants = dict(ProjectParticipant.objects.filter(
+        project=project, site_id__in=found).values_list('site_id', 'id'))
+
+    results = []
+    for index, site_id in enumerate(site_ids):
+        result = {'index': index, 'site': site_id}
+        if site_id not in found:
+            result['status'] = 'not_found'
+        else:
+            result.update(status='exists' if site_id in enrolled else 'enrolled', id=participants.get(site_id))
+            enrolled.add(site_id)
+        results.append(result)
+    return results
@@ -1,11 +1,11 @@
+import hashlib
 import os
 import pathlib
-import zipfile
-from io import BytesIO
+import tempfile
 
 base_folder = '/friendlyfl/artifacts'
 
-zip_prefix = '.zip'
+chunk_size = 1024 * 1024
 
 
 def generate_url(run_id, task_seq, round_seq):
@@ -18,30 +18,35 @@ def gen_zip_tmp_file(run):
     return generate_url(run.id, -1, -1)
 
 
-def zip_all_files(run, url_list, file_type):
+def archive_all_files(run, url_list, file_type, archive_format='zip', level=None, scope=None):
+    """
+    Build an archive of the files and return it opened for reading, the archive is cached if enabled,
+    otherwise it is built in the temporary folder of the run.
+    """
+    from django.conf import settings
+    from friendlyfl.utils import archive_util
+
+    if settings.ARCHIVE_CACHE_MAX_BYTES > 0 and url_list:
+        return archive_util.get_cached_archive(url_list, archive_format, level, scope)
+
     base_url = gen_zip_tmp_file(run)
     if base_url and url_list and len(url_list) > 0:
-        zip_temp_path = base_url + file_type + zip_prefix
-        path = pathlib.Path(zip_temp_path)
+        path = pathlib.Path(base_url)
 
         # Create the parent directory if it doesn't exist
-        path.parent.mkdir(parents=True, exist_ok=True)
-
-        # Create the file
-        path.touch()
-
-        zip_buffer = BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-            # Add each file to the zip archive
-            for file_path in url_list:
-                zip_file.write(file_path, os.path.basename(file_path))
-
-        # Seek to the beginning of the buffer
-        zip_buffer.seek(0)
-
-        # Read the content from the buffer and return it
-        return zip_buffer.read()
+        path.mkdir(parents=True, exist_ok=True)
+
+        suffix = archive_util.archive_formats[archive_format][0]
+        with tempfile.NamedTemporaryFile(dir=base_url, prefix=file_type, suffix=suffix, delete=False) as f:
+            try:
+                archive_util.build_archive(url_list, f, archive_format, level)
+            except Exception:
+                os.unlink(f.name)
+                raise
+        archive = open(f.name, 'rb')
+        # the archive is only read through the open handle, remove it from the folder right away
+        os.unlink(f.name)
+        return archive
     else:
         return None
 
@@ -72,3 +77,14 @@ def get_file_urls(runs, task_seq, round_seq, file_type) -> []:
 
 def gen_unique_file_name(file_name, run, cur_seq, cur_round):
     return '{}-{}-{}-{}'.format(run, cur_seq, cur_round, file_name)
+
+
+def get_file_checksum(file_path):
+    """
+    Compute the sha256 hex digest of a file, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from friendlyfl.router.models import Run, RunArchive, UploadJob
+from friendlyfl.router.serializers import run_value_fields, serialize_run_rows
+from friendlyfl.utils import file_util, usage_util
+
+finished_statuses = [Run.RunStatus.SUCCESS, Run.RunStatus.FAILED]
+
+pending_upload_statuses = [
+    UploadJob.JobStatus.STAGED, UploadJob.JobStatus.PROCESSING]
+
+# values stored as JSON in the archive, converted back when read
+encoders = {
+    'site_uid': str,
+    'created_at': datetime.isoformat,
+    'updated_at': datetime.isoformat,
+}
+
+decoders = {
+    'site_uid': uuid.UUID,
+    'created_at': datetime.fromisoformat,
+    'updated_at': datetime.fromisoformat,
+}
+
+
+def encode_row(row):
+    values = []
+    for name, value in zip(run_value_fields, row):
+        if value is not None and name in encoders:
+            value = encoders[name](value)
+        values.append(value)
+    return values
+
+
+def decode_row(fields, values):
+    values = dict(zip(fields, values))
+    row = []
+    for name in run_value_fields:
+        value = values.get(name)
+        if value is not None and name in decoders:
+            value = decoders[name](value)
+        row.append(value)
+    return row
+
+
+def find_finished_batches(updated_before, limit):
+    """
+    Return (project id, batch) of the batches whose runs all finished and were last updated before updated_before,
+    least recently updated first.
+    """
+    batches = Run.objects.values('project_id', 'batch').annotate(
+        unfinished=Count('id', filter=~Q(status__in=finished_statuses)),
+        last_updated=Max('updated_at'),
+    ).filter(unfinished=0, last_updated__lt=updated_before).order_by('last_updated')[:limit]
+    return [(batch['project_id'], batch['batch']) for batch in batches]
+
+
+def release_files(runs):
+    """
+    Release the storage usage of the files of the runs, one update per project and site, and delete their folders
+    once the transaction commits.
+    """
+    sites = {(run.project_id, run.site_uid) for run in runs}
+    for project_id, site_uid in sorted(sites, key=str):
+        usage_util.release_usage(project_id, site_uid, runs)
+    folders = [os.path.join(file_util.base_folder, str(run.id)) for run in runs]
+    transaction.on_commit(lambda: [shutil.rmtree(folder, ignore_errors=True) for folder in folders])
+
+
+def archive_batch(project_id, batch):
+    """
+    Move the runs of a finished batch to the run archive, and remove their files if not RUN_ARCHIVE_KEEP_FILES.
+    Returns False if the batch has unfinished runs or uploads still to be published.
+    """
+    runs = Run.objects.filter(project_id=project_id, batch=batch)
+    rows = list(runs.select_for_update().order_by(
+        'id').values_list(*run_value_fields))
+    status_index = run_value_fields.index('status')
+    if not rows or any(row[status_index] not in finished_statuses for row in rows):
+        return False
+    if UploadJob.objects.filter(run__in=runs, status__in=pending_upload_statuses).exists():
+        return False
+    created_index = run_value_fields.index('created_at')
+    updated_index = run_value_fields.index('updated_at')
+    RunArchive.objects.create(
+        project_id=project_id,
+        batch=batch,
+        fields=run_value_fields,
+        runs=[encode_row(row) for row in rows],
+        created_at=min(row[created_index] for row in rows),
+        updated_at=max(row[updated_index] for row in rows),
+    )
+    if not settings.RUN_ARCHIVE_KEEP_FILES:
+        release_files(list(runs))
+    runs.delete()
+    return True
+
+
+def archive_finished_batches(updated_before, chunk_size, limit):
+    """
+    Archive up to limit finished batches, chunk_size batches per transaction. Returns the number archived.
+    """
+    archived = 0
+    batches = find_finished_batches(updated_before, limit)
+    for i in range(0, len(batches), chunk_size):
+        with transaction.atomic():
+            for project_id, batch in batches[i:i + chunk_size]:
+                archived += archive_batch(project_id, batch)
+    return archived
+
+
+def get_archived_runs(project_id, batch=None):
+    """
+    Serialize the archived runs of a project, or of one of its batches, like the live ones.
+    """
+    archives = RunArchive.objects.filter(project_id=project_id)
+    if batch is not None:
+        archives = archives.filter(batch=batch)
+    rows = []
+    for fields, runs in archives.order_by('batch').values_list('fields', 'runs'):
+        rows += [decode_row(fields, values) for values in runs]
+    return serialize_run_rows(rows)
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.utils import timezone
+
+from friendlyfl.router.models import Project, ProjectParticipant, Run, BatchLaunch
+from friendlyfl.utils import participation_util
+
+finished_statuses = [Run.RunStatus.SUCCESS, Run.RunStatus.FAILED]
+
+# statuses of runs that do not go on unless restarted, a batch with only such runs no longer takes a slot
+ended_statuses = finished_statuses + [Run.RunStatus.PENDING_FAILED]
+
+
+def count_running_batches(project):
+    """
+    Number of batches of the project with runs going on.
+    """
+    return Run.objects.filter(project=project).exclude(
+        status__in=ended_statuses).values('batch').distinct().count()
+
+
+def has_free_slot(project):
+    return count_running_batches(project) < project.max_concurrent_batches
+
+
+def can_restart(project, batch):
+    """
+    Whether runs of the batch may be restarted: the batch still takes its slot, or there is a free one.
+    """
+    return Run.objects.filter(project=project, batch=batch).exclude(status__in=ended_statuses).exists() \
+        or has_free_slot(project)
+
+
+def launch_batch(project):
+    """
+    Start the next batch of the project, locked by the caller, with one run per participant taking part.
+    Returns the batch, or None and the reason it could not start.
+    """
+    pps = list(ProjectParticipant.objects.filter(
+        project=project).select_related('site'))
+    pps, reason = participation_util.select_participants(project, pps)
+    if reason:
+        return None, reason
+    if not pps:
+        return None, "Error while creating runs"
+    curr_time = timezone.now()
+    project.batch += 1
+    project.save()
+    Run.objects.bulk_create([Run(
+        project=project,
+        participant=pp,
+        site_uid=pp.site.uid,
+        role=pp.role,
+        status=Run.RunStatus.STANDBY,
+        tasks=project.tasks,
+        batch=project.batch,
+        cur_seq=1,
+        created_at=curr_time,
+        updated_at=curr_time
+    ) for pp in pps])
+    return project.batch, None
+
+
+def admit_queued_launches(project_id):
+    """
+    Start the queued launches of the project, oldest first, while it has free batch slots.
+    A launch that cannot start yet keeps its place in the queue with the reason. Returns the batches started.
+    """
+    batches = []
+    with transaction.atomic():
+        project = Project.objects.select_for_update().filter(id=project_id).first()
+        if not project:
+            return batches
+        launches = BatchLaunch.objects.select_for_update().filter(
+            project=project, status=BatchLaunch.LaunchStatus.QUEUED).order_by('id')
+        for launch in launches:
+            if not has_free_slot(project):
+                break
+            batch, reason = launch_batch(project)
+            if reason:
+                launch.reason = reason
+                launch.save()
+                break
+            launch.status = BatchLaunch.LaunchStatus.LAUNCHED
+            launch.batch = batch
+            launch.reason = ''
+            launch.save()
+            batches.append(batch)
+    return batches
+
+
+def admit_all_queued_launches():
+    """
+    Start the queued launches of every project that has some.
+    """
+    project_ids = BatchLaunch.objects.filter(
+        status=BatchLaunch.LaunchStatus.QUEUED).values_list('project_id', flat=True).distinct()
+    return {project_id: admit_queued_launches(project_id) for project_id in list(project_ids)}
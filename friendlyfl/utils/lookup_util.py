@@ -0,0 +1,93 @@
+from uuid import UUID
+
+from rest_framework.permissions import SAFE_METHODS
+
+from friendlyfl.router.models import Run
+
+# header and parameters of the requests naming the site making them, or the run they act on
+site_header = 'HTTP_X_SITE_UID'
+site_params = ['site_uid', 'uid']
+run_params = ['run']
+
+# site of the runs looked up, the site of a run never changes
+_run_sites = {}
+max_run_sites = 100000
+
+
+def split_param(value):
+    """
+    Items of a comma separated query param.
+    """
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def parse_id(key):
+    return int(key) if key.isdigit() else None
+
+
+def parse_uid(key):
+    try:
+        return str(UUID(key, version=4))
+    except ValueError:
+        return None
+
+
+def lookup_many(keys, queryset, field, serializer_class, key_name, item_name, parse=None):
+    """
+    Resolve the keys with one query on field and one serialization pass of the objects found.
+    Returns one result per key, in order: the key, its status (found, not_found or invalid) and the object found.
+    The first object found is returned for keys matching several.
+    """
+    values = [parse(key) if parse else key for key in keys]
+    objects = list(queryset.filter(**{field + '__in': {value for value in values if value is not None}}))
+    found = {}
+    for obj, data in zip(objects, serializer_class(objects, many=True).data):
+        found.setdefault(str(getattr(obj, field)), data)
+
+    results = []
+    for index, (key, value) in enumerate(zip(keys, values)):
+        result = {'index': index, key_name: key}
+        if value is None:
+            result['status'] = 'invalid'
+        elif str(value) in found:
+            result.update(status='found', **{item_name: found[str(value)]})
+        else:
+            result['status'] = 'not_found'
+        results.append(result)
+    return results
+
+
+def get_run_site_uid(run_id):
+    site_uid = _run_sites.get(run_id)
+    if site_uid is None:
+        site_uid = Run.objects.filter(id=run_id).values_list('site_uid', flat=True).first()
+        if site_uid is not None:
+            if len(_run_sites) >= max_run_sites:
+                _run_sites.clear()
+            _run_sites[run_id] = site_uid
+    return site_uid
+
+
+def get_site_uid(request, view, body=False):
+    """
+    Uid of the site making the request: the uid it sends, or the site of the run it acts on. None if not known.
+    The body of writes is only read with body, once parsed by the view: throttles decide before an upload is read.
+    """
+    header = request.META.get(site_header)
+    if header:
+        return parse_uid(header)
+    params = [request.query_params]
+    if body and request.method not in SAFE_METHODS and hasattr(request.data, 'get'):
+        params.append(request.data)
+    for values in params:
+        for name in site_params:
+            if values.get(name):
+                return parse_uid(str(values.get(name)))
+    run_ids = [values.get(name) for values in params for name in run_params]
+    queryset = getattr(view, 'queryset', None)
+    if queryset is not None and queryset.model is Run:
+        run_ids.append(view.kwargs.get('pk'))
+    for run_id in run_ids:
+        if run_id and str(run_id).isdigit():
+            return get_run_site_uid(int(run_id))
+    return None
@@ -0,0 +1,63 @@
+import json
+from hashlib import sha256
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from friendlyfl.router.models import Run, RunFile
+
+
+def get_download_runs(run, all_runs):
+    """
+    Runs whose files a download of the run covers, all the runs of the batch for a coordinator asking for all_runs.
+    """
+    if run.role == 'CO' and all_runs == '1':
+        return list(Run.objects.filter(project_id=run.project_id, batch=run.batch))
+    return [run]
+
+
+def get_run_files(runs, task_seq, round_seq, file_type):
+    """
+    Published files of the type of the runs, only of the task and round if both are given.
+    """
+    queryset = RunFile.objects.filter(run__in=runs, file_type=file_type)
+    if task_seq and round_seq:
+        queryset = queryset.filter(task_seq=task_seq, round_seq=round_seq)
+    return queryset
+
+
+def get_etag(content):
+    return quote_etag(sha256(json.dumps(content).encode()).hexdigest())
+
+
+def get_manifest_etag(files):
+    return get_etag([[f['id'], f['checksum']] for f in files])
+
+
+def get_archive_etag(file_paths, archive_format, level):
+    """
+    Strong ETag of the archive of the files, from the checksums of their content.
+    None if a file has no checksum, as for files uploaded before checksums were recorded.
+    """
+    checksums = dict(RunFile.objects.filter(
+        path__in=file_paths).values_list('path', 'checksum'))
+    if any(file_path not in checksums for file_path in file_paths):
+        return None
+    return get_etag({'files': [[file_path, checksums[file_path]] for file_path in file_paths],
+                     'archive': archive_format, 'level': level})
+
+
+def get_file_etag(run_file):
+    return quote_etag(run_file.checksum)
+
+
+def not_modified(request, etag):
+    """
+    Return the 304 response when the controller already holds the content of the etag, None otherwise.
+    """
+    if not etag:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
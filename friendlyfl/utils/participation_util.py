@@ -0,0 +1,90 @@
+import math
+
+from django.utils import timezone
+
+from friendlyfl.router.models import Site, ProjectParticipant, Run
+from friendlyfl.utils import telemetry_util
+
+
+def has_quorum(project):
+    """
+    Whether batches of the project may start, and go on, without some of its participants.
+    """
+    return project.min_participants is not None or project.min_participant_fraction is not None
+
+
+def get_quorum(project, participant_count):
+    """
+    Number of connected participants needed to start a batch of the project.
+    """
+    if not has_quorum(project):
+        return participant_count
+    quorum = max(project.min_participants or 0,
+                 math.ceil((project.min_participant_fraction or 0) * participant_count))
+    return min(max(quorum, 1), participant_count)
+
+
+def select_participants(project, pps):
+    """
+    Return the participants to start a batch of the project with, and the reason not to start it if there is one.
+    The coordinator and the required participants must be connected, and at least as many as the quorum.
+    Overloaded sites are left out of batches that reach the quorum without them.
+    """
+    connected = [pp for pp in pps if pp.site.status == Site.SiteStatus.CONNECTED]
+    if not has_quorum(project):
+        if len(connected) < len(pps):
+            return connected, "Not all sites are connected"
+        return connected, None
+    missing = [pp.site.name for pp in pps if pp.site.status != Site.SiteStatus.CONNECTED
+               and (pp.required or pp.role == ProjectParticipant.Role.COORDINATOR)]
+    if missing:
+        return connected, "Required sites {} are not connected".format(', '.join(missing))
+    quorum = get_quorum(project, len(pps))
+    if len(connected) < quorum:
+        return connected, "{} of the {} sites needed are connected".format(len(connected), quorum)
+    return prefer_available(connected, quorum), None
+
+
+def is_overloaded(pp):
+    return telemetry_util.summarize(pp.site.telemetry)['overloaded']
+
+
+def prefer_available(pps, quorum):
+    """
+    Keep the coordinator, the required participants and the sites that are not overloaded,
+    then the least loaded of the overloaded sites up to the quorum.
+    """
+    summaries = {pp.id: telemetry_util.summarize(pp.site.telemetry) for pp in pps}
+    kept = {pp.id for pp in pps if pp.required or pp.role == ProjectParticipant.Role.COORDINATOR
+            or not summaries[pp.id]['overloaded']}
+    selected = [pp for pp in pps if pp.id in kept]
+    overloaded = sorted((pp for pp in pps if pp.id not in kept),
+                        key=lambda pp: telemetry_util.get_load(summaries[pp.id]))
+    return selected + overloaded[:max(quorum - len(selected), 0)]
+
+
+def attach_late_joiners(run):
+    """
+    Add runs to the batch of run for the connected participants without one, they take part from its current round.
+    Overloaded sites are not added. Called at round boundaries, when the runs of the batch are back to standby.
+    Returns the runs added, without the artifacts of the batch so far.
+    """
+    project = run.project
+    if not has_quorum(project):
+        return []
+    pps = [pp for pp in ProjectParticipant.objects.filter(
+        project_id=run.project_id, site__status=Site.SiteStatus.CONNECTED).exclude(
+        run__batch=run.batch).select_related('site') if not is_overloaded(pp)]
+    curr_time = timezone.now()
+    return Run.objects.bulk_create([Run(
+        project=project,
+        participant=pp,
+        site_uid=pp.site.uid,
+        role=pp.role,
+        status=Run.RunStatus.STANDBY,
+        tasks=run.tasks,
+        batch=run.batch,
+        cur_seq=run.cur_seq,
+        created_at=curr_time,
+        updated_at=curr_time
+    ) for pp in pps])
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from friendlyfl.router.models import Project, Run, Site, RoundDuration
+from friendlyfl.utils import barrier_util, launch_util
+
+# statuses a run can be stopped from, see Run.to_stop
+active_statuses = [Run.RunStatus.PREPARING, Run.RunStatus.RUNNING]
+stoppable_statuses = [Run.RunStatus.STANDBY] + active_statuses
+
+
+def round_start_changes(status):
+    """
+    Changes to the round start of runs bulk updated to status: cleared on standby, kept or set when they start.
+    """
+    if status == Run.RunStatus.STANDBY:
+        return {'round_started_at': None}
+    if status in active_statuses:
+        return {'round_started_at': Coalesce(F('round_started_at'), timezone.now())}
+    return {}
+
+
+def get_round_timeout(run):
+    """
+    Seconds the current round of the run may take, `round_timeout` in the config of its task or RUN_ROUND_TIMEOUT.
+    None if the round has no deadline.
+    """
+    try:
+        timeout = run.tasks[run.cur_seq - 1]['config'].get('round_timeout')
+    except (IndexError, KeyError, TypeError, AttributeError):
+        timeout = None
+    if timeout is None:
+        timeout = settings.RUN_ROUND_TIMEOUT
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        return None
+    return timeout if timeout > 0 else None
+
+
+def find_timed_out_runs(now):
+    """
+    Runs preparing or running past the deadline of their round.
+    """
+    runs = Run.objects.filter(status__in=active_statuses).only(
+        'id', 'project_id', 'site_uid', 'batch', 'cur_seq', 'tasks', 'round_started_at', 'updated_at')
+    timed_out = []
+    for run in runs.iterator():
+        timeout = get_round_timeout(run)
+        started_at = run.round_started_at or run.updated_at
+        if timeout and started_at + timedelta(seconds=timeout) < now:
+            timed_out.append(run)
+    return timed_out
+
+
+def find_disconnected_runs(now):
+    """
+    Unfinished runs of sites disconnected for longer than RUN_DISCONNECTED_GRACE_SECONDS.
+    """
+    disconnected_before = now - timedelta(seconds=settings.RUN_DISCONNECTED_GRACE_SECONDS)
+    site_uids = Site.objects.filter(
+        status=Site.SiteStatus.DISCONNECTED, updated_at__lt=disconnected_before).values('uid')
+    return list(Run.objects.filter(status__in=stoppable_statuses, site_uid__in=site_uids).only(
+        'id', 'project_id', 'site_uid', 'batch', 'cur_seq', 'tasks', 'round_started_at'))
+
+
+def stop_runs(runs, outcome, now):
+    """
+    Move the runs to pending failed in one update and record their rounds with outcome.
+    Runs that changed status in the meantime are left alone. Batches ended this way free their slot at once.
+    """
+    with transaction.atomic():
+        # projects first, in id order, as the views lock them before their runs and the barriers need them locked
+        list(Project.objects.select_for_update().filter(
+            id__in={run.project_id for run in runs}).order_by('id').values_list('id', flat=True))
+        ids = list(Run.objects.select_for_update().filter(
+            id__in=[run.id for run in runs], status__in=stoppable_statuses).values_list('id', flat=True))
+        stopped = set(ids)
+        runs = [run for run in runs if run.id in stopped]
+        Run.objects.filter(id__in=ids).update(status=Run.RunStatus.PENDING_FAILED, updated_at=now)
+        RoundDuration.record(runs, outcome, now)
+        # the rest of their batches no longer wait for them
+        for run in {(run.project_id, run.batch): run for run in runs}.values():
+            barrier_util.update_barrier(run)
+    for project_id in {run.project_id for run in runs}:
+        launch_util.admit_queued_launches(project_id)
+    return len(ids)
+
+
+def sweep_stragglers(now=None):
+    """
+    Stop the runs past the deadline of their round and the runs of disconnected sites.
+    Returns the number of runs stopped for each reason.
+    """
+    now = now or timezone.now()
+    timed_out = find_timed_out_runs(now)
+    timed_out_ids = {run.id for run in timed_out}
+    disconnected = [run for run in find_disconnected_runs(now)
+                    if run.id not in timed_out_ids]
+    return {
+        'timed_out': stop_runs(timed_out, RoundDuration.Outcome.TIMED_OUT, now),
+        'disconnected': stop_runs(disconnected, RoundDuration.Outcome.DISCONNECTED, now),
+    }
+
+
+def summarize_round_durations(queryset):
+    """
+    Number of rounds, average, min and max seconds per site, and how many of its rounds timed out or failed.
+    """
+    rows = queryset.values('site_uid').annotate(
+        rounds=Count('id'),
+        avg_seconds=Avg('seconds'),
+        min_seconds=Min('seconds'),
+        max_seconds=Max('seconds'),
+        timed_out=Count('id', filter=Q(outcome=RoundDuration.Outcome.TIMED_OUT)),
+        disconnected=Count('id', filter=Q(outcome=RoundDuration.Outcome.DISCONNECTED)),
+        failed=Count('id', filter=Q(outcome=RoundDuration.Outcome.FAILED)),
+    ).order_by('-avg_seconds')
+    return list(rows)
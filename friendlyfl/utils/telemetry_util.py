@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.utils import timezone
+
+from friendlyfl.router.models import Site
+
+# reported by controllers with their heartbeats, cpu and memory as the used fraction, queue as the number of tasks
+# waiting to run and throughput as the samples processed per second. Samples are stored as compact lists:
+# [timestamp, cpu, memory, queue, throughput]
+telemetry_fields = ['cpu', 'memory', 'queue', 'throughput']
+
+fraction_fields = ['cpu', 'memory']
+
+
+def parse_telemetry(telemetry):
+    """
+    Return the sample of a heartbeat's telemetry, and the error if it is invalid. Fields not reported are None.
+    """
+    if not isinstance(telemetry, dict):
+        return None, "telemetry must be an object"
+    sample = [int(timezone.now().timestamp())]
+    for field in telemetry_fields:
+        value = telemetry.get(field, None)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                return None, "telemetry {} must be a non negative number".format(field)
+            if field in fraction_fields and value > 1:
+                return None, "telemetry {} must be a fraction between 0 and 1".format(field)
+        sample.append(value)
+    return sample, None
+
+
+def append_sample(site, sample):
+    """
+    Add the sample to the window of the site, dropping the oldest beyond SITE_TELEMETRY_WINDOW.
+    """
+    site.telemetry = (list(site.telemetry or []) + [sample])[-settings.SITE_TELEMETRY_WINDOW:]
+
+
+def summarize(telemetry, now=None):
+    """
+    Average every field over the samples of the window younger than SITE_TELEMETRY_MAX_AGE seconds.
+    """
+    now = now or int(timezone.now().timestamp())
+    samples = [sample for sample in telemetry or []
+               if now - sample[0] <= settings.SITE_TELEMETRY_MAX_AGE]
+    summary = {'samples': len(samples)}
+    for i, field in enumerate(telemetry_fields, start=1):
+        values = [sample[i] for sample in samples if sample[i] is not None]
+        summary[field] = sum(values) / len(values) if values else None
+    summary['overloaded'] = is_overloaded(summary)
+    return summary
+
+
+def is_overloaded(summary):
+    """
+    Whether the averages of a site cross a SITE_OVERLOAD_* threshold, sites without telemetry never are.
+    """
+    thresholds = {
+        'cpu': settings.SITE_OVERLOAD_CPU,
+        'memory': settings.SITE_OVERLOAD_MEMORY,
+        'queue': settings.SITE_OVERLOAD_QUEUE,
+    }
+    return any(threshold > 0 and summary[field] is not None and summary[field] >= threshold
+               for field, threshold in thresholds.items())
+
+
+def get_load(summary):
+    """
+    Sort key of sites from the least to the most loaded, sites without telemetry count as idle.
+    """
+    return (summary['overloaded'], summary['queue'] or 0, summary['cpu'] or 0, summary['memory'] or 0)
+
+
+def get_fleet_capacity():
+    """
+    Capacity of every site from its telemetry, and totals of the connected sites.
+    """
+    now = int(timezone.now().timestamp())
+    sites = []
+    connected = []
+    for site_id, name, uid, site_status, telemetry in Site.objects.values_list(
+            'id', 'name', 'uid', 'status', 'telemetry'):
+        site = dict(summarize(telemetry, now), id=site_id, name=name, uid=uid,
+                    status=Site.SiteStatus(site_status).label)
+        sites.append(site)
+        if site_status == Site.SiteStatus.CONNECTED:
+            connected.append(site)
+    available = [site for site in connected if not site['overloaded']]
+    return {
+        'sites': sites,
+        'connected': len(connected),
+        'overloaded': len(connected) - len(available),
+        'available': len(available),
+        'throughput': sum(site['throughput'] or 0 for site in connected),
+        'available_throughput': sum(site['throughput'] or 0 for site in available),
+    }
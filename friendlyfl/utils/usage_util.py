@@ -0,0 +1,52 @@
+from django.db.models import F, Sum, Count
+from django.utils import timezone
+
+from friendlyfl.router.models import StorageUsage
+
+usage_group_fields = ['project', 'site_uid', 'run', 'batch',
+                      'file_type', 'task_seq', 'round_seq']
+
+
+def record_usage(run, file_type, task_seq, round_seq, size, files=1):
+    """
+    Add the size of the written file(s) to the usage record of the run, file type, task and round.
+    """
+    usage, _ = StorageUsage.objects.get_or_create(
+        run=run, file_type=file_type, task_seq=task_seq, round_seq=round_seq,
+        defaults={'project_id': run.project_id, 'site_uid': run.site_uid, 'batch': run.batch})
+    StorageUsage.objects.filter(id=usage.id).update(
+        files=F('files') + files, bytes=F('bytes') + size, updated_at=timezone.now())
+
+
+def release_usage(project_id, site_uid, runs):
+    """
+    Release the usage records of the runs of a site in a project, whose files are all deleted, in one update.
+    """
+    StorageUsage.objects.filter(project_id=project_id, site_uid=site_uid, run__in=runs).update(
+        files=0, bytes=0, updated_at=timezone.now())
+
+
+def get_project_usage(project_id):
+    total = StorageUsage.objects.filter(
+        project_id=project_id).aggregate(total=Sum('bytes'))['total']
+    return total or 0
+
+
+def exceeds_quota(project, incoming_size):
+    """
+    Check if writing incoming_size more bytes would exceed the storage quota of the project.
+    """
+    if project.storage_quota is None:
+        return False
+    return get_project_usage(project.id) + incoming_size > project.storage_quota
+
+
+def summarize_usage(queryset, group_by):
+    """
+    Aggregate usage records by the given fields, the total of all records is returned if no field given.
+    """
+    fields = [field for field in group_by if field in usage_group_fields]
+    if not fields:
+        return [queryset.aggregate(files=Sum('files'), bytes=Sum('bytes'), records=Count('id'))]
+    return list(queryset.values(*fields).annotate(
+        files=Sum('files'), bytes=Sum('bytes'), records=Count('id')).order_by(*fields))